@@ -2,12 +2,17 @@ from __future__ import annotations
 import os
 import logging
 import configparser
+import time
 
 import ts3.TS3Connection
 from ts3.TS3Connection import TS3QueryException, TS3Connection
+from ts3.TS3ConnectionPool import TS3ConnectionPool
+from ts3.ServerState import ServerState
+from ts3.metrics import MetricsServer
 from ts3.TS3QueryExceptionType import TS3QueryExceptionType
 import EventHandler
 import CommandHandler
+from ClientInfo import ClientInfoCache
 import Moduleloader
 
 
@@ -90,6 +95,8 @@ class Ts3Bot:
     """
     Teamspeak 3 Bot with module support.
     """
+    # Tries to load the server state on setup, sleeping 1s, 2s, ... between them
+    SERVER_STATE_ATTEMPTS = 3
 
     def get_channel_id(self, name):
         """
@@ -142,13 +149,9 @@ class Ts3Bot:
         :return:
         """
         try:
-            self.ts3conn = ts3.TS3Connection.TS3Connection(self.host, self.port,
-                                                           use_ssh=self.is_ssh, username=self.user,
-                                                           password=self.password, accept_all_keys=self.accept_all_keys,
-                                                           host_key_file=self.host_key_file,
-                                                           use_system_hosts=self.use_system_hosts,
-                                                           sshtimeout=self.sshtimeout,
-                                                           sshtimeoutlimit=self.sshtimeoutlimit)
+            self.ts3conn = self.open_connection()
+            if self.capture_file:
+                self.ts3conn.start_recording(self.capture_file)
             # self.ts3conn.login(self.user, self.password)
         except ts3.TS3Connection.TS3QueryException:
             self.logger.exception("Error while connecting, IP propably not whitelisted or Login data wrong!")
@@ -156,6 +159,42 @@ class Ts3Bot:
             os._exit(-1)
             raise
 
+    def open_connection(self):
+        """
+        Open a new logged in query session to the server specified by self.host and self.port.
+        :rtype: TS3Connection
+        """
+        return ts3.TS3Connection.TS3Connection(self.host, self.port,
+                                               use_ssh=self.is_ssh, username=self.user,
+                                               password=self.password, accept_all_keys=self.accept_all_keys,
+                                               host_key_file=self.host_key_file,
+                                               use_system_hosts=self.use_system_hosts,
+                                               sshtimeout=self.sshtimeout,
+                                               sshtimeoutlimit=self.sshtimeoutlimit,
+                                               query_rate=self.query_rate,
+                                               query_burst=self.query_burst)
+
+    def open_query_sessions(self):
+        """
+        Open the additional query sessions configured by QuerySessions and route the queries of
+        self.ts3conn through them. The first connection keeps receiving the events.
+        """
+        sessions = []
+        for i in range(self.query_sessions):
+            try:
+                session = self.open_connection()
+                session.use(sid=self.sid)
+                try:
+                    session.clientupdate(["client_nickname=" + self.bot_name + " " + str(i + 1)])
+                except TS3QueryException as e:
+                    if e.type != TS3QueryExceptionType.CLIENT_NICKNAME_INUSE:
+                        raise e
+                sessions.append(session)
+            except TS3QueryException:
+                self.logger.exception("Error opening additional query session")
+        self.logger.info("Opened %d additional query sessions", len(sessions))
+        self.ts3conn = TS3ConnectionPool(self.ts3conn, sessions)
+
     def setup_bot(self):
         """
         Setup routine for new bot. Does the following things:
@@ -163,6 +202,7 @@ class Ts3Bot:
             2. Set bot nickname to the Name specified by self.bot_name
             3. Move the bot to the channel specified by self.default_channel
             4. Register command and event handlers
+            5. Load the mirrored server state
         :return:
         """
         try:
@@ -180,7 +220,7 @@ class Ts3Bot:
                     raise e
             try:
                 self.channel = self.get_channel_id(self.default_channel)
-                self.ts3conn.clientmove(self.channel, int(self.ts3conn.whoami()["client_id"]))
+                self.ts3conn.clientmove(self.channel, self.ts3conn.identity.client_id)
             except TS3QueryException as e:
                 if e.type == TS3QueryExceptionType.CHANNEL_ALREADY_IN:
                     self.logger.info("The bot is already in the configured default channel")
@@ -190,15 +230,110 @@ class Ts3Bot:
             self.logger.exception("Error on setting up client")
             self.ts3conn.quit()
             return
-        self.command_handler = CommandHandler.CommandHandler(self.ts3conn)
+        self.ts3conn.on_reconnect(self.rejoin_default_channel)
+        if self.query_sessions > 0:
+            self.open_query_sessions()
+        self.server_state = ServerState(self.ts3conn)
+        self.client_infos = ClientInfoCache(self.ts3conn, self.server_state)
+        self.command_handler = CommandHandler.CommandHandler(self.ts3conn, client_infos=self.client_infos)
         self.event_handler = EventHandler.EventHandler(ts3conn=self.ts3conn, command_handler=self.command_handler)
         try:
-            self.ts3conn.register_for_server_events(self.event_handler.on_event)
-            self.ts3conn.register_for_channel_events(0, self.event_handler.on_event)
-            self.ts3conn.register_for_private_messages(self.event_handler.on_event)
+            self.ts3conn.register_for_server_events()
+            self.ts3conn.register_for_channel_events(0)
+            self.ts3conn.register_for_private_messages()
+            # Events reach the EventHandler directly instead of through blinker
+            self.ts3conn.add_event_sink(self.event_handler.handle_event)
+            self.ts3conn.add_event_sink(self.server_state.handle_event)
+            self.ts3conn.add_event_sink(self.client_infos.handle_event)
+            self.ts3conn.add_command_sink(self.client_infos.on_command)
+            # Reload the mirror if the event queue overflows
+            self.ts3conn.add_drop_sink(self.server_state.on_dropped_event)
+            self.ts3conn.add_drop_sink(self.client_infos.on_dropped_event)
         except ts3.TS3Connection.TS3QueryException:
             self.logger.exception("Error on registering for events.")
             exit()
+        for attempt in range(1, self.SERVER_STATE_ATTEMPTS + 1):
+            try:
+                self.server_state.start()
+                break
+            except ts3.TS3Connection.TS3QueryException:
+                self.logger.exception("Error loading the server state (attempt %d of %d)", attempt,
+                                      self.SERVER_STATE_ATTEMPTS)
+                if attempt < self.SERVER_STATE_ATTEMPTS:
+                    time.sleep(attempt)
+        # Otherwise ServerState.current loads it on first use and the periodic reload keeps trying
+
+    def start_metrics_server(self):
+        """
+        Serve the metrics of the bot on http://127.0.0.1:<self.metrics_port>/metrics.
+        """
+        try:
+            self.metrics_server = MetricsServer(self.collect_metrics, port=self.metrics_port)
+            self.metrics_server.start()
+        except OSError:
+            self.logger.exception("Error starting the metrics server")
+            self.metrics_server = None
+
+    def collect_metrics(self):
+        """
+        Collect the metrics of the query sessions and the event handler, see ts3.metrics.render.
+        :rtype: list
+        """
+        if isinstance(self.ts3conn, TS3ConnectionPool):
+            connections = self.ts3conn.connections
+        else:
+            connections = [self.ts3conn]
+        families = []
+        for session, conn in enumerate(connections):
+            labels = {"session": str(session)}
+            families += conn.metrics.families(**labels)
+            families += [
+                ("ts3_keepalive_round_trip_seconds", "histogram", "Round trip times of the liveness probes.",
+                 [(labels, conn.rtt)]),
+                ("ts3_query_queue_depth", "gauge", "Queries waiting to be written.",
+                 [(labels, conn.query_queue_depth)]),
+                ("ts3_query_outstanding", "gauge", "Queries waiting to be written or for their response.",
+                 [(labels, conn.outstanding)]),
+                ("ts3_event_dispatch_seconds", "histogram", "Seconds events waited for an event thread.",
+                 [(labels, conn.event_dispatcher.latency)]),
+                ("ts3_events_dropped_total", "counter", "Events dropped because the event queue was full.",
+                 [(labels, conn.event_dispatcher.dropped)]),
+            ]
+        # Shared by all sessions of a pool
+        cache = connections[0].query_cache
+        families += [
+            ("ts3_query_cache_hits_total", "counter", "Queries answered from the query cache.",
+             [({"command": command}, stats["hits"]) for command, stats in cache.stats().items()]),
+            ("ts3_query_cache_misses_total", "counter", "Cacheable queries sent to the server.",
+             [({"command": command}, stats["misses"]) for command, stats in cache.stats().items()]),
+        ]
+        if self.client_infos is not None:
+            families += [
+                ("ts3bot_client_info_hits_total", "counter", "Senders looked up without a query.",
+                 [({}, self.client_infos.hits)]),
+                ("ts3bot_client_info_misses_total", "counter", "Senders whose ClientInfo was built.",
+                 [({}, self.client_infos.misses)]),
+            ]
+        if self.event_handler is not None:
+            families.append(("ts3bot_observer_seconds", "histogram", "Run times of the event observers.",
+                             [({"observer": name}, histogram)
+                              for name, histogram in sorted(self.event_handler.latencies.items())]))
+            families.append(("ts3bot_observer_events_dropped_total", "counter",
+                             "Events dropped because the queue of an observer thread was full.",
+                             [({}, self.event_handler.dropped)]))
+        return families
+
+    def rejoin_default_channel(self, ts3conn):
+        """
+        Move the bot back to its default channel after the connection was re-established.
+        :param ts3conn: Reconnected TS3Connection.
+        :type ts3conn: TS3Connection
+        """
+        try:
+            ts3conn.clientmove(self.channel, ts3conn.identity.client_id)
+        except TS3QueryException as e:
+            if e.type != TS3QueryExceptionType.CHANNEL_ALREADY_IN:
+                self.logger.exception("Error moving the bot back to its channel after reconnecting")
 
     def __del__(self):
         if self.ts3conn is not None:
@@ -206,7 +341,8 @@ class Ts3Bot:
 
     def __init__(self, host, port, serverid, user, password, defaultchannel, botname, logger, plugins, ssh="False",
                  acceptallsshkeys="False", sshhostkeyfile=None, sshloadsystemhostkeys="False", sshtimeout=None,
-                 sshtimeoutlimit=3, *_, **__):
+                 sshtimeoutlimit=3, queryrate="0", queryburst="10", querysessions="0", livenessdeadline="30",
+                 capturefile="", metricsport="0", *_, **__):
         """
         Create a new Ts3Bot.
         :param host: Host to connect to, can be a IP or a host name
@@ -217,6 +353,13 @@ class Ts3Bot:
         :param default_channel: Channel to move the bot to
         :param bot_name: Nickname of the bot
         :param logger: Logger to use throughout the bot
+        :param queryrate: Maximum queries per second, 0 to only slow down once the server reports
+                          flooding
+        :param queryburst: Queries that can be sent at once after an idle period
+        :param querysessions: Additional query sessions to spread the queries over
+        :param livenessdeadline: Seconds without response after which the connection is re-established
+        :param capturefile: File to record the query traffic to for replaying it offline, empty to not record
+        :param metricsport: Local port to serve metrics in the Prometheus text format on, 0 to not serve them
         """
         self.host = host
         self.port = port
@@ -227,9 +370,13 @@ class Ts3Bot:
         self.bot_name = botname
         self.event_handler = None
         self.command_handler = None
+        # Mirror of clients, channels and server groups, see ts3.ServerState
+        self.server_state: ServerState | None = None
+        # ClientInfo of the clients in the mirror, see ClientInfo.ClientInfoCache
+        self.client_infos: ClientInfoCache | None = None
         self.channel = None
         self.logger = logger
-        self.ts3conn: TS3Connection | None = None
+        self.ts3conn: TS3Connection | TS3ConnectionPool | None = None
         self.is_ssh = bool(strtobool(ssh))
         # Strtobool returns 1/0 ...
         self.accept_all_keys = bool(strtobool(acceptallsshkeys))
@@ -237,9 +384,18 @@ class Ts3Bot:
         self.use_system_hosts = bool(strtobool(sshloadsystemhostkeys))
         self.sshtimeout = sshtimeout
         self.sshtimeoutlimit = sshtimeoutlimit
+        self.query_rate = float(queryrate)
+        self.query_burst = int(queryburst)
+        self.query_sessions = int(querysessions)
+        self.liveness_deadline = float(livenessdeadline)
+        self.capture_file = capturefile
+        self.metrics_port = int(metricsport)
+        self.metrics_server = None
 
         self.connect()
         self.setup_bot()
         # Load modules
         Moduleloader.load_modules(self, plugins)
-        self.ts3conn.start_keepalive_loop()
+        if self.metrics_port:
+            self.start_metrics_server()
+        self.ts3conn.start_keepalive_loop(deadline=self.liveness_deadline)
@@ -1,29 +1,64 @@
 import re
 import logging
+import threading
+
+import ts3.Events as Events
+from ts3.utilities import TS3Exception
 
 logger = logging.getLogger("bot")
 
 
+def servergroup_names_of(servergroups):
+    """
+    Map server group ids to names.
+    :param servergroups: Server groups as returned by servergrouplist.
+    :type servergroups: Iterable[Mapping[str, str]]
+    :rtype: dict[str, str]
+    """
+    return {g.get('sgid'): g.get('name') for g in servergroups}
+
+
 class ClientInfo:
     """
     ClientInfo contains various attributes of the client with the given client id
     The attributes in this object have been filtered, if you want to know about all
     possible attributes, use print(client_data[0].keys())
     """
-    def __init__(self, client_id, ts3conn):
-        if client_id == "-1":
-            logger.error("Trying to get ClientInfo of clid=-1")
-            logger.warning("Giving out mock object ...")
-            client_data = [{}]
-        else:
-            client_data = ts3conn.clientinfo(client_id)
+    # Attributes only sent by clientinfo -> property, queried on first access if missing in client_data.
+    # clientlist records lack the first four, enter events also the rest.
+    QUERIED_ATTRIBUTES = {"created": "client_created", "total_connections": "client_totalconnections",
+                          "last_connection": "client_lastconnected", "connected_time": "connection_connected_time",
+                          "platform": "client_platform", "version": "client_version", "ip": "connection_client_ip"}
+
+    def __init__(self, client_id, ts3conn, client_data=None, servergroup_names=None):
+        """
+        Create a new ClientInfo.
+        :param client_id: Client id of the client.
+        :param ts3conn: Connection to query missing data with.
+        :param client_data: Properties of the client, e.g. a clientlist record. Queried with
+                            clientinfo if not given.
+        :param servergroup_names: Server group id -> name. Queried with servergrouplist if not given.
+        :type client_data: Mapping[str, str] | None
+        :type servergroup_names: dict[str, str] | None
+        """
+        self._client_id = client_id
+        self._ts3conn = ts3conn
+        # Whether client_data has all attributes, else QUERIED_ATTRIBUTES are queried when needed
+        complete = client_data is None
+        if client_data is None:
+            if client_id == "-1":
+                logger.error("Trying to get ClientInfo of clid=-1")
+                logger.warning("Giving out mock object ...")
+                client_data = {}
+            else:
+                client_data = ts3conn.clientinfo(client_id)
         self._name = client_data.get('client_nickname', '')
         self._unique_id = client_data.get('client_unique_identifier', '')
         self._database_id = client_data.get('client_database_id', '')
         # servergroups is a list of strings
-        sgs = {}
-        for g in ts3conn.servergrouplist():
-            sgs[g.get('sgid')] = g.get('name')
+        if servergroup_names is None:
+            servergroup_names = servergroup_names_of(ts3conn.servergrouplist())
+        sgs = servergroup_names
         servergroups_list = client_data.get('client_servergroups', '').split(',')
         self._servergroups = []
         for g in servergroups_list:
@@ -32,13 +67,10 @@ class ClientInfo:
                 self._servergroups.append(n)
         self._description = client_data.get('client_description', '')
         self._country = client_data.get('client_country', '')
-        self._created = client_data.get('client_created', '')
-        self._total_connections = client_data.get('client_totalconnections', '')
-        self._last_connection = client_data.get('client_lastconnected', '')
-        self._connected_time = client_data.get('connection_connected_time', '')
-        self._platform = client_data.get('client_platform', '')
-        self._version = client_data.get('client_version', '')
-        self._ip = client_data.get('connection_client_ip', '')
+        fields = self.__dict__
+        for field, key in _QUERIED_FIELDS:
+            if complete or key in client_data:
+                fields[field] = client_data.get(key, '')
         self._away = client_data.get('client_away', '')
         self._input_muted = client_data.get('client_input_muted', '')
         self._output_muted = client_data.get('client_output_muted', '')
@@ -55,8 +87,20 @@ class ClientInfo:
     def channel_id(self):
         return self._channel_id
 
+    def _query_missing(self):
+        """
+        Set the QUERIED_ATTRIBUTES missing in the client data from clientinfo.
+        """
+        client_data = self._ts3conn.clientinfo(self._client_id)
+        fields = self.__dict__
+        for field, key in _QUERIED_FIELDS:
+            if field not in fields:
+                fields[field] = client_data.get(key, '')
+
     @property
     def ip(self):
+        if "_ip" not in self.__dict__:
+            self._query_missing()
         return self._ip
 
     @property
@@ -74,4 +118,162 @@ class ClientInfo:
         return False
 
     def __getattr__(self, item):
+        if item in self.QUERIED_ATTRIBUTES and "_" + item not in self.__dict__:
+            self._query_missing()
         return self.__getattribute__("_"+item)
+
+
+# (instance attribute, clientinfo property) of ClientInfo.QUERIED_ATTRIBUTES
+_QUERIED_FIELDS = tuple(("_" + attribute, key) for attribute, key in ClientInfo.QUERIED_ATTRIBUTES.items())
+
+
+class ClientInfoCache:
+    """
+    ClientInfo per client id, built from the records of the mirrored server state, so looking up
+    a known client costs no query. An entry is rebuilt when the record of its client or the server
+    groups changed in the mirror, e.g. by an event or the periodic reload, and evicted when the
+    client leaves. Clients missing in the mirror are queried with clientinfo.
+    Server group changes are not announced by events, so after the bot changed server groups the
+    mirror is reloaded in the background. Changes by others show up with the periodic reload,
+    use query where the cached server groups are not good enough.
+    """
+    # Commands changing the server groups of clients, see on_command
+    SERVERGROUP_COMMANDS = frozenset(("servergroupaddclient", "servergroupdelclient", "servergroupdel"))
+
+    def __init__(self, ts3conn, server_state):
+        """
+        Create a new ClientInfoCache.
+        :param ts3conn: Connection to query clients missing in the mirror with.
+        :param server_state: Mirror of the server state.
+        :type server_state: ts3.ServerState.ServerState
+        """
+        self.ts3conn = ts3conn
+        self.server_state = server_state
+        # clid -> (client record, server group names, ClientInfo)
+        self._entries = {}
+        # Server groups of the snapshot the names were built from, and the names
+        self._servergroups = (None, {})
+        # Set when server groups changed, cleared by the background reload of the mirror
+        self._servergroups_changed = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+
+    def _servergroup_names(self, snapshot):
+        servergroups, names = self._servergroups
+        if servergroups is not snapshot.servergroups:
+            names = servergroup_names_of(snapshot.servergroups.values())
+            self._servergroups = (snapshot.servergroups, names)
+        return names
+
+    def get(self, client_id):
+        """
+        Get the ClientInfo of a client.
+        :param client_id: Client id of the client.
+        :type client_id: int | str
+        :rtype: ClientInfo
+        """
+        clid = int(client_id)
+        snapshot = self.server_state.snapshot
+        record = snapshot.clients.get(clid)
+        names = self._servergroup_names(snapshot) if snapshot.servergroups else None
+        entry = self._entries.get(clid)
+        if entry is not None and entry[0] is record and entry[1] is names and record is not None:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        info = ClientInfo(str(clid), self.ts3conn, record, names)
+        self._entries[clid] = (record, names, info)
+        return info
+
+    def query(self, client_id):
+        """
+        Get the ClientInfo of a client queried with clientinfo, e.g. before denying a command
+        because of the cached server groups. The server group names are taken from the mirror.
+        If the server groups differ from the mirrored ones, the mirror is reloaded in the
+        background.
+        :param client_id: Client id of the client.
+        :type client_id: int | str
+        :rtype: ClientInfo
+        """
+        snapshot = self.server_state.snapshot
+        names = self._servergroup_names(snapshot) if snapshot.servergroups else None
+        client_data = self.ts3conn.clientinfo(str(client_id))
+        record = snapshot.clients.get(int(client_id))
+        if record is not None and record.get("client_servergroups") != client_data.get("client_servergroups"):
+            self._servergroups_changed.set()
+            self._start_refresh()
+        return ClientInfo(str(client_id), self.ts3conn, client_data, names)
+
+    def prefetch(self):
+        """
+        Reload the mirrored clients with one clientlist, e.g. after changing server groups.
+        """
+        self._servergroups_changed.clear()
+        self.server_state.reload()
+
+    def invalidate(self, client_id=None):
+        """
+        Drop the cached ClientInfo of a client, or of all clients.
+        :type client_id: int | str | None
+        """
+        if client_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(int(client_id), None)
+
+    def on_dropped_event(self, event):
+        """
+        Drop all cached ClientInfos after an event was dropped before reaching handle_event, see
+        TS3Connection.add_drop_sink. The mirror reloads itself, see ServerState.on_dropped_event.
+        :type event: TS3Event
+        """
+        self.invalidate()
+
+    def on_command(self, command):
+        """
+        Reload the mirror in the background if a command changed server groups, see
+        TS3Connection.add_command_sink.
+        :type command: str
+        """
+        if command in self.SERVERGROUP_COMMANDS:
+            self._servergroups_changed.set()
+            self._start_refresh()
+
+    def _start_refresh(self):
+        """
+        Starts reloading the mirror on its own thread, unless a reload is running already.
+        """
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="client-info-refresh", daemon=True).start()
+
+    def _refresh(self):
+        """
+        Reloads the mirror until no server groups changed during the reload.
+        """
+        try:
+            while self._servergroups_changed.is_set():
+                self._servergroups_changed.clear()
+                try:
+                    self.server_state.reload()
+                except TS3Exception:
+                    logger.exception("Error reloading the server state after server group changes")
+                    return
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+        # Changed after the last check, but _start_refresh still saw this reload running
+        if self._servergroups_changed.is_set():
+            self._start_refresh()
+
+    def handle_event(self, event):
+        """
+        Evict clients that left, see TS3Connection.add_event_sink.
+        :type event: TS3Event
+        """
+        if isinstance(event, Events.ClientLeftEvent):
+            self._entries.pop(event.client_id, None)
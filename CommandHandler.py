@@ -1,6 +1,7 @@
 """Commandhandler for the Teamspeak3 Bot."""
 import ClientInfo
 import ts3.Events as Events
+from ts3.QueryScheduler import Priority
 import logging
 import Bot
 logger = logging.getLogger("bot")
@@ -10,12 +11,15 @@ class CommandHandler:
     """
     Command handler class that listens for PrivateMessages and informs registered handlers of possible commands.
     """
-    def __init__(self, ts3conn):
+    def __init__(self, ts3conn, client_infos=None):
         """
         Create new CommandHandler.
         :param ts3conn: TS3Connection to use
+        :param client_infos: Cache to look up senders with, None to query them for every message.
+        :type client_infos: ClientInfo.ClientInfoCache | None
         """
         self.ts3conn = ts3conn
+        self.client_infos = client_infos
         self.logger = logging.getLogger("textMsg")
         self.logger.setLevel(logging.INFO)
         file_handler = logging.FileHandler("logs/msg.log", mode='a+')
@@ -57,6 +61,16 @@ class CommandHandler:
                     return True
         return False
 
+    def client_info(self, clid):
+        """
+        Get the ClientInfo of a client, from the cache if there is one.
+        :param clid: Client id of the client.
+        :rtype: ClientInfo.ClientInfo
+        """
+        if self.client_infos is not None:
+            return self.client_infos.get(clid)
+        return ClientInfo.ClientInfo(clid, self.ts3conn)
+
     def handle_command(self, msg, sender=0):
         """
         Handle a new command by informing the corresponding handlers.
@@ -68,11 +82,18 @@ class CommandHandler:
         if len(command) > 1:
             command = command[1:]
             handlers = self.handlers.get(command)
-            ci = ClientInfo.ClientInfo(sender, self.ts3conn)
             handled = False 
             if handlers is not None:
+                ci = self.client_info(sender)
+                # Cached server groups may be outdated, they are only confirmed by a query before denying
+                current = self.client_infos is None
                 for handler in handlers:
-                    if self.check_permission(handler, ci):
+                    allowed = self.check_permission(handler, ci)
+                    if not allowed and not current:
+                        ci = self.client_infos.query(sender)
+                        current = True
+                        allowed = self.check_permission(handler, ci)
+                    if allowed:
                         handled = True
                         handler(sender, msg)
                 if not handled:
@@ -88,7 +109,9 @@ class CommandHandler:
         """
         if type(event) is Events.TextMessageEvent:
             if event.targetmode == "Private":
-                if event.invoker_id != int(self.ts3conn.whoami()["client_id"]):  # Don't talk to yourself ...
-                    ci = ClientInfo.ClientInfo(event.invoker_id, self.ts3conn)
-                    self.logger.info("Message: " + event.message + " from: " + ci.name)
-                    self.handle_command(event.message, sender=event.invoker_id)
+                # Somebody waits for the answer, overtake queries of the background modules
+                with self.ts3conn.priority(Priority.INTERACTIVE):
+                    if event.invoker_id != self.ts3conn.identity.client_id:  # Don't talk to yourself ...
+                        ci = self.client_info(event.invoker_id)
+                        self.logger.info("Message: " + event.message + " from: " + ci.name)
+                        self.handle_command(event.message, sender=event.invoker_id)
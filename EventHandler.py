@@ -1,9 +1,99 @@
 """EventHandler for the Teamspeak3 Bot."""
+import sys
+import time
+import traceback
+
 import ts3.Events as Events
+from ts3.EventDispatcher import EventDispatcher, event_key
+from ts3.metrics import Histogram
+from ts3.QueryScheduler import Priority
 import logging
 import threading
 
 
+class EventCoalescer(object):
+    """
+    Collects events for an observer and informs it of a list of them once no new event arrived for
+    a debounce window. Events with the same key replace each other, so the observer only gets the
+    last event per client or channel.
+    """
+
+    def __init__(self, event_handler, observer, window, max_wait=None, key=None):
+        """
+        Create a new EventCoalescer.
+        :param event_handler: EventHandler running the observer.
+        :param observer: Function to call with the list of collected events.
+        :param window: Seconds without new events before the observer is informed.
+        :param max_wait: Maximum seconds between the first collected event and informing the
+                         observer, even if events keep coming. Defaults to four windows.
+        :param key: Function returning the key of an event, defaults to the client or channel id.
+        :type event_handler: EventHandler
+        :type observer: (list[TS3Event]) -> None
+        :type window: float
+        :type max_wait: float
+        :type key: (TS3Event) -> collections.abc.Hashable
+        """
+        self.event_handler = event_handler
+        self.observer = observer
+        self.window = window
+        self.max_wait = max_wait if max_wait is not None else 4 * window
+        self.key = key or self.default_key
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._first = 0.0
+        self._last = 0.0
+        self._timer = None
+
+    @staticmethod
+    def default_key(evt):
+        """
+        Key of an event: the client it is about, else the channel, else the event class.
+        :type evt: TS3Event
+        """
+        data = evt.data
+        if "clid" in data:
+            return "clid", data["clid"]
+        if "cid" in data:
+            return "cid", data["cid"]
+        return type(evt)
+
+    def add(self, evt):
+        """
+        Collect an event, replacing an earlier event with the same key.
+        :param evt: New event.
+        """
+        key = self.key(evt)
+        now = time.monotonic()
+        with self._lock:
+            # Re-insert, so the batch is ordered by the last write
+            self._pending.pop(key, None)
+            self._pending[key] = evt
+            self._last = now
+            if self._timer is None:
+                self._first = now
+                self._start_timer(self.window)
+
+    def _start_timer(self, delay):
+        self._timer = threading.Timer(delay, self._flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush(self):
+        """
+        Informs the observer if the window passed, else waits for the rest of it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            remaining = min(self._last + self.window, self._first + self.max_wait) - now
+            if remaining > 0:
+                self._start_timer(remaining)
+                return
+            batch = list(self._pending.values())
+            self._pending = {}
+            self._timer = None
+        self.event_handler.inform_batch(self.observer, batch)
+
+
 class EventHandler(object):
     """
     EventHandler class responsible for delegating events to registered listeners.
@@ -17,48 +107,81 @@ class EventHandler(object):
     logger.info("Configured Eventhandler logger")
     logger.propagate = 0
 
-    def __init__(self, ts3conn, command_handler):
+    def __init__(self, ts3conn, command_handler, workers=8, time_budget=5.0, queue_size=1000):
+        """
+        Create a new EventHandler.
+        :param ts3conn: TS3Connection to use
+        :param command_handler: CommandHandler to inform of text messages
+        :param workers: Number of threads running observers
+        :param time_budget: Seconds an observer may take before it is logged as overrunning
+        :param queue_size: Events waiting per observer thread, further events are dropped
+        """
         self.ts3conn = ts3conn
         self.command_handler = command_handler
         self.observers = {}
+        # Concrete event class -> observers of the class and its base classes, filled on demand
+        # and reset whenever the observers change
+        self._dispatch_table = {}
+        self.time_budget = time_budget
+        # Observer name -> Histogram of its run times in seconds
+        self.latencies = {}
+        # An observer is informed of the events of one client (see event_key) in order, always on
+        # the same thread, while other observers and clients run in parallel
+        self._lanes = EventDispatcher(workers, queue_size, name="observer")
+        # Running observers: thread id -> [observer, event, start time, overrun already logged]
+        self._running = {}
+        self._running_lock = threading.Lock()
+        # Set by stop() to end the watchdog
+        self._stopped = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch_overruns, name="observer-watchdog", daemon=True)
+        self._watchdog.start()
         self.add_observer(self.command_handler.inform, Events.TextMessageEvent)
 
+    @property
+    def dropped(self):
+        """
+        Number of events dropped because the queue of an observer thread was full.
+        :rtype: int
+        """
+        return self._lanes.dropped
+
     def on_event(self, sender, **kw):
         """
-        Called upon a new event. Logs the event and informs all listeners.
-        """
-        # parsed_event = Events.EventParser.parse_event(event=event)
-        parsed_event = kw["event"]
-        if type(parsed_event) is Events.TextMessageEvent:
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ChannelEditedEvent:
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ChannelDescriptionEditedEvent:
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ClientEnteredEvent:
-            logging.debug(type(parsed_event))
-        elif isinstance(parsed_event, Events.ClientLeftEvent):
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ClientMovedEvent:
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ClientMovedSelfEvent:
-            logging.debug(type(parsed_event))
-        elif type(parsed_event) is Events.ServerEditedEvent:
+        Called upon a new event by a blinker signal. Logs the event and informs all listeners.
+        """
+        self.handle_event(kw["event"])
+
+    def handle_event(self, parsed_event):
+        """
+        Called upon a new event, directly as event sink of the connection. Logs the event and
+        informs all listeners.
+        :param parsed_event: New event.
+        """
+        if logging.root.isEnabledFor(logging.DEBUG):
             logging.debug("Event of type " + str(type(parsed_event)))
-            logging.debug(parsed_event.changed_properties)
+            if type(parsed_event) is Events.ServerEditedEvent:
+                logging.debug(parsed_event.changed_properties)
         # Inform all observers
         self.inform_all(parsed_event)
 
     def get_obs_for_event(self, evt):
         """
-        Get all observers for an event.
+        Get all observers for an event. The observers of an event class are collected once and
+        looked up afterwards until the observers change.
         :param evt: Event to get observers for.
-        :return: List of observers.
-        :rtype: list[function]
+        :return: Observers.
+        :rtype: tuple[function]
         """
-        obs = set()
-        for t in type(evt).mro():
-            obs.update(self.observers.get(t, set()))
+        # Observers changing while collecting replace the table, the stale result only ends up in
+        # the old one
+        table = self._dispatch_table
+        obs = table.get(type(evt))
+        if obs is None:
+            collected = set()
+            for t in type(evt).mro():
+                collected.update(self.observers.get(t, ()))
+            obs = tuple(collected)
+            table[type(evt)] = obs
         return obs
 
     def add_observer(self, obs, evt_type):
@@ -68,17 +191,41 @@ class EventHandler(object):
         :param evt_type: Event type to observe.
         :type evt_type: TS3Event
         """
-        obs_set = self.observers.get(evt_type, set())
+        # Sets are replaced instead of changed, get_obs_for_event may be iterating them
+        obs_set = set(self.observers.get(evt_type, ()))
         obs_set.add(obs)
         self.observers[evt_type] = obs_set
+        self._dispatch_table = {}
+
+    def add_coalescing_observer(self, obs, evt_types, window, max_wait=None, key=None):
+        """
+        Add an observer that is informed of a list of events once no new event arrived for window
+        seconds, keeping only the last event per client or channel. Suited for observers that
+        refresh state, e.g. with clientlist, when a channel is mass moved or the server restarts.
+        :param obs: Function to call with the list of events.
+        :param evt_types: Event types to observe.
+        :param window: Debounce window in seconds.
+        :param max_wait: Maximum delay of an event in seconds, see EventCoalescer.
+        :param key: Function returning the key of an event, see EventCoalescer.
+        :type evt_types: collections.abc.Iterable[TS3Event]
+        :type window: float
+        :return: The EventCoalescer collecting the events.
+        :rtype: EventCoalescer
+        """
+        coalescer = EventCoalescer(self, obs, window, max_wait, key)
+        for evt_type in evt_types:
+            self.add_observer(coalescer, evt_type)
+        return coalescer
 
     def remove_observer(self, obs, evt_type):
         """
         Remove an observer for an event type.
-        :param obs: Observer to remove.
+        :param obs: Observer to remove, also removes coalescing observers informing it.
         :param evt_type: Event type to remove the observer from.
         """
-        self.observers.get(evt_type, set()).discard(obs)
+        obs_set = self.observers.get(evt_type, set())
+        self.observers[evt_type] = {o for o in obs_set if o is not obs and getattr(o, "observer", None) is not obs}
+        self._dispatch_table = {}
 
     def remove_observer_from_all(self, obs):
         """
@@ -94,8 +241,75 @@ class EventHandler(object):
         :param evt: Event to inform observers of.
         """
         for o in self.get_obs_for_event(evt):
-            try:
-                threading.Thread(target=o(evt)).start()
-            except Exception:
-                EventHandler.logger.exception("Exception while informing " + str(o) + " of Event of type " +
-                                              str(type(evt)) + "\nOriginal data:" + str(evt.data))
+            if type(o) is EventCoalescer:
+                o.add(evt)
+            else:
+                self._lanes.submit((o, event_key(evt)), self._run_observer, o, evt)
+
+    def inform_batch(self, obs, events):
+        """
+        Inform an observer of a list of coalesced events.
+        :param obs: Observer to inform.
+        :param events: Collected events.
+        :type events: list[TS3Event]
+        """
+        self._lanes.submit(obs, self._run_observer, obs, events)
+
+    def stop(self, wait=True):
+        """
+        Stops the observer threads after the queued events were handled, and the watchdog.
+        :param wait: Wait until the queued events were handled and the watchdog ended.
+        :type wait: bool
+        """
+        self._lanes.stop()
+        if wait:
+            self._lanes.join()
+        self._stopped.set()
+        if wait:
+            self._watchdog.join()
+
+    def _run_observer(self, observer, evt):
+        """
+        Run a single observer on an observer thread and record its run time.
+        :param observer: Observer to inform.
+        :param evt: Event or list of coalesced events to inform the observer of.
+        """
+        # Builtin observers like list.append have __module__ None
+        module = getattr(observer, "__module__", None) or ""
+        name = module + "." + getattr(observer, "__qualname__", str(observer))
+        thread_id = threading.get_ident()
+        start = time.monotonic()
+        with self._running_lock:
+            self._running[thread_id] = [name, evt, start, False]
+        try:
+            with self.ts3conn.priority(Priority.EVENT):
+                observer(evt)
+        except Exception:
+            data = [e.data for e in evt] if isinstance(evt, list) else evt.data
+            EventHandler.logger.exception("Exception while informing " + str(observer) + " of Event of type " +
+                                          str(type(evt)) + "\nOriginal data:" + str(data))
+        finally:
+            with self._running_lock:
+                del self._running[thread_id]
+            histogram = self.latencies.get(name)
+            if histogram is None:
+                histogram = self.latencies.setdefault(name, Histogram())
+            histogram.observe(time.monotonic() - start)
+
+    def _watch_overruns(self):
+        """
+        Logs observers running longer than the time budget, once per run, with the place they are
+        stuck at. Threads cannot be interrupted safely, so overrunning observers keep running.
+        """
+        while not self._stopped.wait(min(1.0, self.time_budget)):
+            now = time.monotonic()
+            with self._running_lock:
+                overruns = [(thread_id, run) for thread_id, run in self._running.items()
+                             if not run[3] and now - run[2] > self.time_budget]
+                for _, run in overruns:
+                    run[3] = True
+            frames = sys._current_frames()
+            for thread_id, (name, evt, start, _) in overruns:
+                stack = "".join(traceback.format_stack(frames[thread_id])) if thread_id in frames else ""
+                EventHandler.logger.warning("Observer %s is running for %.1fs on %s, exceeding its budget of %.1fs\n%s",
+                                            name, now - start, type(evt).__name__, self.time_budget, stack)
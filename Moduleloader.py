@@ -92,6 +92,25 @@ def event(*event_types):
     return register_observer
 
 
+def debounced_event(window, *event_types, max_wait=None):
+    """
+    Decorator to register a function as an eventlistener that is called with a list of events once
+    no new event of the event types arrived for window seconds. Only the last event per client or
+    channel is kept, so bursts like mass moves cause one call.
+    :param window: Debounce window in seconds.
+    :param event_types: Event types to listen to
+    :param max_wait: Maximum delay of an event in seconds, defaults to four windows.
+    :type window: float
+    :type event_types: TS3Event
+    """
+
+    def register_observer(function):
+        event_handler.add_coalescing_observer(function, event_types, window, max_wait)
+        return function
+
+    return register_observer
+
+
 def command(*command_list):
     """
     Decorator to register a function as a handler for text commands.
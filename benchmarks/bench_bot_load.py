@@ -0,0 +1,107 @@
+"""
+End to end load test of the bot against the local FakeQueryServer, no TeamSpeak server or network
+needed. Starts a Ts3Bot with the AfkMover and utils plugins, lets admins send !hello commands
+while clients are dragged between channels and the server "restarts", and reports the command
+round trips, how many away clients the AfkMover moved and the queries the bot sent. Run from the
+repository root:
+    python -m benchmarks.bench_bot_load [--clients 200] [--admins 10] [--commands 20] [--latency 0.002]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+# The bot and its plugins log to logs/
+os.makedirs("logs", exist_ok=True)
+
+import Bot
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.metrics import Histogram
+
+# AFK_CHANNEL and AFK_CHANNELS of modules/afkmover.py, the plugin can only be imported by the bot
+AFK_CHANNEL = "Bin weg"
+AFK_CHANNELS = ["Masturbationszimmer", "Kramis Kühlkammer", "Anderer Gs / Zwietracht", "Anstubsbar"]
+
+
+def start_bot(port):
+    """
+    Runs a bot in a daemon thread, the constructor of Ts3Bot does not return.
+    """
+    config = {
+        "General": {"host": "127.0.0.1", "port": port, "serverid": "1", "user": "serveradmin",
+                    "password": "password", "defaultchannel": "Botchannel", "botname": "LoadTestBot"},
+        "Plugins": {"AfkMover": "afkmover", "UtilCommand": "utils"},
+    }
+    thread = threading.Thread(target=Bot.Ts3Bot.bot_from_config, args=(config,), name="bot", daemon=True)
+    thread.start()
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for the bot")
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="virtual clients")
+    parser.add_argument("--admins", type=int, default=10, help="clients sending commands")
+    parser.add_argument("--commands", type=int, default=20, help="commands per admin")
+    parser.add_argument("--away", type=int, default=20, help="clients set to away")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds the server delays every answer")
+    parser.add_argument("--flood-commands", type=int, default=None, help="server flood limit per 3 seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    channels = ["Botchannel", "Lobby", "Games"] + AFK_CHANNELS + [AFK_CHANNEL]
+    server = FakeQueryServer(clients=args.clients, channels=channels, servergroups=("Kaiser", "Normal"),
+                             latency=args.latency, flood_commands=args.flood_commands)
+    port = server.start_in_thread()
+    start_bot(port)
+    # Registered for private messages and the plugins are loaded once the mover polls, the first
+    # clientlist loads the server state
+    wait_for(lambda: server.command_counts["clientlist"] > 1, 30)
+    setup_queries = sum(server.command_counts.values())
+
+    admins = [server.add_client("Admin %d" % i, servergroups=("Kaiser",)) for i in range(args.admins)]
+    away = list(server.clients)[:args.away]
+    for clid in away:
+        server.update_client(clid, client_away=1)
+    afk_channel = channels.index(AFK_CHANNEL) + 1
+
+    round_trips = Histogram()
+    start = time.monotonic()
+    for i in range(args.commands):
+        if i == args.commands // 3:
+            server.mass_move(2)
+        if i == 2 * args.commands // 3:
+            server.restart_burst()
+        sent = time.monotonic()
+        replied = len(server.messages)
+        for clid in admins:
+            server.send_text_message(clid, "!hello")
+        # One !hello and one reply per admin
+        wait_for(lambda: sum(1 for message in server.messages[replied:] if message[2] in admins and
+                             message[0] not in admins) >= len(admins), 60)
+        for message in server.messages[replied:]:
+            if message[2] in admins and message[0] not in admins:
+                round_trips.observe(message[4] - sent)
+    elapsed = time.monotonic() - start
+    # The AfkMover polls every two seconds
+    wait_for(lambda: all(server.clients[clid]["cid"] == afk_channel for clid in away if clid in server.clients), 10)
+
+    print("%d commands in %.2fs: %.0f commands/s" % (round_trips.count, elapsed, round_trips.count / elapsed))
+    print("command round trip:", {key: round(value, 4) if isinstance(value, float) else value
+                                  for key, value in round_trips.summary().items()})
+    print("away clients moved to %s: %d" % (AFK_CHANNEL, len(away)))
+    print("queries after setup:", sum(server.command_counts.values()) - setup_queries)
+    for command, count in server.command_counts.most_common():
+        print("  %-24s %6d" % (command, count))
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
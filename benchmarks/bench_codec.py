@@ -0,0 +1,94 @@
+"""
+Micro benchmark of the ServerQuery codec against the previous escape/unescape and parsing
+functions. Run from the repository root:
+    python -m benchmarks.bench_codec
+"""
+import timeit
+
+from ts3 import codec
+from ts3.utilities import _ESCAPE_MAP
+
+CLIENTS = 500
+REPEAT = 5
+
+
+def legacy_escape(raw):
+    for char, replacement in _ESCAPE_MAP:
+        raw = raw.replace(char, replacement)
+    return raw
+
+
+def legacy_unescape(raw):
+    for replacement, char in reversed(_ESCAPE_MAP):
+        raw = raw.replace(char, replacement)
+    return raw
+
+
+def legacy_parse_resp_to_dict(resp):
+    resp = resp.decode(encoding='UTF-8').split(" ")
+    info = dict()
+    for part in resp:
+        split = part.split('=', 1)
+        if len(split) == 2:
+            key, value = split
+            info[key] = legacy_unescape(value)
+    return info
+
+
+def legacy_parse_resp_to_list_of_dicts(resp):
+    split_list = resp.split(b"|")
+    dict_list = list()
+    for response in split_list:
+        if len(response) > 0:
+            dict_list.append(legacy_parse_resp_to_dict(response))
+    return dict_list
+
+
+def clientlist_response(clients=CLIENTS):
+    """
+    Builds a response shaped like "clientlist -away -voice" for the given number of clients.
+    """
+    return b"|".join(
+        b"clid=%d cid=%d client_database_id=%d client_nickname=User\\s%d client_type=0 client_away=%d"
+        b" client_away_message=%s client_flag_talking=0 client_input_muted=0 client_output_muted=%d"
+        b" client_outputonly_muted=0 client_input_hardware=1 client_output_hardware=1"
+        b" client_talk_power=0 client_is_talker=0 client_is_priority_speaker=0 client_is_recording=0"
+        b" client_is_channel_commander=0"
+        % (i, i % 25, i + 1000, i, i % 7 == 0, b"brb\\sfood" if i % 7 == 0 else b"", i % 5 == 0)
+        for i in range(1, clients + 1))
+
+
+def measure(func, *args):
+    """
+    :return: Best time of one call in milliseconds.
+    """
+    timer = timeit.Timer(lambda: func(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number * 1000
+
+
+def main():
+    resp = clientlist_response()
+    assert codec.parse_records(resp) == legacy_parse_resp_to_list_of_dicts(resp)
+    message = "Hello | world / this is a\ttest\nwith some escaping"
+    escaped = legacy_escape(message)
+    assert codec.escape(message) == escaped and codec.unescape(escaped) == message
+    cases = [
+        ("escape", legacy_escape, codec.escape, message),
+        ("escape (nothing to do)", legacy_escape, codec.escape, "cid=5"),
+        ("escape (nickname)", legacy_escape, codec.escape, "User 5"),
+        ("unescape", legacy_unescape, codec.unescape, escaped),
+        ("unescape (nothing to do)", legacy_unescape, codec.unescape, "client_nickname"),
+        ("unescape (nickname)", legacy_unescape, codec.unescape, r"User\s5"),
+        ("parse clientlist (%d clients)" % CLIENTS, legacy_parse_resp_to_list_of_dicts,
+         codec.parse_records, resp),
+    ]
+    print("%-32s %12s %12s %8s" % ("case", "legacy [ms]", "codec [ms]", "speedup"))
+    for name, legacy, new, arg in cases:
+        legacy_time = measure(legacy, arg)
+        new_time = measure(new, arg)
+        print("%-32s %12.5f %12.5f %7.1fx" % (name, legacy_time, new_time, legacy_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
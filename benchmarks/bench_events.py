@@ -0,0 +1,273 @@
+"""
+Micro benchmark of received events. Compares parsing and the memory of retained events against
+the previous event classes, which copied every field into an attribute, and routing to the
+EventHandler observers against the previous blinker round trip with its if/elif chain and per
+event MRO walk. Observers are called inline, so the observer executor is not part of the
+measurement. Run from the repository root:
+    python -m benchmarks.bench_events
+"""
+import logging
+import os
+import timeit
+import tracemalloc
+import types
+
+import blinker
+
+# The EventHandler logs to logs/eventhandler.log
+os.makedirs("logs", exist_ok=True)
+
+import EventHandler
+from ts3 import Events
+from ts3.TS3Connection import TS3Connection
+
+OBSERVERS = 5
+RETAINED = 10000
+REPEAT = 5
+
+
+class LegacyTS3Event:
+    event_type = Events.EventType.UNKNOWN
+
+    def __init__(self, data, event_type=None):
+        self._data = data
+        if event_type is not None:
+            self._event_type = event_type
+        self._logger = logging.getLogger(Events.__name__)
+
+
+class LegacyClientEnteredEvent(LegacyTS3Event):
+    event_type = Events.EventType.CLIENT_ENTER
+
+    def __init__(self, data):
+        super().__init__(data)
+        self._client_id = int(data.get('clid', '-1'))
+        self._client_name = data.get('client_nickname', '')
+        self._client_uid = data.get('client_unique_identifier', '')
+        self._client_description = data.get('client_description', '')
+        self._client_country = data.get('client_country', '')
+        self._client_away = data.get('client_away', '')
+        self._client_away_msg = data.get('client_away_message', '')
+        self._client_input_muted = data.get('client_input_muted', '')
+        self._client_output_muted = data.get('client_output_muted', '')
+        self._client_outputonly_muted = data.get('client_outputonly_muted', '')
+        self._client_input_hardware = data.get('client_input_hardware', '')
+        self._client_output_hardware = data.get('client_output_hardware', '')
+        self._target_channel_id = int(data.get('ctid', '-1'))
+        self._from_channel_id = int(data.get('cfid', '-1'))
+        self._reason_id = int(data.get('reasonid', '-1'))
+        self._client_is_recording = data.get('client_is_recording', '')
+        self._client_dbid = data.get('client_database_id', '')
+        self._client_servergroups = data.get('client_servergroups', '')
+        self._client_channel_group_id = int(data.get('client_channel_group_id', '-1'))
+
+
+class LegacyClientMovedEvent(LegacyTS3Event):
+    event_type = Events.EventType.CLIENT_MOVED
+
+    def __init__(self, data):
+        super().__init__(data)
+        self._client_id = int(data.get('clid', '-1'))
+        self._target_channel_id = int(data.get('ctid', '-1'))
+        self._reason_id = int(data.get('reasonid', '-1'))
+        self._invoker_id = int(data.get('invokerid', '-1'))
+        self._invoker_name = data.get('invokername', '')
+        self._invoker_uid = data.get('invokeruid', '')
+
+
+class LegacyTextMessageEvent(LegacyTS3Event):
+    event_type = Events.EventType.TEXT_MESSAGE
+
+    def __init__(self, data):
+        super().__init__(data)
+        if data.get('targetmode') == '1':
+            self._targetmode = 'Private'
+            self._target = data.get('target')
+        elif data.get('targetmode') == '2':
+            self._targetmode = 'Channel'
+        elif data.get('targetmode') == '3':
+            self._targetmode = 'Server'
+        self._message = data.get('msg')
+        self._invoker_id = int(data.get('invokerid', '-1'))
+        self._invoker_name = data.get('invokername', '')
+        self._invoker_uid = data.get('invokeruid', '-1')
+
+
+def legacy_parse_event(event, event_type):
+    """
+    The previous if chain, up to the event types used here.
+    """
+    if Events.EventType.TEXT_MESSAGE.value == event_type:
+        return LegacyTextMessageEvent(event)
+    if Events.EventType.CLIENT_MOVED.value == event_type:
+        if 'invokerid' in event:
+            return LegacyClientMovedEvent(event)
+        return LegacyTS3Event(event)
+    if Events.EventType.CLIENT_ENTER.value == event_type:
+        return LegacyClientEnteredEvent(event)
+    return LegacyTS3Event(event, event_type)
+
+
+def legacy_get_obs_for_event(handler, evt):
+    obs = set()
+    for t in type(evt).mro():
+        obs.update(handler.observers.get(t, set()))
+    return obs
+
+
+def legacy_on_event(handler, sender, **kw):
+    parsed_event = kw["event"]
+    if type(parsed_event) is Events.TextMessageEvent:
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ChannelEditedEvent:
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ChannelDescriptionEditedEvent:
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ClientEnteredEvent:
+        logging.debug(type(parsed_event))
+    elif isinstance(parsed_event, Events.ClientLeftEvent):
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ClientMovedEvent:
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ClientMovedSelfEvent:
+        logging.debug(type(parsed_event))
+    elif type(parsed_event) is Events.ServerEditedEvent:
+        logging.debug("Event of type " + str(type(parsed_event)))
+        logging.debug(parsed_event.changed_properties)
+    for o in legacy_get_obs_for_event(handler, parsed_event):
+        o(parsed_event)
+
+
+def legacy_deliver(event):
+    if isinstance(event, Events.TextMessageEvent):
+        signal = blinker.signal(event.event_type.name + "_" + event.targetmode.lower())
+    else:
+        signal = blinker.signal(event.event_type.name)
+    signal.send(event=event)
+
+
+class InlineEventHandler(EventHandler.EventHandler):
+    """
+    Calls the observers on the calling thread.
+    """
+
+    def inform_all(self, evt):
+        for o in self.get_obs_for_event(evt):
+            o(evt)
+
+
+def observer(evt):
+    pass
+
+
+def build_handler():
+    handler = InlineEventHandler(ts3conn=None, command_handler=types.SimpleNamespace(inform=observer))
+    for _ in range(OBSERVERS):
+        # Distinct functions, observers are kept in sets
+        handler.add_observer(lambda evt: None, Events.ClientEnteredEvent)
+        handler.add_observer(lambda evt: None, Events.ClientLeftEvent)
+        handler.add_observer(lambda evt: None, Events.TS3Event)
+    return handler
+
+
+def sample_events():
+    return [
+        Events.ClientEnteredEvent({"clid": "5", "ctid": "1", "client_nickname": "User"}),
+        Events.ClientLeftEvent({"clid": "5", "cfid": "1", "reasonid": "8"}),
+        Events.ClientKickedEvent({"clid": "6", "cfid": "1", "reasonid": "5", "invokerid": "1"}),
+        Events.ClientMovedEvent({"clid": "5", "ctid": "2", "reasonid": "1", "invokerid": "1"}),
+        Events.TextMessageEvent({"targetmode": "1", "msg": "!hello", "invokerid": "5"}),
+    ]
+
+
+def sample_notifications():
+    """
+    :return: (notify name, event data) pairs.
+    """
+    return [
+        ("notifycliententerview", {
+            "cfid": "0", "ctid": "1", "reasonid": "0", "clid": "5", "client_unique_identifier": "abc=",
+            "client_nickname": "User", "client_input_muted": "0", "client_output_muted": "0",
+            "client_outputonly_muted": "0", "client_input_hardware": "1", "client_output_hardware": "1",
+            "client_is_recording": "0", "client_database_id": "42", "client_channel_group_id": "8",
+            "client_servergroups": "6,7", "client_away": "0", "client_away_message": "",
+            "client_description": "", "client_country": "DE"}),
+        ("notifyclientmoved", {"ctid": "2", "reasonid": "1", "invokerid": "1", "invokername": "Admin",
+                               "invokeruid": "xyz=", "clid": "5"}),
+        ("notifytextmessage", {"targetmode": "1", "msg": "!hello", "target": "3", "invokerid": "5",
+                               "invokername": "User", "invokeruid": "abc="}),
+    ]
+
+
+def retained_bytes(parse, notifications):
+    """
+    :return: Bytes allocated per retained event, without its data dictionary.
+    """
+    data = [dict(notifications[i % len(notifications)][1]) for i in range(RETAINED)]
+    names = [notifications[i % len(notifications)][0] for i in range(RETAINED)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [parse(event, name) for event, name in zip(data, names)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(events) == RETAINED
+    return (after - before) / RETAINED
+
+
+def measure(func, calls):
+    """
+    :param calls: Arguments of one call per event.
+    :return: Events handled per second.
+    """
+    def run():
+        for args in calls:
+            func(*args)
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return number * len(calls) / min(timer.repeat(repeat=REPEAT, number=number))
+
+
+def connect_signals(receiver):
+    for event_type in Events.EventType:
+        blinker.signal(event_type.name).connect(receiver)
+    for target in ("private", "channel", "server"):
+        blinker.signal(Events.EventType.TEXT_MESSAGE.name + "_" + target).connect(receiver)
+
+
+def main():
+    notifications = sample_notifications()
+    for name, data in notifications:
+        assert type(Events.EventParser.parse_event(data, name)).__name__ == \
+            type(legacy_parse_event(data, name)).__name__[len("Legacy"):]
+    parse_cases = [(data, name) for name, data in notifications]
+    legacy_parse_rate = measure(legacy_parse_event, parse_cases)
+    parse_rate = measure(Events.EventParser.parse_event, parse_cases)
+    legacy_memory = retained_bytes(legacy_parse_event, notifications)
+    memory = retained_bytes(Events.EventParser.parse_event, notifications)
+
+    events = sample_events()
+    handler = build_handler()
+    for event in events:
+        assert set(handler.get_obs_for_event(event)) == legacy_get_obs_for_event(handler, event)
+    # No blinker receivers, events go to the sink only
+    conn = types.SimpleNamespace(_signals={}, _event_sinks=(handler.handle_event,))
+    table_rate = measure(TS3Connection._deliver, [(conn, event) for event in events])
+
+    legacy_handler = build_handler()
+
+    def on_event(sender, **kw):
+        legacy_on_event(legacy_handler, sender, **kw)
+    connect_signals(on_event)
+    legacy_rate = measure(legacy_deliver, [(event,) for event in events])
+
+    print("%-32s %14s %14s %8s" % ("case", "legacy", "new", "ratio"))
+    print("%-32s %14.0f %14.0f %7.1fx" % ("parse %d event types [ev/s]" % len(notifications), legacy_parse_rate,
+                                          parse_rate, parse_rate / legacy_parse_rate))
+    print("%-32s %14.0f %14.0f %7.1fx" % ("retained event [bytes]", legacy_memory, memory,
+                                          legacy_memory / memory))
+    print("%-32s %14.0f %14.0f %7.1fx" % ("route %d event classes [ev/s]" % len(events), legacy_rate,
+                                          table_rate, table_rate / legacy_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Replays a capture recorded with TS3Connection.start_recording (CaptureFile in config.ini) into an
+EventHandler, to profile parsing and dispatching against real traffic without a server. Observers
+only count the events, the time the plugins take is not included. Run from the repository root:
+    python -m benchmarks.replay_capture capture.log [--speed 1|10|max]
+"""
+import argparse
+import contextlib
+import os
+import types
+
+# The EventHandler logs to logs/eventhandler.log
+os.makedirs("logs", exist_ok=True)
+
+import EventHandler
+from ts3 import Events
+from ts3.TrafficRecorder import capture_files
+from ts3.replay import replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="capture file, rotated files are replayed first")
+    parser.add_argument("--speed", default="max", help="replay speed relative to the recording or max")
+    args = parser.parse_args()
+    speed = None if args.speed == "max" else float(args.speed)
+
+    # Stands in for the connection, observers run with a query priority
+    conn = types.SimpleNamespace(priority=lambda priority: contextlib.nullcontext())
+    handler = EventHandler.EventHandler(conn, types.SimpleNamespace(inform=lambda evt: None))
+    handler.remove_observer_from_all(handler.command_handler.inform)
+    counts = {}
+
+    def count(evt):
+        counts[type(evt).__name__] = counts.get(type(evt).__name__, 0) + 1
+    handler.add_observer(count, Events.TS3Event)
+
+    files = capture_files(args.capture)
+    if not files:
+        parser.error("no capture found at " + args.capture)
+    stats = replay(files, sink=handler.handle_event, speed=speed)
+    handler.stop()
+    print("%d lines, %d events, %d records in %.3fs: %.0f lines/s, %.0f events/s" % (
+        stats["lines"], stats["events"], stats["records"], stats["seconds"], stats["lines"] / stats["seconds"],
+        stats["events"] / stats["seconds"]))
+    for name, number in sorted(counts.items(), key=lambda item: -item[1]):
+        print("%-32s %8d" % (name, number))
+    for name, histogram in handler.latencies.items():
+        print(name, histogram.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Benchmark suite with a regression gate. Runs micro benchmarks of the hot functions and end to end
+scenarios of the bot against the local FakeQueryServer, writes the results as JSON and compares
+them to a stored baseline. Exits with 1 if a result is more than the threshold worse than its
+baseline in all of --attempts runs. Run from the repository root:
+    python -m benchmarks.suite [--output results.json] [--baseline benchmarks/baseline.json]
+                               [--threshold 0.25] [--attempts 3] [--update-baseline]
+
+Next to every measurement, a fixed pure Python calibration workload is timed. Results are compared
+by their median ratio to the calibration, so the committed baseline can be compared against on
+other machines and under changing load. The baseline is the median of --attempts runs. Record a new
+one with --update-baseline before comparing changes on a machine that differs a lot, e.g. another
+Python version.
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import timeit
+
+# The bot and its plugins log to logs/
+os.makedirs("logs", exist_ok=True)
+
+import Bot
+import ClientInfo
+import CommandHandler
+import EventHandler
+import Moduleloader
+from benchmarks.bench_codec import clientlist_response
+from benchmarks.bench_events import sample_notifications
+from ts3 import Events, utilities
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.ServerState import ServerState
+from ts3.TS3Connection import TS3Connection
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+CLIENTS = 1000
+AWAY = 100
+BROADCAST = 500
+ROUND_TRIPS = 30
+# Runs of the other scenarios, each calibrated on its own, see result
+REPEAT = 7
+# Rounds of the micro benchmarks, see measure_interleaved
+MICRO_ROUNDS = 7
+# Calls of calibration_workload per calibration of a scenario run, about a millisecond
+CALIBRATION_NUMBER = 10
+
+# Channels modules/afkmover.py looks up by name
+AFK_CHANNEL = "Bin weg"
+AFK_CHANNELS = ["Masturbationszimmer", "Kramis Kühlkammer", "Anderer Gs / Zwietracht", "Anstubsbar"]
+
+
+class StubConnection:
+    """
+    Answers the queries of ClientInfo without a server.
+    """
+    def __init__(self):
+        self._info = {"cid": "1", "client_nickname": "User", "client_unique_identifier": "abc=",
+                      "client_database_id": "42", "client_servergroups": "6,7", "client_away": "0",
+                      "client_input_muted": "0", "client_output_muted": "0", "client_country": "DE",
+                      "connection_client_ip": "127.0.0.1", "client_platform": "Linux"}
+        self._groups = [{"sgid": str(sgid), "name": "Group %d" % sgid} for sgid in range(1, 30)]
+
+    def clientinfo(self, clid):
+        return self._info
+
+    def servergrouplist(self):
+        return self._groups
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for the scenario")
+        time.sleep(0.0005)
+
+
+def result(samples, unit, better="lower"):
+    """
+    Summarizes the runs of a benchmark.
+    :param samples: Measured value and the calibration time measured next to it, per run.
+    :type samples: list[(float, float)]
+    :return: The best value for reading, and the median value in units of the calibration for
+             comparing, see compare.
+    :rtype: dict
+    """
+    if better == "higher":
+        value = max(value for value, _ in samples)
+        relative = statistics.median(value * calibration for value, calibration in samples)
+    else:
+        value = min(value for value, _ in samples)
+        relative = statistics.median(value / calibration for value, calibration in samples)
+    return {"value": round(value, 6), "relative": round(relative, 9), "unit": unit, "better": better}
+
+
+def calibration_workload():
+    """
+    Fixed workload of the operations the benchmarks consist of: string splitting and replacing,
+    dictionary updates and function calls. Its run time calibrates the results, see result.
+    """
+    record = {}
+    for i in range(100):
+        key, _, value = ("key%d=value\\s%d" % (i, i)).partition("=")
+        record[key] = value.replace("\\s", " ").split(" ")[0]
+    return record
+
+
+def calibrate():
+    """
+    Times the calibration workload right now.
+    :return: Milliseconds per call of calibration_workload.
+    :rtype: float
+    """
+    return timeit.timeit(calibration_workload, number=CALIBRATION_NUMBER) / CALIBRATION_NUMBER * 1000
+
+
+def measure_interleaved(cases):
+    """
+    Times functions in rounds, one repetition of the calibration and of every function per round,
+    so a machine getting slower or faster during the run affects all of them alike.
+    :param cases: Name -> (function, arguments...).
+    :type cases: dict[str, tuple]
+    :return: Name -> time of one call in milliseconds and the calibration of its round, per round.
+    :rtype: dict[str, list[(float, float)]]
+    """
+    timers = {}
+    for name, (func, *args) in cases.items():
+        timer = timeit.Timer(functools.partial(func, *args))
+        timers[name] = (timer, timer.autorange()[0])
+    calibration = timeit.Timer(calibration_workload)
+    calibration_number = calibration.autorange()[0]
+    samples = {name: [] for name in cases}
+    for _ in range(MICRO_ROUNDS):
+        calibration_time = calibration.timeit(calibration_number) / calibration_number * 1000
+        for name, (timer, number) in timers.items():
+            samples[name].append((timer.timeit(number) / number * 1000, calibration_time))
+    return samples
+
+
+def micro_benchmarks():
+    """
+    :return: Results of the micro benchmarks, in microseconds per call.
+    """
+    message = "Hello | world / this is a\ttest\nwith some escaping"
+    escaped = utilities.escape(message)
+    clientlist = clientlist_response()
+    notifications = sample_notifications()
+    stub = StubConnection()
+    command = "!setmutetime 'forty five' \"minutes of quiet\" now"
+
+    def parse_events():
+        for name, data in notifications:
+            Events.EventParser.parse_event(data, name)
+
+    cases = {
+        "escape": (utilities.escape, message),
+        "unescape": (utilities.unescape, escaped),
+        "parse clientlist (500 clients)": (TS3Connection._parse_resp_to_list_of_dicts, clientlist),
+        "parse event": (parse_events,),
+        "split command": (Moduleloader.split_command, command),
+        "ClientInfo": (ClientInfo.ClientInfo, "5", stub),
+    }
+    results = {}
+    for name, samples in measure_interleaved(cases).items():
+        # Microseconds per call, per event for the events
+        factor = 1000 / len(notifications) if name == "parse event" else 1000
+        results["micro: " + name] = result([(per_call * factor, calibration) for per_call, calibration in samples],
+                                           "us")
+    return results
+
+
+def macro_benchmarks():
+    """
+    Runs the scenarios against one FakeQueryServer with CLIENTS virtual clients.
+    :return: Results of the scenarios.
+    """
+    channels = ["Default Channel", "Lobby"] + AFK_CHANNELS + [AFK_CHANNEL]
+    server = FakeQueryServer(clients=CLIENTS, channels=channels, servergroups=("Kaiser", "Normal"))
+    virtual_clients = list(server.clients)
+    conn = TS3Connection(port=server.start_in_thread())
+    try:
+        # Wired like Ts3Bot.setup_bot
+        server_state = ServerState(conn, reconcile_interval=0)
+        client_infos = ClientInfo.ClientInfoCache(conn, server_state)
+        command_handler = CommandHandler.CommandHandler(conn, client_infos=client_infos)
+        event_handler = EventHandler.EventHandler(ts3conn=conn, command_handler=command_handler)
+        conn.register_for_server_events()
+        conn.register_for_channel_events(0)
+        conn.register_for_private_messages()
+        conn.add_event_sink(event_handler.handle_event)
+        conn.add_event_sink(server_state.handle_event)
+        conn.add_event_sink(client_infos.handle_event)
+        conn.add_command_sink(client_infos.on_command)
+        server_state.start()
+        results = {}
+        admin = server.add_client("Admin", servergroups=("Kaiser",))
+        results.update(command_round_trip(server, conn, command_handler, admin))
+        results.update(broadcast(conn, virtual_clients[:BROADCAST]))
+        results.update(event_throughput(server, event_handler, virtual_clients, admin))
+        results.update(afkmover_tick(server, conn, command_handler, event_handler, virtual_clients))
+        return results
+    finally:
+        conn.quit()
+        server.stop_in_thread()
+
+
+def command_round_trip(server, conn, command_handler, admin):
+    """
+    An admin sends !hello and waits for the answer, one command at a time.
+    """
+    def hello(sender, msg):
+        Bot.send_msg_to_client(conn, sender, "Hello")
+    hello.allowed_groups = ("Kaiser",)
+    command_handler.add_handler(hello, "hello")
+    samples = []
+    for _ in range(ROUND_TRIPS):
+        calibration = calibrate()
+        replied = len(server.messages)
+        sent = time.monotonic()
+        server.send_text_message(admin, "!hello")
+        wait_for(lambda: any(message[2] == admin for message in server.messages[replied:]))
+        reply = next(message[4] for message in server.messages[replied:] if message[2] == admin)
+        samples.append(((reply - sent) * 1000, calibration))
+    return {"macro: command round trip": result(samples, "ms")}
+
+
+def broadcast(conn, clids):
+    samples = []
+    for _ in range(REPEAT):
+        calibration = calibrate()
+        start = time.monotonic()
+        conn.sendtextmessage_many(clids, "Server restart in 5 minutes")
+        samples.append(((time.monotonic() - start) * 1000, calibration))
+    return {"macro: broadcast to %d clients" % len(clids): result(samples, "ms")}
+
+
+def event_throughput(server, event_handler, clids, admin):
+    """
+    An admin drags the clients between two channels, the moves reach an EventHandler observer.
+    """
+    moved = []
+    event_handler.add_observer(moved.append, Events.ClientMovedEvent)
+    samples = []
+    for i in range(REPEAT):
+        calibration = calibrate()
+        expected = len(moved) + len(clids)
+        start = time.monotonic()
+        server.mass_move(2 - i % 2, clids, invokerid=admin)
+        wait_for(lambda: len(moved) >= expected)
+        samples.append((len(clids) / (time.monotonic() - start), calibration))
+    event_handler.remove_observer(moved.append, Events.ClientMovedEvent)
+    return {"macro: client moves through EventHandler": result(samples, "events/s", "higher")}
+
+
+def afkmover_tick(server, conn, command_handler, event_handler, clids):
+    """
+    One poll of the AfkMover over all clients, AWAY of them away and to be moved.
+    """
+    # The plugin registers its commands and observers when it is imported
+    Moduleloader.command_handler = command_handler
+    Moduleloader.event_handler = event_handler
+    from modules import afkmover
+    mover = afkmover.AfkMover(threading.Event(), conn)
+    afkmover.afkMover = mover
+    afkmover.bot = type("StubBot", (), {"ts3conn": conn})
+    away = clids[:AWAY]
+    for i, clid in enumerate(clids):
+        server.update_client(clid, client_away=int(clid in away), client_output_muted=int(i % 10 == 5))
+    samples = []
+    for _ in range(REPEAT):
+        for clid in away:
+            server.update_client(clid, cid=1)
+        calibration = calibrate()
+        start = time.monotonic()
+        mover.update_afk_list()
+        mover.move_all_back()
+        mover.move_all_afk()
+        samples.append(((time.monotonic() - start) * 1000, calibration))
+        assert all(server.clients[clid]["cid"] == int(mover.afk_channel) for clid in away)
+    return {"macro: afkmover tick (%d clients)" % len(clids): result(samples, "ms")}
+
+
+def run():
+    """
+    Runs all benchmarks once.
+    :return: Results by name.
+    :rtype: dict[str, dict]
+    """
+    results = micro_benchmarks()
+    results.update(macro_benchmarks())
+    return results
+
+
+def best_of(results, other):
+    """
+    :return: The better result of two runs per benchmark, by the value relative to the calibration.
+    :rtype: dict[str, dict]
+    """
+    best = {}
+    for name, current in results.items():
+        candidate = other.get(name, current)
+        if current["better"] == "higher":
+            best[name] = max(current, candidate, key=lambda r: r["relative"])
+        else:
+            best[name] = min(current, candidate, key=lambda r: r["relative"])
+    return best
+
+
+def median_of(runs):
+    """
+    :return: The median result of several runs per benchmark, by the value relative to the calibration.
+    :rtype: dict[str, dict]
+    """
+    return {name: sorted((run_results[name] for run_results in runs), key=lambda r: r["relative"])[len(runs) // 2]
+            for name in runs[0]}
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the results next to the baseline. Both are compared relative to the calibration
+    measured next to them, the baseline column shows what that ratio means on this machine now.
+    :return: Names of the results that are more than threshold worse than the baseline.
+    :rtype: list[str]
+    """
+    regressions = []
+    print("%-46s %12s %12s %9s" % ("benchmark", "baseline", "current", "change"))
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or "relative" not in base:
+            print("%-46s %12s %12.3f %9s  %s" % (name, "-", current["value"], "", current["unit"]))
+            continue
+        # The relative values are value / calibration, or value * calibration if higher is better
+        expected = current["value"] * base["relative"] / current["relative"]
+        change = current["relative"] / base["relative"] - 1
+        if current["better"] == "higher":
+            regressed = current["relative"] * (1 + threshold) < base["relative"]
+        else:
+            regressed = current["relative"] > base["relative"] * (1 + threshold)
+        if regressed:
+            regressions.append(name)
+        print("%-46s %12.3f %12.3f %+8.1f%%  %s%s" % (name, expected, current["value"], change * 100,
+                                                     current["unit"], "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def write_report(path, results):
+    report = {
+        "environment": {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                        "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare to")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline, 0.25 for 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--attempts", type=int, default=3,
+                        help="runs before a regression is reported, the best result of all runs counts. "
+                             "With --update-baseline, the median of this many runs is stored")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.update_baseline:
+        # A typical run, not a lucky one, so later runs on the same machine can reach it
+        write_report(args.baseline, median_of([run() for _ in range(max(1, args.attempts))]))
+        print("Baseline written to", args.baseline)
+        return 0
+    results = run()
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        print("No baseline at %s, run with --update-baseline first" % args.baseline)
+        baseline = {}
+    regressions = compare(results, baseline, args.threshold)
+    for attempt in range(2, args.attempts + 1):
+        if not regressions:
+            break
+        # Other load on the machine only makes results worse, a real regression shows in every run
+        print("Measuring again (%d/%d) to confirm the regressions" % (attempt, args.attempts))
+        results = best_of(results, run())
+        regressions = compare(results, baseline, args.threshold)
+    if args.output:
+        write_report(args.output, results)
+    if regressions:
+        print("%d regression(s) beyond %.0f%%: %s" % (len(regressions), args.threshold * 100, ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,7 @@ import sys
 import logging
 import threading
 import os
-from ts3.utilities import TS3ConnectionClosedException
+from ts3.utilities import TS3ConnectionClosedException, TS3ReconnectingException
 
 logger: logging.Logger | None = None
 bot = None
@@ -43,6 +43,9 @@ def main():
     def run(*args, **kwargs):
         try:
             run_old(*args, **kwargs)
+        except TS3ReconnectingException:
+            # The connection is being restored, only this thread is lost
+            sys.excepthook(*sys.exc_info())
         except (KeyboardInterrupt, SystemExit, TS3ConnectionClosedException):
             # This is a very ungraceful exit!
             os._exit(-1)
@@ -4,7 +4,7 @@ from __future__ import annotations
 import datetime
 from threading import Thread
 import traceback
-from typing import Dict
+from typing import Dict, List
 import random
 
 from Moduleloader import *
@@ -177,9 +177,10 @@ class AfkMover(Thread):
         Update the list of clients.
         """
         try:
-            afk_list = self.ts3conn.clientlist(["away", "voice"])
-            self.afk_list = [client for client in afk_list if client.get('client_type', '1') == '0']  # ignore bots
-            AfkMover.logger.debug("Awaylist: " + str(self.afk_list))
+            # Only a few fields per client are read, so let them be decoded on demand
+            afk_list = self.ts3conn.clientlist(["away", "voice"], lazy=True)
+            self.afk_list = afk_list.where(client_type='0')  # ignore bots
+            AfkMover.logger.debug("Awaylist: %s", self.afk_list)
         except TS3Exception:
             AfkMover.logger.exception("Error getting away list!")
             self.afk_list = list()
@@ -190,10 +191,9 @@ class AfkMover(Thread):
         :return: List of clients that are set to afk.
         """
         if self.afk_list is not None:
-            AfkMover.logger.debug(str(self.afk_list))
+            AfkMover.logger.debug("%s", self.afk_list)
             awaylist = list()
             for client in self.afk_list:
-                AfkMover.logger.debug(str(self.afk_list))
                 if "cid" not in client.keys():
                     AfkMover.logger.error("Client without cid!")
                     AfkMover.logger.error(str(client))
@@ -260,20 +260,28 @@ class AfkMover(Thread):
         :param clients: List of clients to move.
         """
         AfkMover.logger.info("Moving clients to afk!")
+        # Group the clients by target channel, every group is moved with one query
+        targets: Dict[int | str, List[int]] = dict()
         for client in clients:
             AfkMover.logger.info("Moving somebody to afk!")
-            AfkMover.logger.debug("Client: " + str(client))
+            AfkMover.logger.debug("Client: %s", client)
+            cid = self.afk_channel
+            if client.get("client_nickname", '').lower() in ('aqer', 'krami'):
+                cid = 90
+            targets.setdefault(cid, []).append(int(client.get("clid", '-1')))
+        for cid, clids in targets.items():
             try:
-                cid = self.afk_channel
-                if client.get("client_nickname", '').lower() in ('aqer', 'krami'):
-                    cid = 90
-                self.ts3conn.clientmove(cid, int(client.get("clid", '-1')))
+                result = self.ts3conn.clientmove_many(cid, clids)
             except TS3Exception:
-                AfkMover.logger.exception("Error moving client! Clid=" + str(client.get("clid", '-1')))
+                AfkMover.logger.exception("Error moving clients! Clids=" + str(clids))
+                continue
+            for clid, ex in result.failed.items():
+                AfkMover.logger.error("Error moving client! Clid=" + str(clid) + ": " + str(ex))
+        for client in clients:
             self.client_channels[client.get("clid", '-1')] = client.get("cid", '0')
             if client.get("clid", '-1') in self.muted_since:
                 del self.muted_since[client.get("clid", '-1')]
-            AfkMover.logger.debug("Moved List after move: " + str(self.client_channels))
+        AfkMover.logger.debug("Moved List after move: %s", self.client_channels)
 
     def move_all_afk(self):
         """
@@ -299,7 +307,8 @@ class AfkMover(Thread):
                 AfkMover.logger.debug("Client: " + str(client))
                 AfkMover.logger.debug("Saved channel list keys:" + str(self.client_channels))
                 cid = self.client_channels.get(client.get("clid", -1))
-                channels = {c.get('cid', -1): c for c in bot.ts3conn.channellist() if c.get('pid', -1) == '15'}
+                channels = {c.get('cid', -1): c for c in bot.server_state.current().channels.values()
+                            if c.get('pid', -1) == '15'}
                 if int(channels.get(cid, {}).get('total_clients', 1)) == 0:
                     # find max
                     cid = max(channels, key=lambda e: int(channels[e].get('total_clients', 0)))
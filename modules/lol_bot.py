@@ -17,6 +17,7 @@ from Moduleloader import *
 import Bot
 from modules.lol_client import LolUser, LolGame, LolRank
 from ts3.TS3Connection import TS3Connection
+from ts3.utilities import TS3Exception
 
 LOL_DATA_FILE = 'lol_names.json'
 MAX_CHANNEL_LEN = 40
@@ -389,10 +390,13 @@ class LolBot(Thread):
             try:
                 if not await self.update_ranks_scheduled():
                     # don't update games if ranks were updated to prevent sending too many requests
-                    if sum(1 for c in bot.ts3conn.clientlist() if c.get("client_type", '1') == '0') > 1:
+                    if len(bot.server_state.current().voice_clients()) > 1:
                         # only display games if users are online
                         games = await self.get_games()
                         await self.update_games_channels(games)
+            except TS3Exception:
+                # E.g. the server state could not be loaded, try again with the next run
+                self.logger.exception("Error querying the server")
             except ClientResponseError as e:
                 if e.status == 503:
                     # Service Unavailable
@@ -79,60 +79,56 @@ def multi_move(sender, msg):
             return
     source_name = channels[0]
     dest_name = channels[1]
-    try:
-        channel_matches = ts3conn.channelfind(source_name)
-        channel_candidates = [chan for chan in channel_matches if
-                              chan.get("channel_name", '-1').startswith(source_name)]
-        if len(channel_candidates) == 1:
-            source = channel_candidates[0].get("cid", '-1')
-        elif len(channel_candidates) == 0:
-            Bot.send_msg_to_client(ts3conn, sender, "Source channel could not be found.")
-        else:
-            channels = [chan.get('channel_name') for chan in channel_candidates]
-            Bot.send_msg_to_client(ts3conn, sender, "Multiple source channels found: " + ", ".join(channels))
-    except TS3QueryException:
-        Bot.send_msg_to_client(ts3conn, sender, "Source channel not found")
-    try:
-        channel_matches = ts3conn.channelfind(dest_name)
-        channel_candidates = [chan for chan in channel_matches if chan.get("channel_name",
-                                                                           '-1').startswith(dest_name)]
-        if len(channel_candidates) == 1:
-            dest = channel_candidates[0].get("cid", '-1')
-        elif len(channel_candidates) == 0:
-            Bot.send_msg_to_client(ts3conn, sender, "Destination channel could not be found.")
-        else:
-            channels = [chan.get('channel_name') for chan in channel_candidates]
-            Bot.send_msg_to_client(ts3conn, sender, "Multiple destination channels found: " + ", ".join(channels))
-    except TS3QueryException:
-        Bot.send_msg_to_client(ts3conn, sender, "Destination channel not found")
+    # Channels and clients are looked up in the mirrored state instead of querying the server
+    state = bot.server_state.current()
+    channel_candidates = [chan for chan in state.find_channels(source_name) if
+                          chan.get("channel_name", '-1').startswith(source_name)]
+    if len(channel_candidates) == 1:
+        source = channel_candidates[0].get("cid", '-1')
+    elif len(channel_candidates) == 0:
+        Bot.send_msg_to_client(ts3conn, sender, "Source channel could not be found.")
+    else:
+        channels = [chan.get('channel_name') for chan in channel_candidates]
+        Bot.send_msg_to_client(ts3conn, sender, "Multiple source channels found: " + ", ".join(channels))
+    channel_candidates = [chan for chan in state.find_channels(dest_name) if chan.get("channel_name",
+                                                                                     '-1').startswith(dest_name)]
+    if len(channel_candidates) == 1:
+        dest = channel_candidates[0].get("cid", '-1')
+    elif len(channel_candidates) == 0:
+        Bot.send_msg_to_client(ts3conn, sender, "Destination channel could not be found.")
+    else:
+        channels = [chan.get('channel_name') for chan in channel_candidates]
+        Bot.send_msg_to_client(ts3conn, sender, "Multiple destination channels found: " + ", ".join(channels))
 
     if source and dest:
         try:
-            client_list = ts3conn.clientlist()
-            client_list = [client for client in client_list if client.get("cid", '-1') == source]
+            client_list = [client for client in state.clients.values() if client.get("cid", '-1') == source]
             for client in client_list:
                 clid = client.get("clid", '-1')
                 logger.info("Found client in channel: " + client.get("client_nickname", "") + " id = " + clid)
-                ts3conn.clientmove(int(dest), int(clid))
+            result = ts3conn.clientmove_many(int(dest), [int(client.get("clid", '-1')) for client in client_list])
+            for clid, e in result.failed.items():
+                Bot.send_msg_to_client(ts3conn, sender, "Error moving client " + str(clid) + ": id = " +
+                                       str(e.id) + e.message)
         except TS3QueryException as e:
             Bot.send_msg_to_client(ts3conn, sender, "Error moving clients: id = " +
                                    str(e.id) + e.message)
 
 
 def send_message_to_everyone(conn, message):
-    client_list = conn.clientlist()
-    for client in client_list:
-        if client.get("client_type", '1') == '0':
-            # don't message ServerQuery clients
-            Bot.send_msg_to_client(conn, client.get("clid", '-1'), message)
+    # don't message ServerQuery clients
+    clids = conn.clientlist(lazy=True).where(client_type='0').column("clid")
+    result = conn.sendtextmessage_many(clids, message)
+    for clid, e in result.failed.items():
+        logger.error("Error sending a message to clid " + str(clid) + ": " + str(e))
 
 
 def poke_message_to_everyone(conn, message):
-    client_list = conn.clientlist()
-    for client in client_list:
-        if client.get("client_type", '1') == '0':
-            # don't poke ServerQuery clients
-            Bot.poke_msg_to_client(conn, client.get("clid", '-1'), message)
+    # don't poke ServerQuery clients
+    clids = conn.clientlist(lazy=True).where(client_type='0').column("clid")
+    result = conn.clientpoke_many(clids, message)
+    for clid, e in result.failed.items():
+        logger.error("Error poking a message to clid " + str(clid) + ": " + str(e))
 
 
 @command('pokeeveryone', )
@@ -229,7 +225,7 @@ def maketeams(sender, msg):
     number_of_teams = int(args)
 
     # get clients and put in teams
-    clients = bot.ts3conn.clientlist()
+    clients = list(bot.server_state.current().clients.values())
 
     # get channel id
     cid = None
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from unittest import TestCase
+
+# The command handler logs to logs/
+os.makedirs("logs", exist_ok=True)
+
+# Bot has to be imported before CommandHandler, which imports it
+import Bot  # noqa: F401
+import CommandHandler
+from ClientInfo import ClientInfoCache
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.ServerState import ServerState
+from ts3.TS3Connection import TS3Connection
+
+
+class TestClientInfoCache(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=3, channels=2, servergroups=("Kaiser", "Normal"))
+        self.conn = TS3Connection(port=self.server.start_in_thread())
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+        self.state = ServerState(self.conn, reconcile_interval=0)
+        self.client_infos = ClientInfoCache(self.conn, self.state)
+        self.conn.register_for_server_events()
+        self.conn.add_event_sink(self.state.handle_event)
+        self.conn.add_event_sink(self.client_infos.handle_event)
+        self.conn.add_command_sink(self.client_infos.on_command)
+        self.state.start()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "State was not updated")
+            time.sleep(0.001)
+
+    def test_known_clients_need_no_query(self):
+        counts = dict(self.server.command_counts)
+        info = self.client_infos.get(1)
+        self.assertIs(info, self.client_infos.get("1"))
+        self.assertEqual(["Normal"], info.servergroups)
+        self.assertEqual("User 1", info.name)
+        self.assertEqual("127.0.0.1", info.ip)
+        self.assertEqual("Linux", info.platform)
+        clid = self.server.add_client("Admin", servergroups=("Kaiser",))
+        self.wait_for(lambda: self.state.snapshot.client(clid) is not None)
+        self.assertTrue(self.client_infos.get(clid).is_in_servergroups("Kaiser"))
+        self.assertEqual(counts, dict(self.server.command_counts))
+        self.assertEqual((1, 2), (self.client_infos.hits, self.client_infos.misses))
+
+    def test_refresh_and_eviction(self):
+        before = self.client_infos.get(1)
+        # Server group changes are not announced, the next reload picks them up
+        self.server.update_client(1, client_servergroups="6")
+        self.client_infos.prefetch()
+        self.assertEqual(["Normal"], before.servergroups)
+        self.assertEqual(["Kaiser"], self.client_infos.get(1).servergroups)
+        self.server.remove_client(1)
+        self.wait_for(lambda: 1 not in self.client_infos._entries)
+
+    def test_properties_missing_in_the_mirror(self):
+        clid = self.server.add_client("Newcomer")
+        self.wait_for(lambda: self.state.snapshot.client(clid) is not None)
+        self.assertNotIn("client_platform", self.state.snapshot.client(clid),
+                         "Enter events do not contain the platform")
+        info = self.client_infos.get(clid)
+        counts = dict(self.server.command_counts)
+        self.assertEqual(("127.0.0.1", "Linux", "3.6.2"), (info.ip, info.platform, info.version))
+        self.assertEqual("1", info.total_connections)
+        self.assertEqual(counts.get("clientinfo", 0) + 1, self.server.command_counts["clientinfo"],
+                         "Missing properties should be queried once")
+        known = self.client_infos.get(1)
+        self.assertEqual("Linux", known.platform)
+        self.assertEqual(counts.get("clientinfo", 0) + 1, self.server.command_counts["clientinfo"])
+        self.assertEqual("0", known.created)
+        self.assertEqual("1000", known.connected_time)
+        self.assertEqual(counts.get("clientinfo", 0) + 2, self.server.command_counts["clientinfo"])
+
+    def test_servergroup_commands_reload(self):
+        self.assertEqual(["Normal"], self.client_infos.get(1).servergroups)
+        reloads = self.state.reloads
+        release = threading.Event()
+        reload = self.state.reload
+        self.state.reload = lambda: release.wait(5) and reload()
+        self.conn.servergroupaddclient(sgid=6, cldbid=1001)
+        # The reload runs in the background, lookups do not wait for it
+        self.assertEqual(["Normal"], self.client_infos.get(1).servergroups)
+        release.set()
+        self.wait_for(lambda: self.client_infos.get(1).is_in_servergroups("Kaiser"))
+        self.assertEqual(reloads + 1, self.state.reloads, "The mirror should be reloaded once")
+        self.conn.servergroupdelclient_many(6, [1001])
+        self.wait_for(lambda: not self.client_infos.get(1).is_in_servergroups("Kaiser"))
+        self.assertEqual(reloads + 2, self.state.reloads)
+
+    def test_permissions_from_cache_confirmed_before_denying(self):
+        calls = []
+
+        def handler(sender, msg):
+            calls.append(sender)
+        handler.allowed_groups = ["Kaiser"]
+        command_handler = CommandHandler.CommandHandler(self.conn, client_infos=self.client_infos)
+        command_handler.add_handler(handler, "secret")
+        self.server.update_client(2, client_servergroups="6")
+        self.state.reload()
+        counts = dict(self.server.command_counts)
+        command_handler.handle_command("!secret", sender=2)
+        self.assertEqual([2], calls)
+        self.assertEqual(counts, dict(self.server.command_counts), "Known clients should need no query")
+        # Changed by someone else, the mirror does not know yet
+        self.server.update_client(1, client_servergroups="6")
+        command_handler.handle_command("!secret", sender=1)
+        self.assertEqual([2, 1], calls)
+        self.assertEqual(counts.get("clientinfo", 0) + 1, self.server.command_counts["clientinfo"])
+        self.wait_for(lambda: self.client_infos.get(1).is_in_servergroups("Kaiser"))
+        command_handler.handle_command("!secret", sender=3)
+        self.assertEqual([2, 1], calls)
+        self.assertEqual(counts.get("clientinfo", 0) + 2, self.server.command_counts["clientinfo"])
@@ -0,0 +1,148 @@
+import contextlib
+import os
+import threading
+import time
+import types
+from unittest import TestCase, mock
+
+# The event handler logs to logs/
+os.makedirs("logs", exist_ok=True)
+
+import EventHandler
+import Moduleloader
+from ts3.Events import ChannelEditedEvent, ClientEnteredEvent, ClientLeftEvent, ClientMovedEvent
+
+
+def client_events(clid):
+    return [ClientEnteredEvent({"clid": str(clid), "ctid": "1"}),
+            ClientMovedEvent({"clid": str(clid), "ctid": "2"}),
+            ClientLeftEvent({"clid": str(clid), "cfid": "2"})]
+
+
+def new_handler(**kwargs):
+    conn = types.SimpleNamespace(priority=lambda priority: contextlib.nullcontext())
+    return EventHandler.EventHandler(conn, types.SimpleNamespace(inform=lambda evt: None), **kwargs)
+
+
+class TestEventHandler(TestCase):
+    def setUp(self):
+        self.handler = new_handler(workers=4, time_budget=0.2)
+
+    def test_events_of_a_client_in_order(self):
+        handled = []
+        blocked = threading.Event()
+
+        def observer(evt):
+            if evt.client_id == 1 and type(evt) is ClientEnteredEvent:
+                # Client 1 is stuck, the other clients go on
+                blocked.wait(5)
+            handled.append((evt.client_id, type(evt)))
+        self.handler.add_observer(observer, EventHandler.Events.TS3Event)
+        for clid in range(1, 9):
+            for evt in client_events(clid):
+                self.handler.handle_event(evt)
+        # Clients sharing the thread of client 1 wait for it, all others go on
+        lane = lambda clid: hash((observer, str(clid))) % 4
+        others = [clid for clid in range(2, 9) if lane(clid) != lane(1)]
+        self.assertTrue(others)
+        deadline = time.monotonic() + 5
+        while not all(sum(1 for handled_clid, _ in handled if handled_clid == clid) == 3 for clid in others):
+            self.assertLess(time.monotonic(), deadline, "Other clients should not wait for client 1")
+            time.sleep(0.001)
+        self.assertNotIn(1, [clid for clid, _ in handled])
+        blocked.set()
+        self.handler.stop()
+        expected = [type(evt) for evt in client_events(0)]
+        for clid in range(1, 9):
+            self.assertEqual(expected, [evt_type for handled_clid, evt_type in handled if handled_clid == clid],
+                             "Events of one client should reach an observer in order")
+
+    def test_overrun_and_latencies(self):
+        def slow(evt):
+            time.sleep(0.5)
+        self.handler.add_observer(slow, ClientEnteredEvent)
+        with self.assertLogs(EventHandler.EventHandler.logger, "WARNING") as logs:
+            self.handler.handle_event(client_events(1)[0])
+            self.handler.handle_event(client_events(2)[0])
+            self.handler.stop()
+        self.assertEqual(2, len(logs.output), "Every overrunning run should be logged once")
+        self.assertIn("test_EventHandler.TestEventHandler.test_overrun_and_latencies.<locals>.slow", logs.output[0])
+        self.assertIn("exceeding its budget of 0.2s", logs.output[0])
+        self.assertIn("time.sleep(0.5)", logs.output[0], "The stack of the observer should be logged")
+        histogram = self.handler.latencies["test_EventHandler.TestEventHandler.test_overrun_and_latencies.<locals>.slow"]
+        self.assertEqual(2, histogram.count)
+        self.assertGreaterEqual(histogram.sum, 1.0)
+
+    def test_stop_ends_the_watchdog(self):
+        self.assertTrue(self.handler._watchdog.is_alive())
+        self.handler.stop()
+        self.assertFalse(self.handler._watchdog.is_alive())
+
+    def test_observers_changing_while_collecting(self):
+        handler = self.handler
+
+        def first(evt):
+            pass
+
+        def second(evt):
+            pass
+
+        class RemovingDict(dict):
+            def get(self, key, default=None):
+                # Another thread removes an observer after the observers of ClientEnteredEvent were read
+                if key is EventHandler.Events.TS3Event and second in dict.get(self, ClientEnteredEvent, ()):
+                    handler.remove_observer(second, ClientEnteredEvent)
+                return dict.get(self, key, default)
+        handler.add_observer(first, ClientEnteredEvent)
+        handler.add_observer(second, ClientEnteredEvent)
+        handler.observers = RemovingDict(handler.observers)
+        event = client_events(1)[0]
+        self.assertEqual({first, second}, set(handler.get_obs_for_event(event)))
+        self.assertEqual((first,), handler.get_obs_for_event(event), "Removed observers must not stay cached")
+        handler.stop()
+
+
+class TestEventCoalescer(TestCase):
+    def setUp(self):
+        self.handler = new_handler()
+        self.addCleanup(self.handler.stop)
+        self.batches = []
+        self.informed = threading.Event()
+
+    def observer(self, events):
+        self.batches.append((time.monotonic(), events))
+        self.informed.set()
+
+    def wait_for_batch(self):
+        self.assertTrue(self.informed.wait(5), "Observer was not informed")
+        self.informed.clear()
+        return self.batches[-1][1]
+
+    def test_last_event_per_key_after_window(self):
+        with mock.patch.object(Moduleloader, "event_handler", self.handler):
+            Moduleloader.debounced_event(0.1, ClientMovedEvent, ChannelEditedEvent)(self.observer)
+        moves = [ClientMovedEvent({"clid": str(clid), "ctid": str(ctid)}) for ctid in (1, 2, 3) for clid in (1, 2)]
+        edits = [ChannelEditedEvent({"cid": "1", "invokerid": "5", "channel_name": name}) for name in ("a", "b")]
+        start = time.monotonic()
+        for evt in moves[:3] + edits + moves[3:]:
+            self.handler.handle_event(evt)
+        batch = self.wait_for_batch()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1, "Events should be held back for the window")
+        # Ordered by the last event per key
+        self.assertEqual([edits[1], moves[4], moves[5]], batch)
+        self.handler.handle_event(moves[0])
+        self.assertEqual([moves[0]], self.wait_for_batch(), "A new window should start after a flush")
+        self.assertEqual(2, len(self.batches))
+
+    def test_max_wait_while_events_keep_coming(self):
+        self.handler.add_coalescing_observer(self.observer, [ClientMovedEvent], 0.1, max_wait=0.3,
+                                                         key=lambda evt: evt.data["ctid"])
+        start = time.monotonic()
+        sent = 0
+        while not self.batches and time.monotonic() - start < 2:
+            self.handler.handle_event(ClientMovedEvent({"clid": str(sent), "ctid": str(sent % 2)}))
+            sent += 1
+            time.sleep(0.02)
+        batch = self.wait_for_batch()
+        self.assertLess(self.batches[0][0] - start, 0.3 + 0.15, "Events should not be delayed past max_wait")
+        self.assertEqual(["0", "1"], sorted(evt.data["ctid"] for evt in batch), "The key function should be used")
@@ -0,0 +1,361 @@
+"""Asyncio variant of the TS3Api connection"""
+import asyncio
+import logging
+from collections import deque
+
+from ts3.Events import TS3Event
+from ts3.TS3Connection import TS3Connection, TS3QueryException
+from ts3.utilities import TS3ConnectionClosedException
+
+
+class AsyncTS3Connection:
+    """
+    Connection class for the TS3 API built on asyncio streams. Queries are pipelined, every query
+    gets a future that is resolved by the receiving task, and notify events are delivered through
+    an async iterator instead of blinker signals and threads.
+
+    Use AsyncTS3Connection.connect to create a connection:
+        conn = await AsyncTS3Connection.connect(host, port, username, password)
+        await conn.use(1)
+        await conn.register_for_server_events()
+        async for event in conn.events():
+            ...
+    """
+    # Longest response line in bytes. The server sends a whole response on one line, a clientlist
+    # of 600 clients is already about 117 KB, far above the 64 KiB default of asyncio streams.
+    STREAM_LIMIT = 16 * 1024 * 1024
+
+    def __init__(self, reader, writer, log_file="api.log", event_queue_size=0):
+        """
+        Creates a new AsyncTS3Connection on already opened streams. The greeting has to be consumed
+        already, use AsyncTS3Connection.connect instead of calling this directly.
+        :param reader: Stream to read from.
+        :param writer: Stream to write to.
+        :param log_file: File to log warnings and errors to.
+        :param event_queue_size: Maximum number of buffered events, 0 for unbounded.
+        :type reader: asyncio.StreamReader
+        :type writer: asyncio.StreamWriter
+        :type log_file: str
+        :type event_queue_size: int
+        """
+        self._reader = reader
+        self._writer = writer
+        self._logger = logging.getLogger(__name__)
+        self._logger.propagate = 0
+        self._logger.setLevel(logging.WARNING)
+        if not self._logger.hasHandlers():
+            file_handler = logging.FileHandler(log_file, mode='a+')
+            file_handler.setLevel(logging.WARNING)
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            file_handler.setFormatter(formatter)
+            self._logger.addHandler(file_handler)
+        self._pending = deque()
+        self._events = asyncio.Queue(event_queue_size)
+        self._closed = False
+        self._recv_task = asyncio.get_running_loop().create_task(self._recv())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=10011, username=None, password=None,
+                      log_file="api.log", event_queue_size=0, limit=STREAM_LIMIT):
+        """
+        Opens a new connection and logs in if credentials are given.
+        :param host: Host to connect to. Can be an IP address or a hostname.
+        :param port: Port to connect to.
+        :param username: Query login name.
+        :param password: Query password.
+        :param log_file: File to log warnings and errors to.
+        :param event_queue_size: Maximum number of buffered events, 0 for unbounded.
+        :param limit: Longest response line in bytes, longer lines close the connection.
+        :type limit: int
+        :return: Connected AsyncTS3Connection
+        :rtype: AsyncTS3Connection
+        """
+        reader, writer = await asyncio.open_connection(host, port, limit=limit)
+        # Greeting: "TS3" and the welcome message
+        await reader.readuntil(b"\n\r")
+        await reader.readuntil(b"\n\r")
+        conn = cls(reader, writer, log_file=log_file, event_queue_size=event_queue_size)
+        if username is not None and password is not None:
+            await conn.login(username, password)
+        return conn
+
+    # Parsing is shared with the threaded connection
+    _parse_resp = staticmethod(TS3Connection._parse_resp)
+    _parse_resp_to_dict = staticmethod(TS3Connection._parse_resp_to_dict)
+    _parse_resp_to_list_of_dicts = staticmethod(TS3Connection._parse_resp_to_list_of_dicts)
+
+    async def _send(self, command, args=None, args_group=None):
+        """
+        Sends a query and waits for its response. Other queries can be sent while waiting.
+        :param command: Command to send.
+        :param args: Parameter to send, will be escaped.
+        :param args_group: Command group to send (separated by |), will be escaped.
+        :return: Query response.
+        :rtype: bytes
+        :type command: str
+        :type args: list[str]
+        :type args_group: list[list[str]]
+        """
+        if self._closed:
+            raise TS3ConnectionClosedException("Connection is closed")
+        query = TS3Connection._build_query(command, args, args_group)
+        future = asyncio.get_running_loop().create_future()
+        # Writing and registering happen without a suspension point in between, so the order
+        # of _pending always matches the order on the wire.
+        self._pending.append((query.decode(), future, []))
+        self._writer.write(query)
+        await self._writer.drain()
+        return await future
+
+    async def _recv(self):
+        """
+        Receiving task. Events are put into the event queue, everything else is handed to the
+        pending queries.
+        """
+        try:
+            while True:
+                resp = (await self._reader.readuntil(b"\n\r"))[:-2]
+                data = self._parse_resp(resp)
+                if isinstance(data, TS3Event):
+                    if self._events.full():
+                        self._logger.warning("Event queue full, dropping %s", str(type(data)))
+                    else:
+                        self._events.put_nowait(data)
+                elif data is not None:
+                    self._resolve_pending(data)
+        except (asyncio.IncompleteReadError, ConnectionError) as ex:
+            if not self._closed:
+                self._logger.error("Connection closed: %s", str(ex))
+        except Exception:
+            # E.g. asyncio.LimitOverrunError for a line longer than the stream limit. The stream
+            # can not be resynchronized, so the connection is given up like a closed one.
+            self._logger.exception("Error receiving, closing the connection")
+        finally:
+            self._closed = True
+            self._writer.close()
+            while self._pending:
+                _query, future, _chunks = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(TS3ConnectionClosedException("Connection closed"))
+            # Wake up the event iterator even if the queue is bounded and full
+            if self._events.full():
+                self._events.get_nowait()
+            self._events.put_nowait(None)
+
+    def _resolve_pending(self, data):
+        """
+        Hands a received response line to the oldest pending query.
+        :param data: Response line, split by " " for "error" lines.
+        :type data: bytes | list[bytes]
+        """
+        if not self._pending:
+            self._logger.warning("Received response without pending query: %s", str(data))
+            return
+        query, future, chunks = self._pending[0]
+        if not isinstance(data, list):
+            chunks.append(data)
+            return
+        self._pending.popleft()
+        if future.cancelled():
+            return
+        if data[1] != b'id=0':
+            future.set_exception(TS3QueryException(
+                int(data[1].decode(encoding='UTF-8').split("=", 1)[1]),
+                data[2].decode(encoding='UTF-8').split("=", 1)[1],
+                query,
+            ))
+        else:
+            future.set_result(b''.join(chunks))
+
+    async def events(self):
+        """
+        Async iterator over all events received on this connection. Ends when the connection is
+        closed.
+        :rtype: collections.abc.AsyncIterator[TS3Event]
+        """
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+    async def login(self, user, password):
+        """
+        Login with query credentials.
+        :param user: Username to login with.
+        :param password: Password to login with.
+        :type user: str
+        :type password: str
+        """
+        await self._send("login", [user, password])
+
+    async def use(self, sid):
+        """
+        Chose the virtual server to use.
+        :param sid: SID of the virtual server to use.
+        :type sid: int
+        """
+        await self._send("use", [str(sid)])
+
+    async def whoami(self):
+        """
+        Returns info of the query client.
+        :return: Dictionary of query client information.
+        :rtype: dict[str, str]
+        """
+        return self._parse_resp_to_dict(await self._send("whoami"))
+
+    async def clientlist(self, params=None):
+        """
+        Get a clientlist from the server.
+        :param params: List of parameters strings to use.
+        :type params: list[str]
+        :return: List of clients
+        :rtype: list[dict[str, str]]
+        """
+        args = ["-" + param for param in params or []]
+        return self._parse_resp_to_list_of_dicts(await self._send("clientlist", args))
+
+    async def clientinfo(self, client_id):
+        """
+        Returns clientinfo for a client specified by its id.
+        :param client_id: Id of the client.
+        :return: Dictionary of client information.
+        :rtype: dict[str,str]
+        """
+        return self._parse_resp_to_dict(await self._send("clientinfo", ["clid=" + str(client_id)]))
+
+    async def channellist(self, params=None):
+        """
+        Returns the channel list.
+        :param params: Optional parameters as defined by the serverquery manual.
+        :return: List of channels
+        :rtype: list[dict[str, str]]
+        """
+        args = ["-" + param for param in params or []]
+        return self._parse_resp_to_list_of_dicts(await self._send("channellist", args))
+
+    async def channelfind(self, pattern):
+        """
+        Returns all channels with a name corresponding to pattern.
+        :param pattern: Pattern to look for.
+        :return: List of channels.
+        :rtype: list[dict[str, str]]
+        """
+        return self._parse_resp_to_list_of_dicts(await self._send("channelfind", ["pattern=" + pattern]))
+
+    async def servergrouplist(self):
+        """
+        Returns a list of all servergroups with corresponding info.
+        :return: List of servergroups.
+        :rtype: list[dict[str, str]]
+        """
+        return self._parse_resp_to_list_of_dicts(await self._send("servergrouplist"))
+
+    async def clientmove(self, channel_id, client_id):
+        """
+        Move a client to another channel.
+        :param channel_id: Channel to move client to.
+        :param client_id: Id of the client to move.
+        :type channel_id: int
+        :type client_id: int
+        """
+        await self._send("clientmove", ["cid=" + str(channel_id), "clid=" + str(client_id)])
+
+    async def clientupdate(self, params=None):
+        """
+        Update the query clients data.
+        :param params: List of parameters to update in the form param=value.
+        :type params: list[str]
+        """
+        await self._send("clientupdate", params or [])
+
+    async def sendtextmessage(self, targetmode, target, msg):
+        """
+        Sends a textmessage to the specified target.
+        :param targetmode: 1: private message 2: textchannel 3: servertext
+        :param target: client_id/channel_id
+        :param msg: Message to send.
+        :type targetmode: int
+        :type target: int
+        :type msg: str
+        """
+        await self._send("sendtextmessage",
+                         ["targetmode=" + str(targetmode), "target=" + str(target), "msg=" + str(msg)])
+
+    async def register_for_server_events(self):
+        """
+        Register for server events, they are delivered by events().
+        """
+        await self._send("servernotifyregister", ["event=server"])
+
+    async def register_for_channel_events(self, channel_id):
+        """
+        Register for channel events, they are delivered by events().
+        :param channel_id: Channel to register to, use 0 for all channels
+        :type channel_id: int | str
+        """
+        await self._send("servernotifyregister", ["event=channel", "id=" + str(channel_id)])
+
+    async def register_for_server_messages(self):
+        """
+        Register for server messages, they are delivered by events().
+        """
+        await self._send("servernotifyregister", ["event=textserver"])
+
+    async def register_for_channel_messages(self):
+        """
+        Register for channel messages, they are delivered by events().
+        """
+        await self._send("servernotifyregister", ["event=textchannel"])
+
+    async def register_for_private_messages(self):
+        """
+        Register for private messages, they are delivered by events().
+        """
+        await self._send("servernotifyregister", ["event=textprivate"])
+
+    async def keepalive_loop(self, interval=5):
+        """
+        Sends keepalive messages every interval seconds until the connection is closed. Meant to
+        be run as a task.
+        :param interval: Seconds to wait between keepalive messages.
+        :type interval: int
+        """
+        while not self._closed:
+            await asyncio.sleep(interval)
+            await self._send("whoami")
+
+    async def quit(self):
+        """
+        Sends the quit command and closes the connection.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._writer.write(b"quit\n\r")
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        self._writer.close()
+        await self._recv_task
+
+    def __getattr__(self, item):
+        """
+        Manages unknown functions by sending the command to the ts3server, like
+        TS3Connection.__getattr__ but awaitable.
+        e.g. usage for 'clientdblist start=1 -count': await conn.clientdblist('count', start=1)
+        :param item: name of the function
+        :return: wrapper
+        """
+
+        async def wrapper(*args, **kwargs):
+            resp = await self._send(item,
+                                    ['-{}'.format(x) for x in args] + ['{}={}'.format(x[0], x[1]) for x in
+                                                                       kwargs.items()])
+            if resp:
+                parsed_resp = self._parse_resp_to_list_of_dicts(resp)
+                return parsed_resp[0] if len(parsed_resp) == 1 else parsed_resp
+
+        return wrapper
@@ -0,0 +1,119 @@
+"""Dispatching of received events to a fixed set of worker threads"""
+import logging
+import queue
+import threading
+import time
+
+from ts3.metrics import Histogram
+
+# Put into a queue to stop its worker
+_STOP = object()
+
+
+def event_key(event):
+    """
+    Key of events that have to be handled in order: the client the event is about, the invoker or
+    the channel.
+    :type event: TS3Event
+    :rtype: str
+    """
+    data = event.data
+    return data.get("clid") or data.get("invokerid") or data.get("cid") or event.event_type.name
+
+
+class EventDispatcher:
+    """
+    Runs event handlers on a fixed number of worker threads, each fed by its own bounded queue.
+    Work items with the same key (e.g. the client id of an event) always go to the same worker,
+    so they are handled in the order they were received. If the queue of a worker is full, the
+    item is dropped instead of blocking the receiving thread.
+    """
+
+    def __init__(self, workers=4, queue_size=1000, name="ts3-events"):
+        """
+        Creates a new EventDispatcher and starts its workers.
+        :param workers: Number of worker threads.
+        :param queue_size: Maximum number of waiting items per worker.
+        :param name: Prefix of the worker thread names.
+        :type workers: int
+        :type queue_size: int
+        :type name: str
+        """
+        self._logger = logging.getLogger(__name__)
+        self._queues = [queue.Queue(queue_size) for _ in range(max(1, workers))]
+        self._counter_lock = threading.Lock()
+        self.dispatched = 0
+        self.dropped = 0
+        self.failed = 0
+        # Seconds between submitting an item and its handler starting
+        self.latency = Histogram()
+        self._threads = [threading.Thread(target=self._work, args=(work_queue,), name=name + "-" + str(i),
+                                          daemon=True)
+                         for i, work_queue in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def queue_depth(self):
+        """
+        Number of items waiting in all queues.
+        :rtype: int
+        """
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def submit(self, key, function, *args, **kwargs):
+        """
+        Queues function(*args, **kwargs) on the worker responsible for key, never blocks.
+        :param key: Items with equal keys are handled in order, None to pick the first worker.
+        :param function: Function to call.
+        :type key: collections.abc.Hashable
+        :type function: collections.abc.Callable
+        :return: False if the item was dropped because the queue is full.
+        :rtype: bool
+        """
+        work_queue = self._queues[hash(key) % len(self._queues)] if key is not None else self._queues[0]
+        try:
+            work_queue.put_nowait((time.monotonic(), function, args, kwargs))
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            self._logger.warning("Event queue full, dropped %s (%d dropped so far)", function, self.dropped)
+            return False
+        return True
+
+    def stop(self):
+        """
+        Stops the workers after the queued items were handled.
+        """
+        for work_queue in self._queues:
+            # Blocks if the queue is full, the workers keep emptying it
+            work_queue.put(_STOP)
+
+    def join(self, timeout=None):
+        """
+        Waits for the workers to finish after stop().
+        :param timeout: Seconds to wait per worker, None to wait as long as it takes.
+        :type timeout: float | None
+        """
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, work_queue):
+        """
+        Worker loop, handles the items of one queue until stop() is called.
+        :type work_queue: queue.Queue
+        """
+        while True:
+            item = work_queue.get()
+            if item is _STOP:
+                return
+            submitted, function, args, kwargs = item
+            self.latency.observe(time.monotonic() - submitted)
+            try:
+                function(*args, **kwargs)
+                with self._counter_lock:
+                    self.dispatched += 1
+            except Exception:
+                with self._counter_lock:
+                    self.failed += 1
+                self._logger.exception("Exception in event handler %s", function)
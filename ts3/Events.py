@@ -1,7 +1,5 @@
 """Events generated by the TS3Connection class."""
 import logging
-import sys
-import traceback
 from enum import IntEnum, Enum
 
 
@@ -42,17 +40,75 @@ class ReasonID(IntEnum):
     SERVER_SHUTDOWN = 11
 
 
+class _Field:
+    """
+    Event attribute read from the event data on access, so events only keep the data dictionary.
+    """
+    __slots__ = ("key", "default")
+
+    def __init__(self, key, default=""):
+        """
+        :param key: Key of the value in the event data.
+        :param default: Value if the key is missing.
+        :type key: str
+        :type default: str
+        """
+        self.key = key
+        self.default = default
+
+    def __get__(self, event, owner=None):
+        if event is None:
+            return self
+        return event._data.get(self.key, self.default)
+
+
+class _IntField(_Field):
+    """
+    Event attribute converted to int on first access, the int is kept in the event.
+    """
+    __slots__ = ()
+
+    def __init__(self, key, default="-1"):
+        super().__init__(key, default)
+
+    def __get__(self, event, owner=None):
+        if event is None:
+            return self
+        ints = event._ints
+        if ints is None:
+            ints = event._ints = {}
+        value = ints.get(self.key)
+        if value is None:
+            value = ints[self.key] = int(event._data.get(self.key, self.default))
+        return value
+
+
 class TS3Event:
     """
-    Event class for Teamspeak 3 events. This is a stub for all other events.
+    Event class for Teamspeak 3 events. This is a stub for all other events. Events only keep
+    the data dictionary, attributes are read from it on access.
     """
+    __slots__ = ("_data", "_event_type", "_ints")
     event_type = EventType.UNKNOWN
+    # Ids events are dispatched and followed by, see event_key. They are checked on construction,
+    # so malformed events fail to parse instead of failing while being dispatched
+    _KEY_FIELDS = ("clid", "invokerid", "cid")
 
     def __init__(self, data, event_type=None):
+        """
+        :param data: Event data, all values are strings.
+        :param event_type: Notify name of unknown events.
+        :type data: dict[str, str]
+        :type event_type: str | None
+        :raises ValueError: If one of the ids is not an integer.
+        """
+        for key in self._KEY_FIELDS:
+            if key in data:
+                int(data[key])
         self._data = data
-        if event_type is not None:
-            self._event_type = event_type
-        self._logger = logging.getLogger(__name__)
+        self._event_type = event_type
+        # Key -> value converted by an _IntField, created on the first access
+        self._ints = None
 
     @property
     def data(self):
@@ -66,13 +122,39 @@ class TS3Event:
         :return: Attribute value string
         :rtype: str
         """
-        print(self._data, item)
-        return self._data[item]
+        if item == "_data":
+            raise AttributeError(item)
+        try:
+            return self._data[item]
+        except KeyError:
+            raise AttributeError(item) from None
 
 
 class EventParser:
-    @staticmethod
-    def parse_event(event, event_type):
+    """
+    Creates events from their notify name, see register.
+    """
+    # Notify name -> function creating the event from the event data
+    _factories = {}
+
+    @classmethod
+    def register(cls, notify_name, factory=None):
+        """
+        Registers the event class for a notify name, e.g. for events of a plugin. Can be used as
+        class decorator, @EventParser.register("notifyclientpoke").
+        :param notify_name: First word of the notification, e.g. "notifycliententerview".
+        :param factory: Event class or function creating the event from the event data.
+        :type notify_name: str
+        :type factory: (dict[str, str]) -> TS3Event
+        :return: The factory, or a decorator registering it if no factory was given.
+        """
+        if factory is None:
+            return lambda decorated: cls.register(notify_name, decorated)
+        cls._factories[notify_name] = factory
+        return factory
+
+    @classmethod
+    def parse_event(cls, event, event_type):
         """
         Parse an event.
         :param event: Event dictionary
@@ -82,491 +164,208 @@ class EventParser:
         :return: Parsed Event
         :rtype: TS3Event
         """
-        if EventType.TEXT_MESSAGE.value == event_type:
-            parsed_event = TextMessageEvent(event)
-            return parsed_event
-        if EventType.CLIENT_MOVED.value == event_type:
-            if 'invokerid' in event:
-                parsed_event = ClientMovedEvent(event)
-            else:
-                parsed_event = ClientMovedSelfEvent(event)
-            return parsed_event
-        if EventType.CLIENT_ENTER.value == event_type:
-            parsed_event = ClientEnteredEvent(event)
-            return parsed_event
-        if EventType.CLIENT_LEFT.value == event_type:
-            reason_id = int(event.get("reasonid", '-1'))
-            if reason_id == int(ReasonID.SERVER_KICK) or reason_id == int(ReasonID.CHANNEL_KICK):
-                parsed_event = ClientKickedEvent(event)
-            elif reason_id == int(ReasonID.BAN):
-                parsed_event = ClientBannedEvent(event)
-            else:
-                parsed_event = ClientLeftEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_DESC_CHANGED.value == event_type:
-            parsed_event = ChannelDescriptionEditedEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_EDITED.value == event_type:
-            parsed_event = ChannelEditedEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_CREATED.value == event_type:
-            parsed_event = ChannelCreatedEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_DELETED.value == event_type:
-            parsed_event = ChannelDeletedEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_MOVED.value == event_type:
-            parsed_event = ChannelMovedEvent(event)
-            return parsed_event
-        if EventType.SERVER_EDITED.value == event_type:
-            parsed_event = ServerEditedEvent(event)
-            return parsed_event
-        if EventType.CHANNEL_PASSWORD_CHANGED.value == event_type:
-            parsed_event = ChannelPasswordChangedEvent(event)
-            return parsed_event
-        logging.warning("Unknown event! %s", str(event_type))
-        return TS3Event(event, event_type)
+        factory = cls._factories.get(event_type)
+        if factory is None:
+            logging.warning("Unknown event! %s", str(event_type))
+            return TS3Event(event, event_type)
+        return factory(event)
 
 
 class ServerEditedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.SERVER_EDITED
+    _INVOKER_KEYS = frozenset(("reasonid", "invokerid", "invokeruid", "invokername"))
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._reason_id = data.get("reasonid", "")
-        del data["reasonid"]
-        self._invoker_id = data.get("invokerid", "-1")
-        del data["invokerid"]
-        self._invoker_uid = data.get("invokeruid", "-1")
-        del data["invokeruid"]
-        self._invoker_name = data.get("invokername", "")
-        del data["invokername"]
-        self._changed_properties = data
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
-
-    @property
-    def reason_id(self):
-        return self._reason_id
+    reason_id = _Field("reasonid")
+    invoker_id = _Field("invokerid", "-1")
+    invoker_uid = _Field("invokeruid", "-1")
+    invoker_name = _Field("invokername")
 
     @property
     def changed_properties(self):
-        return self._changed_properties
+        return {key: value for key, value in self._data.items() if key not in self._INVOKER_KEYS}
 
 
 class ChannelEvent(TS3Event):
-    def __init__(self, data):
-        super().__init__(data)
-        self._reason_id = data.get('reasonid', '-1')
-        self._channel_id = data.get('cid', '-1')
-        self._invoker_name = data.get('invokername', '')
-        self._channel_topic = data.get('channel_topic', '')
-        self._invoker_id = data.get('invokerid', '-1')
-        self._invoker_uid = data.get('invokeruid', '-1')
+    __slots__ = ()
 
-    @property
-    def channel_id(self):
-        return self._channel_id
-
-    @property
-    def channel_topic(self):
-        return self._channel_topic
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
-
-    @property
-    def reason_id(self):
-        return self._reason_id
+    reason_id = _Field("reasonid", "-1")
+    channel_id = _Field("cid", "-1")
+    channel_topic = _Field("channel_topic")
+    invoker_id = _Field("invokerid", "-1")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid", "-1")
 
 
 class ChannelEditedEvent(ChannelEvent):
+    __slots__ = ()
     event_type = EventType.CHANNEL_EDITED
 
 
 class ChannelCreatedEvent(ChannelEvent):
+    __slots__ = ()
     event_type = EventType.CHANNEL_CREATED
 
 
 class ChannelDeletedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CHANNEL_DELETED
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._channel_id = data.get('cid', '-1')
-        self._invoker_id = data.get('invokerid', '-1')
-        self._invoker_name = data.get('invokername', '')
-        self._invoker_uid = data.get('invokeruid', '-1')
-
-    @property
-    def channel_id(self):
-        return self._channel_id
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
+    channel_id = _Field("cid", "-1")
+    invoker_id = _Field("invokerid", "-1")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid", "-1")
 
 
 class ChannelMovedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CHANNEL_MOVED
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._cid = data.get('cid', '-1')
-        self._cpid = data.get('cpid', '-1')
-        self._order = data.get('order', '-1')
-        self._reasonid = data.get('reasonid', '-1')
-        self._invoker_id = data.get('invokerid', '-1')
-        self._invoker_name = data.get('invokername', '')
-        self._invoker_uid = data.get('invokeruid', '-1')
-
-    @property
-    def channel_id(self):
-        return self._cid
-
-    @property
-    def channel_pid(self):
-        return self._cpid
-
-    @property
-    def channel_order(self):
-        return self._order
-
-    @property
-    def reason_id(self):
-        return self._reasonid
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
+    channel_id = _Field("cid", "-1")
+    channel_pid = _Field("cpid", "-1")
+    channel_order = _Field("order", "-1")
+    reason_id = _Field("reasonid", "-1")
+    invoker_id = _Field("invokerid", "-1")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid", "-1")
 
 
 class ChannelDescriptionEditedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CHANNEL_DESC_CHANGED
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._channel_id = int(data.get('cid', '-1'))
-
-    @property
-    def channel_id(self):
-        return self._channel_id
+    channel_id = _IntField("cid")
 
 
 class ChannelPasswordChangedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CHANNEL_PASSWORD_CHANGED
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._channel_id = int(data.get('cid', '-1'))
-
-    @property
-    def channel_id(self):
-        return self._channel_id
+    channel_id = _IntField("cid")
 
 
 class ClientEnteredEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CLIENT_ENTER
-
-    def __init__(self, data):
-        super().__init__(data)
-        try:
-            self._client_id = int(data.get('clid', '-1'))
-            self._client_name = data.get('client_nickname', '')
-            self._client_uid = data.get('client_unique_identifier', '')
-            self._client_description = data.get('client_description', '')
-            self._client_country = data.get('client_country', '')
-            self._client_away = data.get('client_away', '')
-            self._client_away_msg = data.get('client_away_message', '')
-            self._client_input_muted = data.get('client_input_muted', '')
-            self._client_output_muted = data.get('client_output_muted', '')
-            self._client_outputonly_muted = data.get('client_outputonly_muted', '')
-            self._client_input_hardware = data.get('client_input_hardware', '')
-            self._client_output_hardware = data.get('client_output_hardware', '')
-            self._target_channel_id = int(data.get('ctid', '-1'))
-            self._from_channel_id = int(data.get('cfid', '-1'))
-            self._reason_id = int(data.get('reasonid', '-1'))
-            self._client_is_recording = data.get('client_is_recording', '')
-            self._client_dbid = data.get('client_database_id', '')
-            self._client_servergroups = data.get('client_servergroups', '')
-            self._client_channel_group_id = int(data.get('client_channel_group_id', '-1'))
-        except:
-            self._logger.error("Failed to parse ClientEnterEvent:")
-            self._logger.error(data)
-            self._logger.error("\n\n")
-            self._logger.error("Uncaught exception: %s", str(sys.exc_info()[0]))
-            self._logger.error(str(sys.exc_info()[1]))
-            self._logger.error(traceback.format_exc())
-
-    @property
-    def client_id(self):
-        return self._client_id
-
-    @property
-    def client_name(self):
-        return self._client_name
-
-    @property
-    def client_uid(self):
-        return self._client_uid
-
-    @property
-    def client_description(self):
-        return self._client_description
-
-    @property
-    def client_country(self):
-        return self._client_country
-
-    @property
-    def client_away(self):
-        return self._client_away
-
-    @property
-    def client_away_msg(self):
-        return self._client_away_msg
-
-    @property
-    def client_input_muted(self):
-        return self._client_input_muted
-
-    @property
-    def client_output_muted(self):
-        return self._client_output_muted
-
-    @property
-    def client_outputonly_muted(self):
-        return self._client_outputonly_muted
-
-    @property
-    def client_input_hardware(self):
-        return self._client_input_hardware
-
-    @property
-    def client_output_hardware(self):
-        return self._client_output_hardware
-
-    @property
-    def target_channel_id(self):
-        return self._target_channel_id
-
-    @property
-    def from_channel_id(self):
-        return self._from_channel_id
-
-    @property
-    def reason_id(self):
-        return self._reason_id
-
-    @property
-    def client_is_recording(self):
-        return self._client_is_recording
-
-    @property
-    def client_dbid(self):
-        return self._client_dbid
-
-    @property
-    def client_servergroups(self):
-        return self._client_servergroups
-
-    @property
-    def client_channel_group_id(self):
-        return self._client_channel_group_id
+    _KEY_FIELDS = ("clid",)
+
+    client_id = _IntField("clid")
+    client_name = _Field("client_nickname")
+    client_uid = _Field("client_unique_identifier")
+    client_description = _Field("client_description")
+    client_country = _Field("client_country")
+    client_away = _Field("client_away")
+    client_away_msg = _Field("client_away_message")
+    client_input_muted = _Field("client_input_muted")
+    client_output_muted = _Field("client_output_muted")
+    client_outputonly_muted = _Field("client_outputonly_muted")
+    client_input_hardware = _Field("client_input_hardware")
+    client_output_hardware = _Field("client_output_hardware")
+    target_channel_id = _IntField("ctid")
+    from_channel_id = _IntField("cfid")
+    reason_id = _IntField("reasonid")
+    client_is_recording = _Field("client_is_recording")
+    client_dbid = _Field("client_database_id")
+    client_servergroups = _Field("client_servergroups")
+    client_channel_group_id = _IntField("client_channel_group_id")
 
 
 class ClientLeftEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CLIENT_LEFT
+    _KEY_FIELDS = ("clid",)
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._client_id = int(data.get('clid', '-1'))
-        self._target_channel_id = int(data.get('ctid', '-1'))
-        self._from_channel_id = int(data.get('cfid', '-1'))
-        self._reason_id = int(data.get('reasonid', '-1'))
-        self._reason_msg = data.get('reasonmsg', '')
-
-    @property
-    def client_id(self):
-        return self._client_id
-
-    @property
-    def target_channel_id(self):
-        return self._target_channel_id
-
-    @property
-    def reason_id(self):
-        return self._reason_id
-
-    @property
-    def reason_msg(self):
-        return self._reason_msg
+    client_id = _IntField("clid")
+    target_channel_id = _IntField("ctid")
+    from_channel_id = _IntField("cfid")
+    reason_id = _IntField("reasonid")
+    reason_msg = _Field("reasonmsg")
 
 
 class ClientKickedEvent(ClientLeftEvent):
-    def __init__(self, data):
-        super().__init__(data)
-        self._invoker_id = int(data.get('invokerid', '-1'))
-        self._invoker_name = data.get('invokername', '')
-        self._invoker_uid = data.get('invokeruid', '')
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
+    __slots__ = ()
 
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
+    invoker_id = _IntField("invokerid")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid")
 
 
 class ClientBannedEvent(ClientKickedEvent):
-    def __init__(self, data):
-        super().__init__(data)
-        self._ban_time = int(data.get("bantime", '-1'))
+    __slots__ = ()
 
-    @property
-    def ban_time(self):
-        return self._ban_time
+    ban_time = _IntField("bantime")
 
 
 class ClientMovedEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CLIENT_MOVED
+    # The connection follows its own client by the target channel
+    _KEY_FIELDS = ("clid", "ctid")
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._client_id = int(data.get('clid', '-1'))
-        self._target_channel_id = int(data.get('ctid', '-1'))
-        self._reason_id = int(data.get('reasonid', '-1'))
-        self._invoker_id = int(data.get('invokerid', '-1'))
-        self._invoker_name = data.get('invokername', '')
-        self._invoker_uid = data.get('invokeruid', '')
-
-    @property
-    def client_id(self):
-        return self._client_id
-
-    @property
-    def target_channel_id(self):
-        return self._target_channel_id
-
-    @property
-    def reason_id(self):
-        return self._reason_id
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
+    client_id = _IntField("clid")
+    target_channel_id = _IntField("ctid")
+    reason_id = _IntField("reasonid")
+    invoker_id = _IntField("invokerid")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid")
 
 
 class ClientMovedSelfEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.CLIENT_MOVED
+    # The connection follows its own client by the target channel
+    _KEY_FIELDS = ("clid", "ctid")
 
-    def __init__(self, data):
-        super().__init__(data)
-        self._client_id = int(data.get('clid', '-1'))
-        self._target_channel_id = int(data.get('ctid', '-1'))
-        self._reason_id = int(data.get('reasonid', '-1'))
-
-    @property
-    def client_id(self):
-        return self._client_id
-
-    @property
-    def target_channel_id(self):
-        return self._target_channel_id
-
-    @property
-    def reason_id(self):
-        return self._reason_id
+    client_id = _IntField("clid")
+    target_channel_id = _IntField("ctid")
+    reason_id = _IntField("reasonid")
 
 
 class TextMessageEvent(TS3Event):
+    __slots__ = ()
     event_type = EventType.TEXT_MESSAGE
+    _KEY_FIELDS = ("invokerid",)
+    _TARGET_MODES = {"1": "Private", "2": "Channel", "3": "Server"}
 
-    def __init__(self, data):
-        super().__init__(data)
-        if data.get('targetmode') == '1':
-            self._targetmode = 'Private'
-            self._target = data.get('target')
-        elif data.get('targetmode') == '2':
-            self._targetmode = 'Channel'
-        elif data.get('targetmode') == '3':
-            self._targetmode = 'Server'
-
-        self._message = data.get('msg')
-        self._invoker_id = int(data.get('invokerid', '-1'))
-        self._invoker_name = data.get('invokername', '')
-        self._invoker_uid = data.get('invokeruid', '-1')
-
-    @property
-    def invoker_id(self):
-        return self._invoker_id
-
-    @property
-    def invoker_name(self):
-        return self._invoker_name
-
-    @property
-    def invoker_uid(self):
-        return self._invoker_uid
-
-    @property
-    def message(self):
-        return self._message
+    invoker_id = _IntField("invokerid")
+    invoker_name = _Field("invokername")
+    invoker_uid = _Field("invokeruid", "-1")
+    message = _Field("msg", None)
 
     @property
     def targetmode(self):
-        return self._targetmode
+        return self._TARGET_MODES.get(self._data.get("targetmode"))
 
     @property
     def target(self):
         if self.targetmode == 'Private':
-            return self._target
+            return self._data.get("target")
         return None
+
+
+def _client_moved(data):
+    if "invokerid" in data:
+        return ClientMovedEvent(data)
+    return ClientMovedSelfEvent(data)
+
+
+def _client_left(data):
+    reason_id = int(data.get("reasonid", "-1"))
+    if reason_id == ReasonID.SERVER_KICK or reason_id == ReasonID.CHANNEL_KICK:
+        return ClientKickedEvent(data)
+    if reason_id == ReasonID.BAN:
+        return ClientBannedEvent(data)
+    return ClientLeftEvent(data)
+
+
+EventParser.register(EventType.TEXT_MESSAGE.value, TextMessageEvent)
+EventParser.register(EventType.CLIENT_MOVED.value, _client_moved)
+EventParser.register(EventType.CLIENT_ENTER.value, ClientEnteredEvent)
+EventParser.register(EventType.CLIENT_LEFT.value, _client_left)
+EventParser.register(EventType.CHANNEL_DESC_CHANGED.value, ChannelDescriptionEditedEvent)
+EventParser.register(EventType.CHANNEL_EDITED.value, ChannelEditedEvent)
+EventParser.register(EventType.CHANNEL_CREATED.value, ChannelCreatedEvent)
+EventParser.register(EventType.CHANNEL_DELETED.value, ChannelDeletedEvent)
+EventParser.register(EventType.CHANNEL_MOVED.value, ChannelMovedEvent)
+EventParser.register(EventType.SERVER_EDITED.value, ServerEditedEvent)
+EventParser.register(EventType.CHANNEL_PASSWORD_CHANGED.value, ChannelPasswordChangedEvent)
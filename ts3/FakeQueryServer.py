@@ -0,0 +1,595 @@
+"""Local stand-in for a TeamSpeak 3 ServerQuery interface, for tests and load tests"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+from ts3 import codec
+
+GREETING = b"TS3\n\rWelcome to the TeamSpeak 3 ServerQuery interface, type \"help\" for a list of commands " \
+           b"and \"help <command>\" for information on a specific command.\n\r"
+OK = "error id=0 msg=ok"
+
+
+class QueryError(Exception):
+    """
+    Error answered instead of the response of a command.
+    """
+
+    def __init__(self, error_id, msg):
+        super().__init__(msg)
+        self.error_id = error_id
+        self.msg = msg
+
+    def line(self):
+        return "error id=%d msg=%s" % (self.error_id, codec.escape(self.msg))
+
+
+def _record(values):
+    """
+    :type values: dict[str, any]
+    :rtype: str
+    """
+    return " ".join(key + "=" + codec.escape(str(value)) for key, value in values.items())
+
+
+class _Session:
+    """
+    State of one query connection.
+    """
+
+    def __init__(self, writer, clid):
+        self.writer = writer
+        self.clid = clid
+        self.logged_in = False
+        self.sid = None
+        # "server", "textserver", "textchannel", "textprivate" and ("channel", cid)
+        self.registrations = set()
+        self.commands = collections.deque()
+
+    def write(self, line):
+        self.writer.write(line.encode("UTF-8") + b"\n\r")
+
+
+class FakeQueryServer:
+    """
+    Asyncio ServerQuery server with virtual clients, channels and server groups. It answers the
+    commands the bot and its plugins use (login, use, whoami, serverinfo, clientlist, clientinfo,
+    clientdblist, channellist, channelfind, servergrouplist, servergroupaddclient,
+    servergroupdelclient, clientmove, clientupdate, sendtextmessage, servernotifyregister, quit) and
+    sends notifications to the sessions registered for them.
+    Answers can be delayed to simulate latency, sessions exceeding the flood limit get flooding
+    errors like from a real server, and bursts of notifications can be triggered, e.g. with
+    mass_move.
+
+    Can be run on a running event loop with start/stop or on its own thread with
+    start_in_thread/stop_in_thread. All other public methods can be called from any thread.
+    """
+
+    # Fields of clientlist per option, always included are clid, cid, client_database_id,
+    # client_nickname and client_type
+    _CLIENTLIST_OPTIONS = {
+        "-uid": ("client_unique_identifier",),
+        "-away": ("client_away", "client_away_message"),
+        "-voice": ("client_flag_talking", "client_input_muted", "client_output_muted", "client_outputonly_muted",
+                   "client_input_hardware", "client_output_hardware", "client_talk_power", "client_is_talker",
+                   "client_is_priority_speaker", "client_is_recording", "client_is_channel_commander"),
+        "-groups": ("client_servergroups", "client_channel_group_id"),
+        "-info": ("client_version", "client_platform"),
+        "-country": ("client_country",),
+        "-ip": ("connection_client_ip",),
+    }
+
+    # Client fields missing in notifycliententerview, only clientlist and clientinfo send them
+    _NOT_IN_ENTER_VIEW = frozenset(("cid", "client_flag_talking", "client_version", "client_platform",
+                                    "connection_client_ip"))
+
+    # Most records the server answers per page of a paged command like clientdblist
+    PAGE_LIMIT = 200
+
+    def __init__(self, host="127.0.0.1", port=0, clients=10, channels=5, servergroups=("Server Admin", "Normal"),
+                 latency=0.0, flood_commands=None, flood_time=3.0, username=None, password=None):
+        """
+        Creates a new FakeQueryServer.
+        :param host: Address to listen on.
+        :param port: Port to listen on, 0 to pick a free port.
+        :param clients: Number of virtual clients, in the Normal server group.
+        :param channels: Number of channels or their names.
+        :param servergroups: Names of the server groups, the last one is the default group.
+        :param latency: Seconds every answer is delayed.
+        :param flood_commands: Commands a session may send within flood_time before it is answered
+                               with flooding errors, None for no limit.
+        :param flood_time: Seconds of the flood window.
+        :param username: Login name to accept, None to accept any login.
+        :param password: Password to accept.
+        :type host: str
+        :type port: int
+        :type clients: int
+        :type channels: int | list[str]
+        :type servergroups: tuple[str]
+        :type latency: float
+        :type flood_commands: int | None
+        :type flood_time: float
+        """
+        self._logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.flood_commands = flood_commands
+        self.flood_time = flood_time
+        self.username = username
+        self.password = password
+        if isinstance(channels, int):
+            channels = ["Default Channel"] + ["Channel %d" % i for i in range(2, channels + 1)]
+        self.channels = {cid: {"cid": cid, "pid": 0, "channel_order": cid - 1, "channel_name": name,
+                               "channel_topic": "", "channel_flag_default": int(cid == 1),
+                               "channel_needed_subscribe_power": 0}
+                         for cid, name in enumerate(channels, start=1)}
+        self.servergroups = {sgid: name for sgid, name in enumerate(servergroups, start=6)}
+        self.clients = {}
+        # Sent text messages: (invoker clid, targetmode, target, message, time.monotonic())
+        self.messages = []
+        # Number of answered commands per command name
+        self.command_counts = collections.Counter()
+        self._next_clid = 1
+        self._sessions = []
+        self._server = None
+        self._loop = None
+        self._thread = None
+        for _ in range(clients):
+            self._create_client()
+
+    # Running
+
+    async def start(self):
+        """
+        Starts listening on the running event loop.
+        :return: The port the server listens on.
+        :rtype: int
+        """
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        """
+        Closes all sessions and stops listening.
+        """
+        for session in list(self._sessions):
+            session.writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """
+        Starts the server on an event loop in a daemon thread.
+        :return: The port the server listens on.
+        :rtype: int
+        """
+        started = concurrent.futures.Future()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                started.set_result(loop.run_until_complete(self.start()))
+            except BaseException as ex:
+                started.set_exception(ex)
+                return
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+            # Let the sessions finish after their connections were closed
+            loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-query-server", daemon=True)
+        self._thread.start()
+        return started.result()
+
+    def stop_in_thread(self):
+        """
+        Stops a server started with start_in_thread.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _in_loop(self, function, *args):
+        """
+        Runs function on the event loop of the server and returns its result.
+        """
+        if self._loop is None or self._thread is None or threading.current_thread() is self._thread:
+            return function(*args)
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(function(*args))
+            except BaseException as ex:
+                future.set_exception(ex)
+
+        self._loop.call_soon_threadsafe(run)
+        return future.result()
+
+    # Virtual clients and notification bursts
+
+    def add_client(self, nickname=None, cid=1, servergroups=None, **properties):
+        """
+        Connects a virtual client, notifying registered sessions.
+        :param nickname: Nickname of the client.
+        :param cid: Channel the client joins.
+        :param servergroups: Names of the server groups of the client, defaults to the last group.
+        :param properties: Further client properties, e.g. client_away=1.
+        :return: The client id.
+        :rtype: int
+        """
+        return self._in_loop(self._add_client, nickname, cid, servergroups, properties)
+
+    def _add_client(self, nickname, cid, servergroups, properties):
+        client = self._create_client(nickname, cid, servergroups, properties)
+        self._enter_view(client)
+        return client["clid"]
+
+    def _enter_view(self, client):
+        values = {"cfid": 0, "ctid": client["cid"], "reasonid": 0}
+        values.update((key, value) for key, value in client.items() if key not in self._NOT_IN_ENTER_VIEW)
+        self._notify_client_event("notifycliententerview", values, client["cid"])
+
+    def remove_client(self, clid, reasonid=8, reasonmsg="leaving"):
+        """
+        Disconnects a virtual client, notifying registered sessions.
+        """
+        self._in_loop(self._remove_client, clid, reasonid, reasonmsg)
+
+    def _remove_client(self, clid, reasonid, reasonmsg):
+        client = self.clients.pop(clid)
+        self._notify_client_event("notifyclientleftview", {"cfid": client["cid"], "ctid": 0, "reasonid": reasonid,
+                                                           "reasonmsg": reasonmsg, "clid": clid}, client["cid"])
+
+    def update_client(self, clid, **properties):
+        """
+        Changes properties of a virtual client without notification, like the server does for
+        e.g. client_away.
+        """
+        self._in_loop(lambda: self.clients[clid].update(properties))
+
+    def mass_move(self, cid, clids=None, invokerid=None):
+        """
+        Moves clients to a channel one after another, like dragging a whole channel.
+        :param cid: Target channel.
+        :param clids: Clients to move, defaults to all virtual clients.
+        :param invokerid: Client moving them, None if they moved themselves.
+        """
+        self._in_loop(self._mass_move, cid, clids, invokerid)
+
+    def _mass_move(self, cid, clids, invokerid):
+        for clid in list(self.clients) if clids is None else clids:
+            self._move(clid, cid, invokerid)
+
+    def restart_burst(self):
+        """
+        Disconnects and reconnects all virtual clients, like after a server restart.
+        """
+        self._in_loop(self._restart_burst)
+
+    def _restart_burst(self):
+        clients = list(self.clients.values())
+        for client in clients:
+            self._remove_client(client["clid"], 11, "server shutdown")
+        for client in clients:
+            self.clients[client["clid"]] = client
+            self._enter_view(client)
+
+    def drop_sessions(self):
+        """
+        Closes all query connections without answering pending commands, like a network failure.
+        """
+        self._in_loop(self._drop_sessions)
+
+    def _drop_sessions(self):
+        for session in list(self._sessions):
+            session.writer.transport.abort()
+
+    def send_text_message(self, invokerid, msg, targetmode=1, target=None):
+        """
+        Sends a text message from a virtual client.
+        :param invokerid: Sending client.
+        :param msg: Message.
+        :param targetmode: 1 private, 2 channel, 3 server.
+        :param target: Client id for private messages, defaults to the first query session.
+        """
+        self._in_loop(self._send_text_message, invokerid, msg, targetmode, target)
+
+    def _send_text_message(self, invokerid, msg, targetmode, target):
+        if targetmode == 1 and target is None:
+            target = self._sessions[0].clid
+        client = self.clients[invokerid]
+        self._text_message(client, targetmode, target, msg)
+
+    # Protocol
+
+    def _create_client(self, nickname=None, cid=1, servergroups=None, properties=None, client_type=0):
+        clid = self._next_clid
+        self._next_clid += 1
+        groups = [sgid for sgid, name in self.servergroups.items() if name in servergroups] \
+            if servergroups is not None else [max(self.servergroups)]
+        client = {"clid": clid, "cid": cid, "client_database_id": clid + 1000,
+                  "client_nickname": nickname or "User %d" % clid, "client_type": client_type,
+                  "client_unique_identifier": "fakeuid%d=" % clid, "client_away": 0, "client_away_message": "",
+                  "client_flag_talking": 0, "client_input_muted": 0, "client_output_muted": 0,
+                  "client_outputonly_muted": 0, "client_input_hardware": 1, "client_output_hardware": 1,
+                  "client_talk_power": 0, "client_is_talker": 0, "client_is_priority_speaker": 0,
+                  "client_is_recording": 0, "client_is_channel_commander": 0,
+                  "client_servergroups": ",".join(str(sgid) for sgid in groups), "client_channel_group_id": 8,
+                  "client_description": "", "client_country": "DE", "client_platform": "Linux",
+                  "client_version": "3.6.2", "connection_client_ip": "127.0.0.1"}
+        client.update(properties or {})
+        self.clients[clid] = client
+        return client
+
+    async def _handle(self, reader, writer):
+        session = _Session(writer, self._create_client("serveradmin from 127.0.0.1", client_type=1)["clid"])
+        self._sessions.append(session)
+        writer.write(GREETING)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.strip(b"\n\r").decode("UTF-8")
+                if not line:
+                    continue
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if not self._answer(session, line):
+                    await writer.drain()
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._sessions.remove(session)
+            self.clients.pop(session.clid, None)
+            writer.close()
+
+    def _answer(self, session, line):
+        """
+        Answers one command.
+        :return: False if the session quit.
+        :rtype: bool
+        """
+        command, _, args = line.partition(" ")
+        if self.flood_commands is not None:
+            now = time.monotonic()
+            while session.commands and session.commands[0] < now - self.flood_time:
+                session.commands.popleft()
+            if len(session.commands) >= self.flood_commands:
+                session.write(QueryError(524, "client is flooding").line())
+                return True
+            session.commands.append(now)
+        self.command_counts[command] += 1
+        if command == "quit":
+            session.write(OK)
+            return False
+        handler = getattr(self, "_cmd_" + command, None)
+        try:
+            if handler is None:
+                raise QueryError(256, "command not found")
+            if not session.logged_in and command not in ("login", "version") and self.username is not None:
+                raise QueryError(2568, "insufficient client permissions")
+            records = handler(session, args)
+        except QueryError as ex:
+            session.write(ex.line())
+            return True
+        if records:
+            session.write("|".join(_record(record) for record in records))
+        session.write(OK)
+        return True
+
+    @staticmethod
+    def _args(args):
+        """
+        :return: Records of a command, options (-uid) and positional arguments.
+        :rtype: (list[dict[str, str]], set[str], list[str])
+        """
+        records = codec.parse_records(args) if args else [{}]
+        options = {part for part in args.split(" ") if part.startswith("-")}
+        positional = [codec.unescape(part) for part in args.split(" ") if part and "=" not in part and
+                      not part.startswith("-")]
+        return records, options, positional
+
+    def _cmd_version(self, session, args):
+        return [{"version": "3.13.7", "build": 1655727713, "platform": "Linux"}]
+
+    def _cmd_login(self, session, args):
+        records, _, positional = self._args(args)
+        user = records[0].get("client_login_name", positional[0] if positional else None)
+        password = records[0].get("client_login_password", positional[1] if len(positional) > 1 else None)
+        if self.username is not None and (user, password) != (self.username, self.password):
+            raise QueryError(520, "invalid loginname or password")
+        session.logged_in = True
+
+    def _cmd_use(self, session, args):
+        records, _, positional = self._args(args)
+        session.sid = int(records[0].get("sid", positional[0] if positional else 1))
+
+    def _cmd_whoami(self, session, args):
+        client = self.clients[session.clid]
+        return [{"virtualserver_status": "online", "virtualserver_id": session.sid or 0,
+                 "virtualserver_unique_identifier": "fakeserver=", "virtualserver_port": 9987,
+                 "client_id": session.clid, "client_channel_id": client["cid"],
+                 "client_nickname": client["client_nickname"], "client_database_id": 1,
+                 "client_login_name": self.username or "serveradmin", "client_unique_identifier": "serveradmin",
+                 "client_origin_server_id": 0}]
+
+    def _cmd_serverinfo(self, session, args):
+        return [{"virtualserver_id": session.sid or 1, "virtualserver_name": "Fake Server",
+                 "virtualserver_port": 9987, "virtualserver_maxclients": 1024,
+                 "virtualserver_clientsonline": len(self.clients), "virtualserver_channelsonline": len(self.channels),
+                 "virtualserver_default_server_group": max(self.servergroups)}]
+
+    def _cmd_clientupdate(self, session, args):
+        records, _, _ = self._args(args)
+        self.clients[session.clid].update(records[0])
+
+    def _cmd_clientlist(self, session, args):
+        _, options, _ = self._args(args)
+        keys = ("clid", "cid", "client_database_id", "client_nickname", "client_type") + tuple(
+            key for option in options for key in self._CLIENTLIST_OPTIONS.get(option, ()))
+        return [{key: client[key] for key in keys} for client in self.clients.values()]
+
+    def _cmd_clientinfo(self, session, args):
+        records, _, _ = self._args(args)
+        client = self._client(records[0].get("clid"))
+        return [dict(client, client_created=0, client_lastconnected=0, client_totalconnections=1,
+                     connection_connected_time=1000)]
+
+    def _cmd_clientdblist(self, session, args):
+        records, _, _ = self._args(args)
+        start = int(records[0].get("start", 0))
+        duration = min(int(records[0].get("duration", self.PAGE_LIMIT)), self.PAGE_LIMIT)
+        page = [{"cldbid": client["client_database_id"], "client_unique_identifier": client["client_unique_identifier"],
+                 "client_nickname": client["client_nickname"], "client_created": 0, "client_lastconnected": 0,
+                 "client_totalconnections": 1, "client_description": "", "client_lastip": "127.0.0.1"}
+                for client in self.clients.values() if client["client_type"] == 0][start:start + duration]
+        if not page:
+            raise QueryError(1281, "database empty result set")
+        return page
+
+    def _cmd_channellist(self, session, args):
+        return [dict(channel, total_clients=sum(1 for client in self.clients.values()
+                                                if client["cid"] == cid and client["client_type"] == 0))
+                for cid, channel in self.channels.items()]
+
+    def _cmd_channelfind(self, session, args):
+        records, _, positional = self._args(args)
+        pattern = records[0].get("pattern", positional[0] if positional else "").lower()
+        found = [{"cid": cid, "channel_name": channel["channel_name"]} for cid, channel in self.channels.items()
+                 if pattern in channel["channel_name"].lower()]
+        if not found:
+            raise QueryError(768, "invalid channelID")
+        return found
+
+    def _cmd_servergrouplist(self, session, args):
+        return [{"sgid": sgid, "name": name, "type": 1, "iconid": 0, "savedb": 1}
+                for sgid, name in self.servergroups.items()]
+
+    def _cmd_servergroupaddclient(self, session, args):
+        for client, groups, sgid in self._servergroup_members(args):
+            if sgid not in groups:
+                client["client_servergroups"] = ",".join(groups + [sgid])
+
+    def _cmd_servergroupdelclient(self, session, args):
+        for client, groups, sgid in self._servergroup_members(args):
+            if sgid in groups:
+                groups.remove(sgid)
+                client["client_servergroups"] = ",".join(groups)
+
+    def _servergroup_members(self, args):
+        """
+        :return: Client, its server group ids and the server group id per cldbid of the command.
+        :rtype: list[(dict, list[str], str)]
+        """
+        records, _, _ = self._args(args)
+        sgid = records[0].get("sgid", "")
+        if not sgid.isdigit() or int(sgid) not in self.servergroups:
+            raise QueryError(2560, "invalid group ID")
+        by_database_id = {str(client["client_database_id"]): client for client in self.clients.values()}
+        members = []
+        for record in records:
+            client = by_database_id.get(record.get("cldbid"))
+            if client is None:
+                raise QueryError(1281, "database empty result set")
+            members.append((client, [group for group in client["client_servergroups"].split(",") if group], sgid))
+        return members
+
+    def _cmd_clientmove(self, session, args):
+        records, _, _ = self._args(args)
+        cid = int(records[0].get("cid", -1))
+        if cid not in self.channels:
+            raise QueryError(768, "invalid channelID")
+        clids = [self._client(record.get("clid"))["clid"] for record in records]
+        if len(clids) == 1 and self.clients[clids[0]]["cid"] == cid:
+            raise QueryError(770, "already member of channel")
+        for clid in clids:
+            self._move(clid, cid, session.clid)
+
+    def _cmd_sendtextmessage(self, session, args):
+        records, _, _ = self._args(args)
+        targetmode = int(records[0].get("targetmode", 0))
+        target = records[0].get("target")
+        if targetmode == 1:
+            target = self._client(target)["clid"]
+        elif targetmode not in (2, 3):
+            raise QueryError(1538, "invalid parameter")
+        self._text_message(self.clients[session.clid], targetmode, target, records[0].get("msg", ""))
+
+    def _cmd_servernotifyregister(self, session, args):
+        records, _, _ = self._args(args)
+        event = records[0].get("event")
+        if event == "channel":
+            session.registrations.add(("channel", int(records[0].get("id", 0))))
+        elif event in ("server", "textserver", "textchannel", "textprivate"):
+            session.registrations.add(event)
+        else:
+            raise QueryError(1538, "invalid parameter")
+
+    def _cmd_servernotifyunregister(self, session, args):
+        session.registrations.clear()
+
+    # Helpers
+
+    def _client(self, clid):
+        try:
+            return self.clients[int(clid)]
+        except (KeyError, TypeError, ValueError):
+            raise QueryError(512, "invalid clientID") from None
+
+    def _move(self, clid, cid, invokerid):
+        client = self.clients[clid]
+        source = client["cid"]
+        client["cid"] = cid
+        values = {"ctid": cid, "reasonid": 0 if invokerid in (None, clid) else 1, "clid": clid}
+        if invokerid is not None and invokerid != clid:
+            invoker = self.clients.get(invokerid, {})
+            values.update(invokerid=invokerid, invokername=invoker.get("client_nickname", ""),
+                          invokeruid=invoker.get("client_unique_identifier", ""))
+        line = "notifyclientmoved " + _record(values)
+        for session in self._sessions:
+            if not session.registrations.isdisjoint((("channel", 0), ("channel", source), ("channel", cid))):
+                session.write(line)
+
+    def _notify_client_event(self, name, values, cid):
+        """
+        Sends client enter and leave notifications to the sessions registered for them.
+        """
+        line = name + " " + _record(values)
+        for session in self._sessions:
+            if "server" in session.registrations or ("channel", 0) in session.registrations or \
+                    ("channel", cid) in session.registrations:
+                session.write(line)
+
+    def _text_message(self, invoker, targetmode, target, msg):
+        """
+        Records a text message and sends it to the registered sessions. Like on a real server,
+        the sender of a private message is notified as well.
+        """
+        self.messages.append((invoker["clid"], targetmode, target, msg, time.monotonic()))
+        values = {"targetmode": targetmode, "msg": msg}
+        if targetmode == 1:
+            values["target"] = target
+        values.update(invokerid=invoker["clid"], invokername=invoker["client_nickname"],
+                      invokeruid=invoker["client_unique_identifier"])
+        line = "notifytextmessage " + _record(values)
+        for session in self._sessions:
+            if targetmode == 1:
+                notify = "textprivate" in session.registrations and session.clid in (target, invoker["clid"])
+            elif targetmode == 2:
+                notify = "textchannel" in session.registrations and \
+                    self.clients[session.clid]["cid"] == invoker["cid"]
+            else:
+                notify = "textserver" in session.registrations
+            if notify:
+                session.write(line)
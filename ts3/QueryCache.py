@@ -0,0 +1,178 @@
+"""Caching of the responses of read-only queries"""
+import collections
+import threading
+import time
+
+from ts3.Events import EventType
+
+_CHANNEL_COMMANDS = ("channellist", "channelfind", "channelinfo")
+
+# Event type -> cached commands whose responses the event may change
+_INVALIDATED_BY_EVENT = {
+    EventType.CHANNEL_CREATED: _CHANNEL_COMMANDS,
+    EventType.CHANNEL_EDITED: _CHANNEL_COMMANDS,
+    EventType.CHANNEL_DELETED: _CHANNEL_COMMANDS,
+    EventType.CHANNEL_MOVED: _CHANNEL_COMMANDS,
+    EventType.CHANNEL_DESC_CHANGED: ("channelinfo",),
+    EventType.CHANNEL_PASSWORD_CHANGED: ("channellist", "channelinfo"),
+    # total_clients of channellist and the client count of serverinfo
+    EventType.CLIENT_ENTER: ("channellist", "serverinfo"),
+    EventType.CLIENT_LEFT: ("channellist", "serverinfo"),
+    EventType.CLIENT_MOVED: ("channellist",),
+}
+
+# Written command -> cached commands whose responses it may change, None for all
+_INVALIDATED_BY_COMMAND = {
+    "login": None,
+    "use": None,
+    "serveredit": None,
+    "channelcreate": _CHANNEL_COMMANDS,
+    "channeledit": _CHANNEL_COMMANDS,
+    "channeldelete": _CHANNEL_COMMANDS,
+    "channelmove": _CHANNEL_COMMANDS,
+    "clientmove": ("channellist",),
+    "clientkick": ("channellist", "serverinfo"),
+    "servergroupadd": ("servergrouplist",),
+    "servergroupdel": ("servergrouplist",),
+    "servergrouprename": ("servergrouplist",),
+    "servergroupcopy": ("servergrouplist",),
+}
+
+
+class QueryCache:
+    """
+    Keeps the raw responses of read-only queries for a time to live per command, so repeated
+    identical reads do not cost a round trip. Entries are dropped early when an event or a
+    command sent on the connection may have changed them. Changes the server does not announce,
+    e.g. server groups edited by another client, are visible once the time to live has passed.
+    """
+    # Seconds the response of a command is kept
+    DEFAULT_TTLS = {
+        "servergrouplist": 60.0,
+        "channelfind": 30.0,
+        "channellist": 5.0,
+        "channelinfo": 10.0,
+        "serverinfo": 10.0,
+    }
+
+    def __init__(self, ttls=None, max_entries=1024):
+        """
+        Creates a new QueryCache.
+        :param ttls: Seconds to keep the responses per command, None for DEFAULT_TTLS. Commands
+                     without a time to live are not cached.
+        :param max_entries: Number of responses to keep at most.
+        :type ttls: dict[str, float] | None
+        :type max_entries: int
+        """
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (command, args) -> (expiry time, response)
+        self._entries = {}
+        # Command -> number of invalidations, responses requested before one are not stored
+        self._generations = collections.Counter()
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+    def get(self, command, args):
+        """
+        Looks up a cached response.
+        :param command: Command name.
+        :param args: Parameters of the query.
+        :type command: str
+        :type args: tuple[str]
+        :return: The response, None if none is cached.
+        :rtype: bytes | None
+        """
+        entry = self._entries.get((command, args))
+        with self._lock:
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits[command] += 1
+                return entry[1]
+            self.misses[command] += 1
+            return None
+
+    def generation(self, command):
+        """
+        Has to be taken before sending a query whose response is stored with put.
+        :type command: str
+        :rtype: int
+        """
+        return self._generations[command]
+
+    def put(self, command, args, response, generation):
+        """
+        Stores a response, unless the command was invalidated since generation was taken.
+        :param command: Command name.
+        :param args: Parameters of the query.
+        :param response: Raw response.
+        :param generation: Result of generation() before the query was sent.
+        :type command: str
+        :type args: tuple[str]
+        :type response: bytes
+        :type generation: int
+        """
+        ttl = self.ttls.get(command)
+        if not ttl:
+            return
+        with self._lock:
+            if self._generations[command] != generation:
+                return
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[(command, args)] = (time.monotonic() + ttl, response)
+
+    def invalidate(self, *commands):
+        """
+        Drops the cached responses of commands.
+        :type commands: str
+        """
+        with self._lock:
+            for command in commands:
+                self._generations[command] += 1
+            self._entries = {key: entry for key, entry in self._entries.items() if key[0] not in commands}
+
+    def clear(self):
+        """
+        Drops all cached responses, e.g. after reconnecting.
+        """
+        with self._lock:
+            for command in self.ttls:
+                self._generations[command] += 1
+            self._entries = {}
+
+    def on_event(self, event):
+        """
+        Drops the responses an event may have changed.
+        :type event: TS3Event
+        """
+        if event.event_type == EventType.SERVER_EDITED:
+            self.clear()
+            return
+        commands = _INVALIDATED_BY_EVENT.get(event.event_type)
+        if commands is not None:
+            self.invalidate(*commands)
+
+    def on_command(self, command):
+        """
+        Drops the responses a command written to the connection may change.
+        :type command: str
+        """
+        if command not in _INVALIDATED_BY_COMMAND:
+            return
+        commands = _INVALIDATED_BY_COMMAND[command]
+        if commands is None:
+            self.clear()
+        else:
+            self.invalidate(*commands)
+
+    def stats(self):
+        """
+        Hits and misses per cached command.
+        :rtype: dict[str, dict[str, int]]
+        """
+        return {command: {"hits": self.hits[command], "misses": self.misses[command]}
+                for command in sorted(set(self.hits) | set(self.misses))}
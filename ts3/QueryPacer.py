@@ -0,0 +1,166 @@
+"""Adaptive pacing of server queries"""
+import collections
+import logging
+import threading
+import time
+
+
+class QueryPacer:
+    """
+    Token bucket limiting the rate queries are sent at. The server bans query clients sending
+    too many commands (by default 10 commands within 3 seconds) unless their IP is whitelisted and
+    answers with CLIENT_IS_FLOODING before it does. Every flood error lowers the rate
+    multiplicatively and caps it below the rate that caused it. Every successful query raises the
+    rate additively, up to that learned limit. Without a configured rate queries are not paced
+    until the server reports flooding for the first time.
+    """
+    # Lowest rate the pacer backs off to in queries per second
+    MIN_RATE = 0.2
+    # Default flood limit of the server (serverinstance_serverquery_flood_commands per
+    # serverinstance_serverquery_flood_time), used when the rate that caused flooding is unknown
+    DEFAULT_SERVER_RATE = 10 / 3
+    # Seconds the server remembers commands for flood protection. Flood errors following each
+    # other within this time are caused by the same overload and do not lower the limit again.
+    FLOOD_WINDOW = 3.0
+
+    def __init__(self, rate=None, burst=10, backoff=0.5, recovery=0.05, margin=0.9):
+        """
+        Creates a new QueryPacer.
+        :param rate: Maximum queries per second, None or 0 to not pace until flooding is reported.
+        :param burst: Queries that can be sent at once after an idle period.
+        :param backoff: Factor the rate is multiplied with on a flood error.
+        :param recovery: Queries per second the rate is raised by on every successful query.
+        :param margin: Fraction of the rate that caused a flood error the rate may recover to.
+        :type rate: float | None
+        :type burst: int
+        :type backoff: float
+        :type recovery: float
+        :type margin: float
+        """
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._rate = float(rate) if rate else None
+        self._limit = self._rate
+        self._burst = max(1, int(burst))
+        self._backoff = backoff
+        self._recovery = recovery
+        self._margin = margin
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._last_backoff = float("-inf")
+        self._last_flood = float("-inf")
+        self._waiting = 0
+        # Send times of the last queries, used to estimate the rate that caused the first flood
+        # error while the pacer was not pacing yet.
+        self._sent = collections.deque(maxlen=self._burst)
+
+    @property
+    def rate(self):
+        """
+        Current rate in queries per second, None if queries are not paced.
+        :rtype: float | None
+        """
+        return self._rate
+
+    @property
+    def limit(self):
+        """
+        Rate the pacer recovers to after backing off, None if there is no limit.
+        :rtype: float | None
+        """
+        return self._limit
+
+    @property
+    def queue_depth(self):
+        """
+        Number of queries currently waiting to be sent.
+        :rtype: int
+        """
+        return self._waiting
+
+    def acquire(self):
+        """
+        Takes a token, blocks until the query may be sent. Queries are let through in the order
+        they called acquire.
+        :return: Seconds the caller was delayed.
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._sent.append(now)
+            if self._rate is None:
+                return 0.0
+            self._refill(now)
+            # Reserve the token, a negative balance is the queue of waiting queries
+            self._tokens -= 1
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0.0
+            if delay:
+                self._waiting += 1
+        if delay:
+            try:
+                time.sleep(delay)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        return delay
+
+    def on_flood(self, sent_at):
+        """
+        Lowers the rate after the server reported flooding. Flood errors of queries sent before
+        the last backoff were caused by the old rate and are ignored, so one burst of rejected
+        queries only backs off once.
+        :param sent_at: time.monotonic() of when the rejected query was sent.
+        :type sent_at: float
+        :return: True if the rate was lowered.
+        :rtype: bool
+        """
+        with self._lock:
+            now = time.monotonic()
+            repeated = now - self._last_flood < self.FLOOD_WINDOW
+            self._last_flood = now
+            if sent_at < self._last_backoff:
+                return False
+            if self._rate is None:
+                current = min(self._observed_rate(now), self.DEFAULT_SERVER_RATE)
+            else:
+                self._refill(now)
+                current = self._rate
+            if not repeated:
+                limit = current * self._margin
+                self._limit = limit if self._limit is None else min(self._limit, limit)
+            self._rate = max(self.MIN_RATE, current * self._backoff)
+            # The server counted the whole burst, start from an empty bucket
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = now
+            self._last_backoff = now
+            self._logger.warning("Server reported flooding, lowering query rate to %.2f/s (limit %.2f/s)",
+                                 self._rate, self._limit)
+            return True
+
+    def on_success(self):
+        """
+        Raises the rate a little after a query was accepted.
+        """
+        with self._lock:
+            if self._rate is None or self._rate >= self._limit:
+                return
+            self._refill(time.monotonic())
+            self._rate = min(self._limit, self._rate + self._recovery)
+
+    def _refill(self, now):
+        """
+        Adds the tokens earned since the last update at the current rate.
+        :type now: float
+        """
+        self._tokens = min(float(self._burst), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _observed_rate(self, now):
+        """
+        Estimates the rate of the last queries.
+        :type now: float
+        :rtype: float
+        """
+        if not self._sent or now <= self._sent[0]:
+            return float(self._burst)
+        return max(self.MIN_RATE, len(self._sent) / (now - self._sent[0]))
@@ -0,0 +1,140 @@
+"""Priority scheduling of server queries"""
+import contextlib
+import itertools
+import threading
+import time
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    """
+    Priority classes of queries, lower values are sent first.
+    """
+    INTERACTIVE = 0
+    EVENT = 1
+    BACKGROUND = 2
+    KEEPALIVE = 3
+
+
+class QueryScheduler:
+    """
+    Decides which waiting query is written to the connection next. The server answers queries in
+    order, so a query written behind many others waits for all of them. Only max_in_flight queries
+    are written at once, the rest wait here and are let through by priority, oldest first within a
+    priority. Waiting lowers the priority by one class every AGING seconds, so background queries
+    and keepalives are delayed but never starved.
+    The priority of a query is the priority of the thread sending it, see priority().
+    """
+    # Seconds of waiting that make up for one priority class
+    AGING = 2.0
+
+    def __init__(self, max_in_flight=8, default_priority=Priority.BACKGROUND):
+        """
+        Creates a new QueryScheduler.
+        :param max_in_flight: Queries that may be written without being answered yet.
+        :param default_priority: Priority of threads that did not set one.
+        :type max_in_flight: int
+        :type default_priority: Priority
+        """
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._max_in_flight = max(1, max_in_flight)
+        self._default_priority = default_priority
+        self._counter = itertools.count()
+        # Waiting queries as [priority, enqueue time, sequence number]
+        self._waiting = []
+        self._in_flight = 0
+        # Entry whose thread may write its query next
+        self._turn = None
+        # True while a query that got its turn has not been written yet, e.g. because it waits for
+        # the pacer. Nothing else is let through in the meantime, so the order is kept.
+        self._dispatching = False
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """
+        Sends all queries of the current thread with the given priority while the context is
+        active, e.g. with ts3conn.priority(Priority.INTERACTIVE): ...
+        :type priority: Priority
+        """
+        previous = getattr(self._local, "priority", None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    @property
+    def current_priority(self):
+        """
+        Priority of queries sent by the current thread.
+        :rtype: Priority
+        """
+        priority = getattr(self._local, "priority", None)
+        return self._default_priority if priority is None else priority
+
+    @property
+    def queue_depth(self):
+        """
+        Number of queries waiting for their turn.
+        :rtype: int
+        """
+        return len(self._waiting)
+
+    @property
+    def in_flight(self):
+        """
+        Number of queries written and not answered yet.
+        :rtype: int
+        """
+        return max(0, self._in_flight)
+
+    def acquire(self):
+        """
+        Blocks until it is the current thread's turn to write a query. Has to be followed by
+        dispatched() once the query was written or dropped.
+        """
+        entry = [self.current_priority, time.monotonic(), next(self._counter)]
+        with self._cond:
+            self._waiting.append(entry)
+            self._advance()
+            while self._turn is not entry:
+                self._cond.wait()
+            self._waiting.remove(entry)
+            self._turn = None
+            self._dispatching = True
+
+    def dispatched(self, written=True):
+        """
+        Ends the turn of the current thread.
+        :param written: True if the query was written and is waiting for its response.
+        :type written: bool
+        """
+        with self._cond:
+            self._dispatching = False
+            if written:
+                self._in_flight += 1
+            self._advance()
+
+    def completed(self, count=1):
+        """
+        Marks answered (or failed) queries as no longer in flight. The response can arrive before
+        the writing thread called dispatched(), so the count may drop below zero in between.
+        :param count: Number of queries.
+        :type count: int
+        """
+        with self._cond:
+            self._in_flight -= count
+            self._advance()
+
+    def _advance(self):
+        """
+        Gives the turn to the waiting entry to let through next, if a query may be written now.
+        Has to be called holding self._cond.
+        """
+        if self._turn is not None or self._dispatching or self._in_flight >= self._max_in_flight or \
+                not self._waiting:
+            return
+        now = time.monotonic()
+        self._turn = min(self._waiting, key=lambda entry: (entry[0] - (now - entry[1]) / self.AGING, entry[2]))
+        self._cond.notify_all()
@@ -0,0 +1,210 @@
+"""Lazily decoded query results"""
+from collections.abc import Mapping, Sequence
+
+from ts3 import codec
+
+# Marks fields that were not decoded yet, None is a valid "field missing" result
+_NOT_DECODED = object()
+
+
+class ResultSet(Sequence):
+    """
+    Result of a query returning a list of records (e.g. clientlist), kept as the raw response.
+    Nothing is decoded up front: the record boundaries are found on first access, the offsets of a
+    column are indexed the first time the column is used and a field is only decoded and
+    unescaped when it is read. Rows behave like the dictionaries returned by
+    TS3Connection._parse_resp_to_list_of_dicts.
+    """
+
+    def __init__(self, raw):
+        """
+        Creates a new ResultSet.
+        :param raw: Raw query response, records separated by "|".
+        :type raw: bytes | memoryview
+        """
+        self._raw = bytes(raw)
+        self._bounds = None
+        # key -> list of (start, end) value offsets per record, None if the record lacks the key
+        self._offsets = {}
+        # key -> list of decoded values per record
+        self._values = {}
+        # Indices into self._bounds of the rows in this set, None means all records
+        self._rows = None
+
+    def _record_bounds(self):
+        """
+        Finds the start and end offset of every non-empty record.
+        :rtype: list[(int, int)]
+        """
+        if self._bounds is None:
+            bounds = []
+            raw = self._raw
+            start = 0
+            while start <= len(raw):
+                end = raw.find(b"|", start)
+                if end == -1:
+                    end = len(raw)
+                if end > start:
+                    bounds.append((start, end))
+                start = end + 1
+            self._bounds = bounds
+        return self._bounds
+
+    def _column_offsets(self, key):
+        """
+        Returns the value offsets of a column for all records, building the index on first use.
+        :type key: str
+        :rtype: list[(int, int) | None]
+        """
+        offsets = self._offsets.get(key)
+        if offsets is None:
+            raw = self._raw
+            needle = key.encode() + b"="
+            offsets = []
+            for start, end in self._record_bounds():
+                pos = raw.find(needle, start, end)
+                # Only accept matches at the start of a field, not inside another key
+                while pos > start and raw[pos - 1] != 0x20:
+                    pos = raw.find(needle, pos + 1, end)
+                if pos == -1:
+                    offsets.append(None)
+                    continue
+                value_start = pos + len(needle)
+                value_end = raw.find(b" ", value_start, end)
+                offsets.append((value_start, end if value_end == -1 else value_end))
+            self._offsets[key] = offsets
+        return offsets
+
+    def _value(self, record, key):
+        """
+        Decodes a single field, the result is cached.
+        :param record: Index of the record in the raw response.
+        :param key: Key of the field.
+        :return: Decoded value or None if the record lacks the key.
+        :rtype: str | None
+        """
+        values = self._values.get(key)
+        if values is None:
+            values = [_NOT_DECODED] * len(self._record_bounds())
+            self._values[key] = values
+        value = values[record]
+        if value is _NOT_DECODED:
+            offset = self._column_offsets(key)[record]
+            if offset is None:
+                value = None
+            else:
+                value = codec.unescape(str(self._raw[offset[0]:offset[1]], encoding="UTF-8"))
+            values[record] = value
+        return value
+
+    def _keys(self, record):
+        """
+        Returns all keys of a record in order.
+        :rtype: list[str]
+        """
+        start, end = self._record_bounds()[record]
+        keys = []
+        for part in str(self._raw[start:end], encoding="UTF-8").split(" "):
+            key, sep, _value = part.partition("=")
+            if sep:
+                keys.append(key)
+        return keys
+
+    def _records(self):
+        """
+        Indices of the records in this set.
+        :rtype: list[int] | range
+        """
+        if self._rows is None:
+            return range(len(self._record_bounds()))
+        return self._rows
+
+    def _subset(self, rows):
+        """
+        Creates a ResultSet sharing the raw data and all indexes with this one.
+        :param rows: Indices of the records to include.
+        :type rows: list[int]
+        :rtype: ResultSet
+        """
+        subset = ResultSet.__new__(ResultSet)
+        subset._raw = self._raw
+        subset._bounds = self._record_bounds()
+        subset._offsets = self._offsets
+        subset._values = self._values
+        subset._rows = rows
+        return subset
+
+    def column(self, key, default=None):
+        """
+        Returns the decoded values of one column.
+        :param key: Column to return.
+        :param default: Value for rows without this column.
+        :rtype: list[str]
+        """
+        return [default if value is None else value
+                for value in (self._value(record, key) for record in self._records())]
+
+    def where(self, **conditions):
+        """
+        Filters the rows by exact field values, e.g. where(client_type="0", cid="5"). Values are
+        compared in their raw, escaped form, so filtering does not decode anything.
+        :return: ResultSet with the matching rows.
+        :rtype: ResultSet
+        """
+        rows = list(self._records())
+        raw = self._raw
+        for key, value in conditions.items():
+            offsets = self._column_offsets(key)
+            expected = codec.escape(str(value)).encode()
+            rows = [record for record in rows
+                    if offsets[record] is not None and raw[offsets[record][0]:offsets[record][1]] == expected]
+        return self._subset(rows)
+
+    def to_dicts(self):
+        """
+        Decodes all rows.
+        :rtype: list[dict[str, str]]
+        """
+        return [dict(row) for row in self]
+
+    def __len__(self):
+        return len(self._records())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._subset(list(self._records())[index])
+        return ResultRow(self, self._records()[index])
+
+    def __repr__(self):
+        return repr(self.to_dicts())
+
+
+class ResultRow(Mapping):
+    """
+    Read only, dictionary like view of a single record of a ResultSet.
+    """
+
+    def __init__(self, result_set, record):
+        """
+        :param result_set: ResultSet the record belongs to.
+        :param record: Index of the record in the raw response.
+        :type result_set: ResultSet
+        :type record: int
+        """
+        self._result_set = result_set
+        self._record = record
+
+    def __getitem__(self, key):
+        value = self._result_set._value(self._record, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter(self._result_set._keys(self._record))
+
+    def __len__(self):
+        return len(self._result_set._keys(self._record))
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -68,6 +68,12 @@ class SSHConnWrapper:
         self._buffer = self._buffer[delimiter_pos + len(delimiter):]
         return data
 
+    def read_line(self):
+        """
+        Read the next line, without its delimiter.
+        """
+        return self.read_until(b"\n\r")[:-2]
+
     def write(self, data):
         """
         Write bytes in data to the SSH connection.
@@ -0,0 +1,383 @@
+"""In-memory mirror of the state of a virtual server, kept current by events"""
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+import ts3.Events as Events
+from ts3.utilities import TS3ConnectionClosedException, TS3Exception
+
+# Event fields that describe the event instead of the client or channel
+_EVENT_KEYS = frozenset(("cfid", "ctid", "reasonid", "reasonmsg", "invokerid", "invokername", "invokeruid",
+                         "bantime"))
+_EMPTY = MappingProxyType({})
+
+
+class Snapshot:
+    """
+    Immutable view of the server state at one point in time. Records look like the dictionaries
+    returned by clientlist, channellist and servergrouplist, all values are strings.
+    """
+    __slots__ = ("clients", "channels", "servergroups", "server", "loaded_at")
+
+    def __init__(self, clients=_EMPTY, channels=_EMPTY, servergroups=_EMPTY, server=_EMPTY, loaded_at=None):
+        """
+        :param clients: Client id -> client record.
+        :param channels: Channel id -> channel record.
+        :param servergroups: Server group id -> server group record.
+        :param server: Properties of the virtual server.
+        :param loaded_at: time.monotonic() of the last full load, None if never loaded.
+        :type clients: Mapping[int, Mapping[str, str]]
+        :type channels: Mapping[int, Mapping[str, str]]
+        :type servergroups: Mapping[int, Mapping[str, str]]
+        :type server: Mapping[str, str]
+        :type loaded_at: float | None
+        """
+        self.clients = clients
+        self.channels = channels
+        self.servergroups = servergroups
+        self.server = server
+        self.loaded_at = loaded_at
+
+    def client(self, clid):
+        """
+        :type clid: int | str
+        :rtype: Mapping[str, str] | None
+        """
+        return self.clients.get(int(clid))
+
+    def channel(self, cid):
+        """
+        :type cid: int | str
+        :rtype: Mapping[str, str] | None
+        """
+        return self.channels.get(int(cid))
+
+    def voice_clients(self):
+        """
+        Clients connected with a TeamSpeak client, without query clients.
+        :rtype: list[Mapping[str, str]]
+        """
+        return [client for client in self.clients.values() if client.get("client_type") == "0"]
+
+    def clients_in(self, cid):
+        """
+        Clients in a channel, without query clients.
+        :type cid: int | str
+        :rtype: list[Mapping[str, str]]
+        """
+        cid = str(cid)
+        return [client for client in self.voice_clients() if client.get("cid") == cid]
+
+    def find_channels(self, pattern):
+        """
+        Channels whose name contains the pattern, ignoring case, like channelfind.
+        :type pattern: str
+        :rtype: list[Mapping[str, str]]
+        """
+        pattern = pattern.lower()
+        return [channel for channel in self.channels.values() if pattern in channel.get("channel_name", "").lower()]
+
+    def servergroup_names(self, clid):
+        """
+        Names of the server groups of a client, empty if the client is unknown.
+        :type clid: int | str
+        :rtype: list[str]
+        """
+        client = self.client(clid)
+        if client is None:
+            return []
+        names = []
+        for sgid in client.get("client_servergroups", "").split(","):
+            group = self.servergroups.get(int(sgid)) if sgid.isdigit() else None
+            if group is not None:
+                names.append(group.get("name", ""))
+        return names
+
+
+class ServerState:
+    """
+    Mirror of the clients, channels and server groups of the virtual server. It is loaded once,
+    kept current by the client, channel and server events and reloaded periodically to correct
+    drift, e.g. from server group changes, which are not announced by events.
+    Readers never lock: every change publishes a new Snapshot, so a snapshot read once stays
+    consistent. Properties the server does not send events for, like client_away or the mute
+    flags, are only as current as the last reload, query clientlist where they matter.
+    """
+    # Parameters of the clientlist used for loading, see TS3Connection.clientlist
+    CLIENTLIST_PARAMS = ("uid", "away", "voice", "groups", "info", "country", "ip")
+
+    def __init__(self, ts3conn, reconcile_interval=60.0):
+        """
+        Creates a new ServerState, see start.
+        :param ts3conn: Connection to load the state with.
+        :param reconcile_interval: Seconds between full reloads, 0 to never reload.
+        :type ts3conn: TS3Connection | TS3ConnectionPool
+        :type reconcile_interval: float
+        """
+        self._logger = logging.getLogger(__name__)
+        self.ts3conn = ts3conn
+        self.reconcile_interval = reconcile_interval
+        self._snapshot = Snapshot()
+        # Serializes writers, readers use the published snapshot
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        # Events received while a reload fetches the state, None if no reload is running
+        self._replay = None
+        self._stopped = threading.Event()
+        self._reconciler = None
+        # Set when events were dropped, cleared by the background reload, see on_dropped_event
+        self._dirty = threading.Event()
+        self._resync_lock = threading.Lock()
+        self._resyncing = False
+        # Differences found by the last reload
+        self.drift = 0
+        self.reloads = 0
+
+    @property
+    def snapshot(self):
+        """
+        The current state, does not change anymore once returned.
+        :rtype: Snapshot
+        """
+        return self._snapshot
+
+    @property
+    def dirty(self):
+        """
+        True while the state misses dropped events and is not reloaded yet.
+        :rtype: bool
+        """
+        return self._dirty.is_set()
+
+    def start(self):
+        """
+        Starts reloading the state every reconcile_interval seconds and loads it. Register
+        handle_event as event sink before, so no event is missed. If loading fails, the exception
+        is raised, the periodic reloads keep running and start can be called again to retry.
+        """
+        if self.reconcile_interval > 0 and self._reconciler is None:
+            self._reconciler = threading.Thread(target=self._reconcile_loop, name="server-state", daemon=True)
+            self._reconciler.start()
+        self.reload()
+
+    def current(self):
+        """
+        The current state like snapshot, but if the state was never loaded, e.g. because loading
+        failed on start, it is loaded from the server first, so callers do not act on an empty
+        state. Raises the exception of the failed load.
+        :rtype: Snapshot
+        """
+        snapshot = self._snapshot
+        if snapshot.loaded_at is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def stop(self):
+        """
+        Stops the periodic reloads.
+        """
+        self._stopped.set()
+
+    def _reconcile_loop(self):
+        while not self._stopped.wait(self.reconcile_interval):
+            try:
+                self.reload()
+            except TS3Exception:
+                self._logger.exception("Error reloading the server state")
+
+    def reload(self):
+        """
+        Loads the whole state from the server. The state is fetched without blocking events,
+        events arriving meanwhile are applied to the current state and again to the new one.
+        :return: Number of clients and channels that differed from the mirrored state.
+        :rtype: int
+        """
+        with self._reload_lock:
+            # Events dropped from now on may be missing in the fetched state
+            dirty = self._dirty.is_set()
+            self._dirty.clear()
+            with self._lock:
+                self._replay = []
+            try:
+                clients = {int(client["clid"]): client
+                           for client in self.ts3conn.clientlist(list(self.CLIENTLIST_PARAMS))}
+                channels = {int(channel["cid"]): channel for channel in self.ts3conn.channellist(["topic"])}
+                servergroups = {int(group["sgid"]): group for group in self.ts3conn.servergrouplist()}
+                try:
+                    server = self.ts3conn.serverinfo()
+                except TS3Exception:
+                    self._logger.warning("Could not load the server properties", exc_info=True)
+                    server = None
+            except BaseException:
+                with self._lock:
+                    self._replay = None
+                if dirty:
+                    self._dirty.set()
+                raise
+            with self._lock:
+                old = self._snapshot
+                if not isinstance(server, dict):
+                    server = dict(old.server)
+                self._snapshot = Snapshot(MappingProxyType(clients), MappingProxyType(channels),
+                                          MappingProxyType(servergroups), MappingProxyType(server), time.monotonic())
+                # The events may or may not be contained in the fetched state, applying them again is harmless
+                for event in self._replay:
+                    self._apply(event)
+                self._replay = None
+                new = self._snapshot
+        self.reloads += 1
+        if old.loaded_at is not None:
+            self.drift = self._count_drift(old, new)
+            if self.drift:
+                self._logger.info("Server state drifted by %d clients and channels", self.drift)
+        return self.drift
+
+    def on_dropped_event(self, event):
+        """
+        Marks the state as out of date after an event was dropped before reaching handle_event,
+        see TS3Connection.add_drop_sink. The state is reloaded on its own thread.
+        :type event: TS3Event
+        """
+        self._dirty.set()
+        with self._resync_lock:
+            if self._resyncing:
+                return
+            self._resyncing = True
+        threading.Thread(target=self._resync, name="server-state-resync", daemon=True).start()
+
+    def _resync(self):
+        """
+        Reloads the state until no events were dropped during the reload.
+        """
+        try:
+            while self._dirty.is_set():
+                self.reload()
+        except (TS3Exception, TS3ConnectionClosedException):
+            # Stays dirty until the next reload succeeds
+            self._logger.exception("Error reloading the server state after dropped events")
+            return
+        finally:
+            with self._resync_lock:
+                self._resyncing = False
+        # Dropped after the last check, but on_dropped_event still saw this reload running
+        if self._dirty.is_set() and not self._stopped.is_set():
+            self.on_dropped_event(None)
+
+    @staticmethod
+    def _count_drift(old, new):
+        drift = len(old.clients.keys() ^ new.clients.keys()) + len(old.channels.keys() ^ new.channels.keys())
+        for clid in old.clients.keys() & new.clients.keys():
+            if old.clients[clid].get("cid") != new.clients[clid].get("cid"):
+                drift += 1
+        return drift
+
+    def handle_event(self, event):
+        """
+        Applies an event to the state, see TS3Connection.add_event_sink. Applying an event twice
+        has no further effect, so events that were already contained in a reload do no harm.
+        :type event: TS3Event
+        """
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(event)
+            self._apply(event)
+
+    def _apply(self, event):
+        """
+        Applies an event to the state, has to be called holding self._lock.
+        :type event: TS3Event
+        """
+        if isinstance(event, (Events.ClientMovedEvent, Events.ClientMovedSelfEvent)):
+            self._move_client(event.client_id, event.target_channel_id)
+        elif isinstance(event, Events.ClientEnteredEvent):
+            self._client_entered(event)
+        elif isinstance(event, Events.ClientLeftEvent):
+            self._client_left(event.client_id)
+        elif isinstance(event, (Events.ChannelCreatedEvent, Events.ChannelEditedEvent)):
+            self._channel_changed(event)
+        elif isinstance(event, Events.ChannelMovedEvent):
+            self._channel_changed(event, pid=event.channel_pid, channel_order=event.channel_order)
+        elif isinstance(event, Events.ChannelDeletedEvent):
+            self._channel_deleted(int(event.channel_id))
+        elif isinstance(event, Events.ServerEditedEvent):
+            self._publish(server=dict(self._snapshot.server, **event.changed_properties))
+
+    def _publish(self, clients=None, channels=None, server=None):
+        """
+        Replaces the snapshot, has to be called holding self._lock.
+        """
+        old = self._snapshot
+        self._snapshot = Snapshot(old.clients if clients is None else MappingProxyType(clients),
+                                  old.channels if channels is None else MappingProxyType(channels),
+                                  old.servergroups,
+                                  old.server if server is None else MappingProxyType(server),
+                                  old.loaded_at)
+
+    @staticmethod
+    def _count_client(channels, client, delta):
+        """
+        Adjusts total_clients of the channel of a client in a copy of the channels.
+        """
+        if client.get("client_type") != "0":
+            return
+        cid = int(client.get("cid", "-1"))
+        channel = channels.get(cid)
+        if channel is not None and "total_clients" in channel:
+            channels[cid] = dict(channel, total_clients=str(max(0, int(channel["total_clients"]) + delta)))
+
+    # Helpers applying events, have to be called holding self._lock
+
+    def _client_entered(self, event):
+        record = {key: value for key, value in event.data.items() if key not in _EVENT_KEYS}
+        record["cid"] = str(event.target_channel_id)
+        clid = event.client_id
+        old = self._snapshot.clients.get(clid)
+        clients = dict(self._snapshot.clients)
+        channels = dict(self._snapshot.channels)
+        if old is not None:
+            self._count_client(channels, old, -1)
+        clients[clid] = record
+        self._count_client(channels, record, 1)
+        self._publish(clients, channels)
+
+    def _client_left(self, clid):
+        old = self._snapshot.clients.get(clid)
+        if old is None:
+            return
+        clients = dict(self._snapshot.clients)
+        channels = dict(self._snapshot.channels)
+        del clients[clid]
+        self._count_client(channels, old, -1)
+        self._publish(clients, channels)
+
+    def _move_client(self, clid, cid):
+        old = self._snapshot.clients.get(clid)
+        if old is None or old.get("cid") == str(cid):
+            # Unknown clients are added by the next reload
+            return
+        record = dict(old, cid=str(cid))
+        clients = dict(self._snapshot.clients)
+        channels = dict(self._snapshot.channels)
+        clients[clid] = record
+        self._count_client(channels, old, -1)
+        self._count_client(channels, record, 1)
+        self._publish(clients, channels)
+
+    def _channel_changed(self, event, **changes):
+        cid = int(event.channel_id)
+        changes.update((key, value) for key, value in event.data.items()
+                       if key not in _EVENT_KEYS and key not in ("cpid", "order"))
+        if "cpid" in event.data and "pid" not in changes:
+            changes["pid"] = event.data["cpid"]
+        channels = dict(self._snapshot.channels)
+        channels[cid] = dict(channels.get(cid, {"total_clients": "0"}), **changes)
+        self._publish(channels=channels)
+
+    def _channel_deleted(self, cid):
+        if cid not in self._snapshot.channels:
+            return
+        channels = dict(self._snapshot.channels)
+        del channels[cid]
+        self._publish(channels=channels)
@@ -0,0 +1,146 @@
+import selectors
+import socket
+
+from ts3.utilities import TS3ConnectionClosedException
+
+
+class SocketConnWrapper:
+    """
+    Plain TCP transport for the server query. Reads are done on a non-blocking socket through a
+    selector into one reusable buffer. Lines are handed out as memoryview slices of that buffer, so
+    receiving a line does not copy it.
+    """
+    DELIMITER = b"\n\r"
+
+    def __init__(self, host, port, timeout=None, chunk_size=65536, poll_interval=1.0):
+        """
+        Create a new socket connection wrapper.
+        :param host:  Hostname of the Server to connect to.
+        :param port:  Ts3Server query port.
+        :param timeout:  Timeout in seconds for establishing the connection (default=None)
+        :param chunk_size:  Bytes to read from the socket at once (default=65536)
+        :param poll_interval:  Seconds to wait for data before checking if the wrapper was closed.
+                               (default=1.0)
+        """
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setblocking(False)
+        self._read_selector = selectors.DefaultSelector()
+        self._read_selector.register(self._sock, selectors.EVENT_READ)
+        self._write_selector = selectors.DefaultSelector()
+        self._write_selector.register(self._sock, selectors.EVENT_WRITE)
+        self._chunk_size = chunk_size
+        self._poll_interval = poll_interval
+        self._buffer = bytearray(2 * chunk_size)
+        # Unconsumed data is self._buffer[self._start:self._end]. No delimiter starts before
+        # self._scan, so a search never looks at the same bytes twice.
+        self._start = 0
+        self._scan = 0
+        self._end = 0
+        self._view = None
+        self._closed = False
+
+    def read_line(self):
+        """
+        Read the next line, without its delimiter.
+        The returned memoryview points into the receive buffer and is only valid until the next
+        call to read_line or read_until, copy it (e.g. with bytes()) to keep it.
+        :rtype: memoryview
+        """
+        self._release_view()
+        while True:
+            pos = self._buffer.find(self.DELIMITER, self._scan, self._end)
+            if pos != -1:
+                break
+            # The delimiter might be split between this and the next chunk
+            self._scan = max(self._start, self._end - len(self.DELIMITER) + 1)
+            self._fill()
+        self._view = memoryview(self._buffer)[self._start:pos]
+        self._start = self._scan = pos + len(self.DELIMITER)
+        return self._view
+
+    def read_until(self, delimiter):
+        """
+        Read until the line delimiter, returns a copy of the line including the delimiter. Only
+        the query line delimiter is supported.
+        :rtype: bytes
+        """
+        if delimiter != self.DELIMITER:
+            raise ValueError("Only " + repr(self.DELIMITER) + " is supported as delimiter")
+        return bytes(self.read_line()) + self.DELIMITER
+
+    def _release_view(self):
+        """
+        Release the line handed out last, the buffer cannot be resized while it is exported.
+        """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+    def _fill(self):
+        """
+        Block until new data was received and append it to the buffer.
+        """
+        if len(self._buffer) - self._end < self._chunk_size:
+            self._compact()
+        while True:
+            if self._closed:
+                raise TS3ConnectionClosedException("Connection was closed!")
+            if not self._read_selector.select(self._poll_interval):
+                continue
+            try:
+                with memoryview(self._buffer) as buffer_view:
+                    received = self._sock.recv_into(buffer_view[self._end:])
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError as ex:
+                raise TS3ConnectionClosedException(ex)
+            if received == 0:
+                raise TS3ConnectionClosedException("Connection was closed!")
+            self._end += received
+            return
+
+    def _compact(self):
+        """
+        Move unconsumed data to the front of the buffer and grow the buffer if there is still not
+        enough space for a whole chunk.
+        """
+        if self._start > 0:
+            length = self._end - self._start
+            self._buffer[:length] = self._buffer[self._start:self._end]
+            self._scan -= self._start
+            self._start = 0
+            self._end = length
+        free = len(self._buffer) - self._end
+        if free < self._chunk_size:
+            self._buffer.extend(bytes(max(self._chunk_size - free, len(self._buffer))))
+
+    def write(self, data):
+        """
+        Write bytes in data to the socket.
+        """
+        with memoryview(data) as data_view:
+            sent = 0
+            while sent < len(data_view):
+                if self._closed:
+                    raise TS3ConnectionClosedException("Connection was closed!")
+                try:
+                    sent += self._sock.send(data_view[sent:])
+                except (BlockingIOError, InterruptedError):
+                    self._write_selector.select(self._poll_interval)
+                except OSError as ex:
+                    raise TS3ConnectionClosedException(ex)
+
+    def close(self):
+        """
+        Close the underlying socket.
+        """
+        if self._closed:
+            return
+        # The receiving thread might still wait in select(), it notices the closed socket on its
+        # next poll. The selectors are not closed here to avoid pulling them from under it.
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
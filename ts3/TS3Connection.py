@@ -1,39 +1,83 @@
 """Main TS3Api File"""
+import concurrent.futures
 import logging
 import socket
 import sys
-import telnetlib
 import threading
 import time
 import traceback
+from collections import deque
+from concurrent.futures import Future
 from typing import List, Dict
 
 import blinker
 
 import ts3.Events as Events
 import ts3.utilities as utilities
+from ts3 import codec
 from ts3.Events import TS3Event
+from ts3.EventDispatcher import EventDispatcher, event_key
+from ts3.metrics import Histogram, QueryMetrics
+from ts3.QueryCache import QueryCache
+from ts3.QueryPacer import QueryPacer
+from ts3.QueryScheduler import QueryScheduler, Priority
+from ts3.ResultSet import ResultSet
+from ts3.SocketConnWrapper import SocketConnWrapper
 from ts3.TS3QueryExceptionType import TS3QueryExceptionType
-from ts3.utilities import TS3Exception, TS3ConnectionClosedException
+from ts3.TrafficRecorder import TrafficRecorder, RECEIVED, SENT
+from ts3.utilities import TS3Exception, TS3ConnectionClosedException, TS3ReconnectingException
 
 
 class TS3Connection:
     """
-    Connection class for the TS3 API. Uses a telnet connection to send messages to and receive
-    messages from the Teamspeak 3 server.
+    Connection class for the TS3 API. Uses a raw socket (or ssh) connection to send messages to and
+    receive messages from the Teamspeak 3 server.
     """
+    # Maximum length of a query line, grouped bulk commands are split to stay below it
+    MAX_QUERY_LENGTH = 4096
+    # How often a query rejected with CLIENT_IS_FLOODING is resent before the error is raised
+    MAX_FLOOD_RETRIES = 3
+    # Seconds to wait before the first reconnect attempt, doubled after every failed attempt
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 60.0
+    # Commands changing the state of the query session, replayed after reconnecting
+    _SESSION_COMMANDS = ("login", "use", "clientupdate", "servernotifyregister", "servernotifyunregister")
 
     def __init__(self, host="127.0.0.1", port=10011, log_file="api.log", use_ssh=False,
                  username=None, password=None, accept_all_keys=False, host_key_file=None,
-                 use_system_hosts=False, sshtimeout=None, sshtimeoutlimit=3):
+                 use_system_hosts=False, sshtimeout=None, sshtimeoutlimit=3, query_rate=None,
+                 query_burst=10, max_in_flight=8, auto_reconnect=True, reconnect_hold=30.0,
+                 event_workers=4, event_queue_size=1000, cache_ttls=None):
         """
         Creates a new TS3Connection.
         :param host: Host to connect to. Can be an IP address or a hostname.
         :param port: Port to connect to.
         :param use_ssh: Should an encrypted ssh connection be used?
+        :param query_rate: Maximum queries per second, None to not pace queries until the server
+                           reports flooding.
+        :param query_burst: Queries that can be sent at once after an idle period.
+        :param max_in_flight: Queries that may be written without being answered yet, the others
+                              wait and are written by priority, see priority().
+        :param auto_reconnect: Reconnect and restore the session if the connection is lost instead
+                               of closing it.
+        :param reconnect_hold: Seconds a query sent while reconnecting waits for the connection
+                               before it fails with a TS3ReconnectingException.
+        :param event_workers: Threads informing the event listeners. Events of the same client are
+                              always handled by the same thread, in order.
+        :param event_queue_size: Events waiting per event thread, further events are dropped.
+        :param cache_ttls: Seconds the responses of read-only commands are cached per command,
+                           None for QueryCache.DEFAULT_TTLS, {} to not cache.
         :type host: str
         :type port: int
         :type use_ssh: bool
+        :type query_rate: float | None
+        :type query_burst: int
+        :type max_in_flight: int
+        :type auto_reconnect: bool
+        :type reconnect_hold: float
+        :type event_workers: int
+        :type event_queue_size: int
+        :type cache_ttls: dict[str, float] | None
         """
         self._is_ssh = use_ssh
         self._conn_lock = threading.Lock()
@@ -41,10 +85,46 @@ class TS3Connection:
         self._logger.propagate = 0
         self._logger.setLevel(logging.WARNING)
         self.stop_recv = threading.Event()
-        self._new_data = threading.Event()
-        self._data_read = threading.Event()
-        self._data_read.set()
-        self._data = None
+        # Queries written to the connection and not yet acknowledged, oldest first. The server
+        # answers queries strictly in order, so every "error" line belongs to the leftmost entry.
+        self._pending = deque()
+        self._pacer = QueryPacer(query_rate, query_burst)
+        self._scheduler = QueryScheduler(max_in_flight)
+        # Round trip times of the liveness probes in seconds, see keepalive_loop
+        self.rtt = Histogram()
+        # Latencies and errors per command of all queries
+        self.metrics = QueryMetrics()
+        # Responses of read-only queries, see _send
+        self.query_cache = QueryCache(cache_ttls)
+        self.event_dispatcher = EventDispatcher(event_workers, event_queue_size)
+        # Functions called directly with every event, see add_event_sink
+        self._event_sinks = ()
+        # Functions called with every written command, see add_command_sink
+        self._command_sinks = ()
+        # Functions called with every event dropped because the event queue was full, see add_drop_sink
+        self._drop_sinks = ()
+        # (event type name, target mode) -> blinker signal, saves the lookup per event
+        self._signals = {}
+        # Capture of the raw traffic, see start_recording
+        self._recorder = None
+        self._last_response = time.monotonic()
+        self._auto_reconnect = auto_reconnect
+        self._reconnect_hold = reconnect_hold
+        self._reconnect_delay = self.RECONNECT_DELAY
+        # Set while the session is usable, cleared while reconnecting
+        self._connected = threading.Event()
+        self._connected.set()
+        # Thread replaying the session after a reconnect, its queries are not held
+        self._restore_thread = None
+        self._reconnect_listeners = []
+        # Replayed after reconnecting, see _remember_session_state
+        self._session = {}
+        self._client_properties = {}
+        self._subscriptions = []
+        # Who the query client is, see identity
+        self._identity = None
+        self._transport_args = (host, port, username, password, accept_all_keys, host_key_file,
+                                use_system_hosts, sshtimeout, sshtimeoutlimit)
         # create console handler and set level to warning
         file_handler = logging.FileHandler(log_file, mode='a+')
         file_handler.setLevel(logging.WARNING)
@@ -58,23 +138,32 @@ class TS3Connection:
         # add ch to logger
         self._logger.addHandler(file_handler)
 
-        if not use_ssh:
-            self._conn = telnetlib.Telnet(host, port, timeout=socket.getdefaulttimeout())
-            self._logger.debug(self._conn.read_until(b"\n\r"))
-            self._logger.debug(self._conn.read_until(b"\n\r"))
-        else:
-            from SSHConnWrapper import SSHConnWrapper
-            self._conn = SSHConnWrapper(host, port, username, password,
-                                        accept_all_keys=accept_all_keys,
-                                        host_key_file=host_key_file, timeout=sshtimeout,
-                                        timeout_limit=sshtimeoutlimit,
-                                        use_system_hosts=use_system_hosts)
-            self._logger.debug(self._conn.read_until(b"\n\r"))
-            self._logger.debug(self._conn.read_until(b"\n\r"))
+        self._conn = self._open_transport()
         threading.Thread(target=self._recv).start()
         if username is not None and password is not None and not use_ssh:
             self.login(username, password)
 
+    def _open_transport(self):
+        """
+        Connects to the server and reads the welcome message.
+        :return: Socket or ssh connection wrapper.
+        :rtype: SocketConnWrapper | SSHConnWrapper
+        """
+        (host, port, username, password, accept_all_keys, host_key_file, use_system_hosts, sshtimeout,
+         sshtimeoutlimit) = self._transport_args
+        if not self._is_ssh:
+            conn = SocketConnWrapper(host, port, timeout=socket.getdefaulttimeout())
+        else:
+            from SSHConnWrapper import SSHConnWrapper
+            conn = SSHConnWrapper(host, port, username, password,
+                                  accept_all_keys=accept_all_keys,
+                                  host_key_file=host_key_file, timeout=sshtimeout,
+                                  timeout_limit=sshtimeoutlimit,
+                                  use_system_hosts=use_system_hosts)
+        self._logger.debug(conn.read_until(b"\n\r"))
+        self._logger.debug(conn.read_until(b"\n\r"))
+        return conn
+
     def login(self, user, password):
         """
         Login with query credentials.
@@ -96,12 +185,15 @@ class TS3Connection:
         """
         self._send("use", [str(sid)])
 
-    def clientlist(self, params=None):
+    def clientlist(self, params=None, lazy=False):
         """
         Get a clientlist from the server.
         :param params: List of parameters strings to use.
+        :param lazy: Return a lazily decoded ResultSet instead of a list of dictionaries.
         :type params: list[str]
+        :type lazy: bool
         :return: List of clients
+        :rtype: list[dict[str, str]] | ResultSet
         """
         if params is None:
             params = []
@@ -109,13 +201,17 @@ class TS3Connection:
         for param in params:
             args.append("-" + param)
         clist = self._send("clientlist", args)
-        clients = TS3Connection._parse_resp_to_list_of_dicts(clist)
+        if lazy:
+            return ResultSet(clist)
+        clients = self._parse_records("clientlist", clist)
         if len(clients) == 0:
             self._logger.warning("Clientlist empty %s", str(clist))
         return clients
 
     def _send(self, command, args=None, args_group=None, wait_for_resp=True, log_keepalive=False):
         """
+        Sends a query and waits for its response. Commands with a time to live in
+        self.query_cache are answered from the cache while the cached response is valid.
         :param command: Command to send.
         :param args: Parameter to send, will be escaped.
         :param args_group: Command group to send (separated by |), will be escaped.
@@ -131,100 +227,479 @@ class TS3Connection:
         :type wait_for_resp: bool
         :type log_keepalive: bool
         """
+        cached = wait_for_resp and not args_group and command in self.query_cache.ttls
+        if cached:
+            cache_args = tuple(args or ())
+            resp = self.query_cache.get(command, cache_args)
+            if resp is not None:
+                return resp
+            generation = self.query_cache.generation(command)
+        future = self._send_pipelined(command, args, args_group, log_keepalive)
+        if not wait_for_resp:
+            return None
+        resp = self._result(future)
+        if cached:
+            self.query_cache.put(command, cache_args, resp, generation)
+        self._logger.debug("Saved resp: %s", str(resp))
+        if command in self._SESSION_COMMANDS:
+            self._remember_session_state(command, args or [])
+            self._update_identity(command, args or [])
+        return resp
+
+    @property
+    def identity(self):
+        """
+        Who the query client is. Loaded with whoami on first use and kept current by login, use,
+        clientupdate, reconnects and the move events of the query client, so checking whether a
+        client is the bot itself costs no query.
+        :rtype: SessionIdentity
+        """
+        identity = self._identity
+        if identity is None:
+            self.whoami()
+            identity = self._identity
+        return identity
+
+    def _update_identity(self, command, args):
+        """
+        Adapts the identity to a successful session command.
+        :type command: str
+        :type args: list[str]
+        """
+        if command in ("login", "use"):
+            self._identity = None
+        elif command == "clientupdate" and self._identity is not None:
+            for arg in args:
+                key, _, value = arg.partition("=")
+                if key == "client_nickname":
+                    self._identity = self._identity.replace(nickname=value)
+
+    def _identity_on_event(self, event):
+        """
+        Follows the query client into other channels.
+        :type event: TS3Event
+        """
+        identity = self._identity
+        if identity is not None and isinstance(event, (Events.ClientMovedEvent, Events.ClientMovedSelfEvent)) \
+                and event.client_id == identity.client_id:
+            self._identity = identity.replace(channel_id=event.target_channel_id)
+
+    def _remember_session_state(self, command, args):
+        """
+        Records a successful command that changed the session, so it can be replayed after a
+        reconnect.
+        :type command: str
+        :type args: list[str]
+        """
+        if command == "clientupdate":
+            for arg in args:
+                self._client_properties[arg.split("=", 1)[0]] = arg
+        elif command == "servernotifyregister":
+            if args not in self._subscriptions:
+                self._subscriptions.append(list(args))
+        elif command == "servernotifyunregister":
+            # Unregisters all events
+            self._subscriptions.clear()
+        else:
+            self._session[command] = list(args)
+
+    def _send_pipelined(self, command, args=None, args_group=None, log_keepalive=False):
+        """
+        Writes a query to the connection without waiting for the previous query to be answered.
+        The returned future is resolved by the receiving thread once the "error" line
+        terminating the response arrives.
+        :param command: Command to send.
+        :param args: Parameter to send, will be escaped.
+        :param args_group: Command group to send (separated by |), will be escaped.
+        :param log_keepalive: Should keepalive messages be logged?
+        :return: Future holding the query response or the TS3QueryException.
+        :rtype: Future[bytes]
+        :type command: str
+        :type args: list[str]
+        :type args_group: list[list[str]]
+        :type log_keepalive: bool
+        """
+        return self._write_query(self._build_query(command, args, args_group), log_keepalive)
+
+    def _write_query(self, query, log_keepalive=False):
+        """
+        Waits for the turn of the query and the pacer, then writes an assembled query line to the
+        connection.
+        :param query: Encoded query line including the line terminator.
+        :param log_keepalive: Should keepalive messages be logged?
+        :rtype: Future[bytes]
+        :type query: bytes
+        :type log_keepalive: bool
+        """
+        if not self._connected.is_set() and threading.current_thread() is not self._restore_thread:
+            # Hold the query until the session is restored
+            if not self._connected.wait(self._reconnect_hold):
+                future = _PendingQuery(query.decode())
+                future.set_exception(TS3ReconnectingException("Connection is being re-established"))
+                return future
+        queued_at = time.monotonic()
+        self._scheduler.acquire()
+        written = False
+        try:
+            self._pacer.acquire()
+            future = _PendingQuery(query.decode())
+            with self._conn_lock:
+                if self.stop_recv.is_set():
+                    future.set_exception(TS3ConnectionClosedException("Connection is closed"))
+                    return future
+                if not query == b'\n\r' or query == b'\n\r' and log_keepalive:
+                    self._logger.debug("Query: %s", str(query))
+                # Register before writing, the response might arrive before write() returns
+                self._pending.append(future)
+                future.sent_at = time.monotonic()
+                try:
+                    self._conn.write(query)
+                    written = True
+                    if future.command:
+                        self.metrics.observe_wait(future.command, future.sent_at - queued_at)
+                        self.query_cache.on_command(future.command)
+                        for sink in self._command_sinks:
+                            sink(future.command)
+                    if self._recorder is not None:
+                        self._recorder.record(SENT, query)
+                except (OSError, EOFError, TS3ConnectionClosedException) as ex:
+                    self._pending.remove(future)
+                    future.set_exception(TS3ConnectionClosedException(ex))
+        finally:
+            self._scheduler.dispatched(written)
+        return future
+
+    def _result(self, future):
+        """
+        Waits for the response of a pipelined query. Queries the server rejected because of
+        flooding are resent transparently, the pacer has already lowered the rate by then.
+        :param future: Future returned by _send_pipelined.
+        :type future: _PendingQuery
+        :return: Query response.
+        :rtype: bytes
+        """
+        for _ in range(self.MAX_FLOOD_RETRIES):
+            try:
+                return future.result()
+            except TS3QueryException as ex:
+                if ex.type != TS3QueryExceptionType.CLIENT_IS_FLOODING:
+                    raise
+            self._logger.info("Resending flooded query: %s", future.query)
+            future = self._write_query(future.query.encode())
+        return future.result()
+
+    @property
+    def query_rate(self):
+        """
+        Current query rate in queries per second, None if queries are not paced.
+        :rtype: float | None
+        """
+        return self._pacer.rate
+
+    @property
+    def query_queue_depth(self):
+        """
+        Number of queries waiting to be written.
+        :rtype: int
+        """
+        return self._scheduler.queue_depth + self._pacer.queue_depth
+
+    @property
+    def outstanding(self):
+        """
+        Number of queries waiting to be written or for their response.
+        :rtype: int
+        """
+        return self._scheduler.queue_depth + self._scheduler.in_flight + self._pacer.queue_depth
+
+    def priority(self, priority):
+        """
+        Context manager sending all queries of the current thread with the given priority, e.g.
+        with ts3conn.priority(Priority.INTERACTIVE): ts3conn.clientmove(...)
+        Queries of threads without a priority are sent as Priority.BACKGROUND.
+        :type priority: Priority
+        """
+        return self._scheduler.priority(priority)
+
+    @staticmethod
+    def _build_query(command, args=None, args_group=None):
+        """
+        Escapes the arguments and assembles the query line.
+        :param command: Command to send.
+        :param args: Parameter to send, will be escaped.
+        :param args_group: Command group to send (separated by |), will be escaped.
+        :return: Encoded query line including the line terminator.
+        :rtype: bytes
+        """
         query = command
-        saved_resp = b''
-        ack = False
         if args and args_group:
             raise ValueError("don't use args and args_group")
         if args_group:
-            query += " " + '|'.join([' '.join([utilities.escape(arg) for arg in args]) for args in args_group])
+            query += " " + '|'.join([' '.join([codec.escape(arg) for arg in args]) for args in args_group])
         else:
             for arg in args or []:
-                query += " " + utilities.escape(arg)
+                query += " " + codec.escape(arg)
         query += "\n\r"
-        query = query.encode()
-        resp = None
+        return query.encode()
+
+    def _resolve_pending(self, data):
+        """
+        Hands a received response line to the oldest pending query. Data lines are collected,
+        the terminating "error" line resolves the query's future.
+        :param data: Response line, split by " " for "error" lines.
+        :type data: bytes | list[bytes]
+        """
+        if not self._pending:
+            self._logger.warning("Received response without pending query: %s", str(data))
+            return
+        if not isinstance(data, list):
+            self._logger.debug("Resp: %s", str(data))
+            self._pending[0].chunks.append(data)
+            return
+        future = self._pending.popleft()
+        future.resolved_at = self._last_response = time.monotonic()
+        self._scheduler.completed()
+        if data[1] != b'id=0':
+            ex = TS3QueryException(
+                int(data[1].decode(encoding='UTF-8').split("=", 1)[1]),
+                data[2].decode(encoding='UTF-8').split("=", 1)[1],
+                future.query,
+            )
+            if ex.type == TS3QueryExceptionType.CLIENT_IS_FLOODING:
+                self._pacer.on_flood(future.sent_at)
+            self.metrics.observe_response(future.command, future.resolved_at - future.sent_at, ex.type.name)
+            future.set_exception(ex)
+        else:
+            self._pacer.on_success()
+            self.metrics.observe_response(future.command, future.resolved_at - future.sent_at)
+            future.set_result(b''.join(future.chunks))
+
+    def _fail_pending(self, exception):
+        """
+        Fails all queries still waiting for a response, e.g. because the connection was closed.
+        :param exception: Exception to set on the pending futures.
+        :type exception: Exception
+        """
+        # Taking the lock makes sure no query is registered after the connection was closed
+        with self._conn_lock:
+            self._drop_pending(exception)
+
+    def _drop_pending(self, exception):
+        """
+        Fails all pending queries, has to be called holding self._conn_lock.
+        :type exception: Exception
+        """
+        self._scheduler.completed(len(self._pending))
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exception)
+
+    def _reconnect(self):
+        """
+        Replaces a lost connection, retrying with exponential backoff until it succeeds or the
+        connection is quit. Queries are held meanwhile, the session is restored by another thread
+        once connected, see _restore_session.
+        :return: True if a new connection was established.
+        :rtype: bool
+        """
+        self._connected.clear()
         try:
-            self._logger.debug("Trying to acquire lock")
-            if self._conn_lock.acquire():
-                self._logger.debug("Lock acquired")
-                if not query == b'\n\r' or query == b'\n\r' and log_keepalive:
-                    self._logger.debug("Query: %s", str(query))
-                self._logger.debug("Writing to connection")
-                self._conn.write(query)
-                self._logger.debug("Written to connection")
-                if not wait_for_resp:
-                    self._conn_lock.release()
-                    return None
-                while not ack:
-                    while resp is None:
-                        self._new_data.wait()
-                        resp = self._data
-                        self._new_data.clear()
-                        self._data_read.set()
-                        if resp is not None:
-                            if resp[0] == b'error':
-                                ack = True
-                                if resp[1] != b'id=0':
-                                    raise TS3QueryException(
-                                        int(resp[1].decode(encoding='UTF-8').split("=", 1)[1]),
-                                        resp[2].decode(encoding='UTF-8').split("=", 1)[1],
-                                        query.decode(),
-                                    )
-                            else:
-                                self._logger.debug("Resp: %s", str(resp))
-                                saved_resp += resp
-                                resp = None
-        finally:
-            self._conn_lock.release()
-            self._logger.debug("Lock released")
-        self._logger.debug("Saved resp: %s", str(saved_resp))
-        return saved_resp
+            self._conn.close()
+        except:
+            pass
+        self._fail_pending(TS3ReconnectingException("Connection lost before the response was received"))
+        while not self.stop_recv.wait(self._reconnect_delay):
+            try:
+                conn = self._open_transport()
+            except Exception as ex:
+                self._reconnect_delay = min(2 * self._reconnect_delay, self.MAX_RECONNECT_DELAY)
+                self._logger.warning("Reconnect failed (%s), next attempt in %.0fs", ex, self._reconnect_delay)
+                continue
+            with self._conn_lock:
+                # Everything still pending was written to the old connection
+                self._drop_pending(TS3ReconnectingException("Connection lost before the response was received"))
+                self._conn = conn
+            # The server might have been restarted
+            self.query_cache.clear()
+            # The new session has another client id
+            self._identity = None
+            self._restore_thread = threading.Thread(target=self._restore_session)
+            self._restore_thread.start()
+            return True
+        # Quit while reconnecting, release the held queries
+        self._connected.set()
+        return False
+
+    def _restore_session(self):
+        """
+        Replays login, use, clientupdate and servernotifyregister on the new connection, then
+        calls the reconnect listeners and releases the held queries.
+        """
+        try:
+            with self.priority(Priority.INTERACTIVE):
+                if "login" in self._session and not self._is_ssh:
+                    self._send("login", self._session["login"])
+                if "use" in self._session:
+                    self._send("use", self._session["use"])
+                if self._client_properties:
+                    try:
+                        self._send("clientupdate", list(self._client_properties.values()))
+                    except TS3QueryException:
+                        self._logger.warning("Could not restore client properties", exc_info=True)
+                for subscription in list(self._subscriptions):
+                    self._send("servernotifyregister", subscription)
+                self.whoami()
+                for listener in list(self._reconnect_listeners):
+                    try:
+                        listener(self)
+                    except Exception:
+                        self._logger.exception("Exception in reconnect listener %s", listener)
+        except (TS3QueryException, TS3ConnectionClosedException):
+            # Try again with the next connection
+            self._logger.exception("Restoring the session failed")
+            self._reconnect_delay = min(2 * self._reconnect_delay, self.MAX_RECONNECT_DELAY)
+            self._restore_thread = None
+            self._conn.close()
+            return
+        self._logger.warning("Reconnected and restored the session")
+        self._reconnect_delay = self.RECONNECT_DELAY
+        self._restore_thread = None
+        self._connected.set()
+
+    def start_recording(self, path, max_bytes=64 * 1024 * 1024, backup_count=3):
+        """
+        Starts appending every line received from and written to the server to a capture file,
+        which can be replayed without a server with ts3.replay. Login credentials are redacted.
+        :param path: Path of the capture file.
+        :param max_bytes: Size after which the capture file is rotated, 0 to never rotate.
+        :param backup_count: Number of rotated capture files to keep.
+        :type path: str
+        :type max_bytes: int
+        :type backup_count: int
+        """
+        self.stop_recording()
+        self._recorder = TrafficRecorder(path, max_bytes, backup_count)
+
+    def stop_recording(self):
+        """
+        Stops recording the traffic and closes the capture file.
+        """
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def on_reconnect(self, listener):
+        """
+        Registers a function that is called after the connection was re-established and the
+        session was restored, e.g. to move the query client back to its channel. The function is
+        called with the connection, its queries are sent before the held queries.
+        :type listener: (TS3Connection) -> None
+        """
+        self._reconnect_listeners.append(listener)
+
+    @property
+    def connected(self):
+        """
+        False while the connection is being re-established.
+        :rtype: bool
+        """
+        return self._connected.is_set()
 
     def _recv(self):
         """
         Actual receiving, receives until \n\r is encountered. \n\r is cut from the end of the
-        response.
-        :return: Parsed response, split by " " or None if received message was an event.
-        :rtype: bytes | None
+        response. Events are signaled, everything else is handed to the pending queries.
         """
         while not self.stop_recv.is_set():
             try:
-                self._logger.debug("Read until started")
-                resp = self._conn.read_until(b"\n\r")[:-2]
-                self._logger.debug("Read until ended")
+                self._logger.debug("Read line started")
+                # Only valid until the next read, _parse_resp copies what is kept
+                resp = self._conn.read_line()
+                self._logger.debug("Read line ended")
+                if self._recorder is not None:
+                    self._recorder.record(RECEIVED, resp)
             except (EOFError, TS3ConnectionClosedException) as _:
+                if self._auto_reconnect and not self.stop_recv.is_set():
+                    self._logger.warning("Connection lost, reconnecting", exc_info=True)
+                    if self._reconnect():
+                        continue
                 self._logger.exception("Connection closed")
-                if self.stop_recv.is_set():
-                    self._conn.close()
-                    return
-                self._new_data.set()
                 self.stop_recv.set()
-                try:
-                    self._conn.close()
-                    self._logger.debug(
-                        "Releasing lock for closed connection to unfreeze threads ...")
-                    self._conn_lock.release()
-                except:
-                    pass
-                continue
+                break
             self._logger.debug("Response: %s", str(resp))
             data = self._parse_resp(resp)
             self._logger.debug("Data: %s", str(data))
             if isinstance(data, TS3Event):
-                event = data
-                if isinstance(event, Events.TextMessageEvent):
-                    signal = blinker.signal(event.event_type.name + "_" + event.targetmode.lower())
-                else:
-                    signal = blinker.signal(event.event_type.name)
-                self._logger.debug("Sending signal")
-                threading.Thread(target=signal.send, kwargs={'event': event}).start()
+                # Before later responses are handed out, so no stale response is cached after the event
+                self.query_cache.on_event(data)
+                self._identity_on_event(data)
+                if not self.event_dispatcher.submit(event_key(data), self._deliver, data):
+                    # Responses cached since the event are not affected, but anything else may be stale
+                    self.query_cache.clear()
+                    for sink in self._drop_sinks:
+                        sink(data)
                 continue
             if data is not None:
-                self._data_read.wait()
-                self._data = data
-                self._data_read.clear()
-                self._new_data.set()
+                self._resolve_pending(data)
+        try:
+            self._conn.close()
+        except:
+            pass
+        self._fail_pending(TS3ConnectionClosedException("Connection closed"))
+        self.event_dispatcher.stop()
+        self.stop_recording()
+
+    def _deliver(self, event):
+        """
+        Hands an event to the blinker signal of its type, if it has receivers, and to the event
+        sinks. Runs on an event thread.
+        :type event: TS3Event
+        """
+        if isinstance(event, Events.TextMessageEvent):
+            signal_key = (event.event_type, event.targetmode)
+        else:
+            signal_key = (event.event_type, None)
+        signal = self._signals.get(signal_key)
+        if signal is None:
+            if signal_key[1] is None:
+                signal = blinker.signal(event.event_type.name)
+            else:
+                signal = blinker.signal(event.event_type.name + "_" + signal_key[1].lower())
+            self._signals[signal_key] = signal
+        if signal.receivers:
+            signal.send(event=event)
+        for sink in self._event_sinks:
+            sink(event)
+
+    def add_event_sink(self, sink):
+        """
+        Registers a function that is called with every received event, without going through
+        blinker. The events still have to be registered for, e.g. with
+        register_for_server_events() without a listener.
+        :type sink: (TS3Event) -> None
+        """
+        self._event_sinks += (sink,)
+
+    def add_command_sink(self, sink):
+        """
+        Registers a function that is called with the name of every command written to the
+        server, e.g. to drop state the command changes. It is called while writing, so it must not
+        block or send queries.
+        :type sink: (str) -> None
+        """
+        self._command_sinks += (sink,)
+
+    def add_drop_sink(self, sink):
+        """
+        Registers a function that is called with every event that was dropped because the event
+        queue was full. Dropped events reach neither blinker nor the event sinks, so state kept
+        current by events has to be reloaded. It is called on the receiving thread, so it must not
+        block or send queries.
+        :type sink: (TS3Event) -> None
+        """
+        self._drop_sinks += (sink,)
 
     @staticmethod
     def _parse_resp_to_dict(resp):
@@ -235,15 +710,7 @@ class TS3Connection:
         :return: Dictionary containing all info extracted from the response.
         :rtype: dict[str, str]
         """
-        resp = resp.decode(encoding='UTF-8').split(" ")
-        info = dict()
-        for part in resp:
-            split = part.split('=', 1)
-            # TODO: Handle empty data?
-            if len(split) == 2:
-                key, value = split
-                info[key] = utilities.unescape(value)
-        return info
+        return codec.parse_record(resp)
 
     @staticmethod
     def _parse_resp_to_list_of_dicts(resp):
@@ -256,12 +723,32 @@ class TS3Connection:
         :rtype: list[dict[str, str]]
         """
         # Multiple responses are split by "|"
-        split_list = resp.split(b"|")
-        dict_list = list()
-        for response in split_list:
-            if len(response) > 0:
-                dict_list.append(TS3Connection._parse_resp_to_dict(response))
-        return dict_list
+        return codec.parse_records(resp)
+
+    def _parse_records(self, command, resp):
+        """
+        Parses the response of a query into records, the time it takes is recorded in the parse
+        metrics of the command.
+        :param command: Command name of the query.
+        :param resp: Response to parse.
+        :type command: str
+        :type resp: bytes
+        :rtype: list[dict[str, str]]
+        """
+        start = time.perf_counter()
+        records = TS3Connection._parse_resp_to_list_of_dicts(resp)
+        self.metrics.observe_parse(command, time.perf_counter() - start)
+        return records
+
+    def _parse_record(self, command, resp):
+        """
+        Parses the response of a query into a single record, see _parse_records.
+        :type command: str
+        :type resp: bytes
+        :rtype: dict[str, str]
+        """
+        records = self._parse_records(command, resp)
+        return records[0] if records else {}
 
     def register_for_server_messages(self, event_listener=None, weak_ref=True):
         """
@@ -332,7 +819,7 @@ class TS3Connection:
     def channel_create(self, **attributes) -> int:
         """create channel, return channel id"""
         resp = self._send("channelcreate", [f"{k}={v}" for k, v in attributes.items()])
-        parsed_resp = self._parse_resp_to_list_of_dicts(resp)
+        parsed_resp = self._parse_records("channelcreate", resp)
         return int(parsed_resp[0]['cid'])
 
     def set_channel_name_and_description(self, cid, name, description):
@@ -420,6 +907,145 @@ class TS3Connection:
         """
         self._send("clientmove", ["cid=" + str(channel_id), "clid=" + str(client_id)])
 
+    def clientmove_many(self, channel_id, client_ids):
+        """
+        Move multiple clients to another channel, using one grouped command per
+        MAX_QUERY_LENGTH chunk of clients.
+        :param channel_id: Channel to move the clients to.
+        :param client_ids: Ids of the clients to move.
+        :type channel_id: int
+        :type client_ids: list[int]
+        :return: Result listing the moved clients and the failures per client.
+        :rtype: BulkResult
+        """
+        return self._send_grouped("clientmove", ["cid=" + str(channel_id)], "clid", client_ids,
+                                  ignored_errors=(TS3QueryExceptionType.CHANNEL_ALREADY_IN,))
+
+    def servergroupaddclient_many(self, sgid, cldbids):
+        """
+        Add multiple clients to a server group, using one grouped command per MAX_QUERY_LENGTH
+        chunk of clients.
+        :param sgid: Id of the server group.
+        :param cldbids: Database ids of the clients to add.
+        :type sgid: int
+        :type cldbids: list[int]
+        :return: Result listing the added clients and the failures per client.
+        :rtype: BulkResult
+        """
+        return self._send_grouped("servergroupaddclient", ["sgid=" + str(sgid)], "cldbid", cldbids,
+                                  ignored_errors=(TS3QueryExceptionType.DATABASE_DUPLICATE_ENTRY,))
+
+    def servergroupdelclient_many(self, sgid, cldbids):
+        """
+        Remove multiple clients from a server group, using one grouped command per
+        MAX_QUERY_LENGTH chunk of clients.
+        :param sgid: Id of the server group.
+        :param cldbids: Database ids of the clients to remove.
+        :type sgid: int
+        :type cldbids: list[int]
+        :return: Result listing the removed clients and the failures per client.
+        :rtype: BulkResult
+        """
+        return self._send_grouped("servergroupdelclient", ["sgid=" + str(sgid)], "cldbid", cldbids)
+
+    def clientpoke_many(self, client_ids, msg):
+        """
+        Poke multiple clients with the same message. The pokes are pipelined, so they take about
+        one round trip in total.
+        :param client_ids: Ids of the clients to poke.
+        :param msg: Message to send.
+        :type client_ids: list[int]
+        :type msg: str
+        :return: Result listing the poked clients and the failures per client.
+        :rtype: BulkResult
+        """
+        return self._send_each("clientpoke", client_ids, lambda clid: ["clid=" + str(clid), "msg=" + str(msg)])
+
+    def sendtextmessage_many(self, client_ids, msg):
+        """
+        Send the same private textmessage to multiple clients. The messages are pipelined, so they
+        take about one round trip in total.
+        :param client_ids: Ids of the clients to message.
+        :param msg: Message to send.
+        :type client_ids: list[int]
+        :type msg: str
+        :return: Result listing the messaged clients and the failures per client.
+        :rtype: BulkResult
+        """
+        return self._send_each("sendtextmessage", client_ids,
+                               lambda clid: ["targetmode=1", "target=" + str(clid), "msg=" + str(msg)])
+
+    def _send_grouped(self, command, args, key, items, ignored_errors=()):
+        """
+        Sends a command for many items using the "|" grouping of the query protocol, e.g.
+        clientmove cid=1 clid=2|clid=3. Items are split into chunks that fit into
+        MAX_QUERY_LENGTH. The server only reports one error per command, so the items of a
+        failed chunk are retried one by one to find out which of them failed.
+        :param command: Command to send.
+        :param args: Parameters shared by all items.
+        :param key: Parameter name of the items.
+        :param items: Values of the item parameter.
+        :param ignored_errors: Errors that mean the item is already in the requested state.
+        :type command: str
+        :type args: list[str]
+        :type key: str
+        :type items: list[int | str]
+        :type ignored_errors: tuple[TS3QueryExceptionType]
+        :rtype: BulkResult
+        """
+        items = list(items)
+        chunks = []
+        length = self.MAX_QUERY_LENGTH
+        for item in items:
+            item_length = len(codec.escape(key + "=" + str(item))) + 1
+            if length + item_length > self.MAX_QUERY_LENGTH:
+                chunks.append([])
+                length = len(self._build_query(command, args))
+            chunks[-1].append(item)
+            length += item_length
+        futures = [(chunk, self._send_pipelined(command, args_group=[args + [key + "=" + str(chunk[0])]] +
+                                                [[key + "=" + str(item)] for item in chunk[1:]]))
+                   for chunk in chunks]
+        result = BulkResult()
+        retry = []
+        for chunk, future in futures:
+            try:
+                self._result(future)
+                result.succeeded.extend(chunk)
+            except TS3QueryException:
+                retry.extend(chunk)
+        if retry:
+            self._logger.info("Grouped %s failed, retrying %d items one by one", command, len(retry))
+            retried = self._send_each(command, retry, lambda item: args + [key + "=" + str(item)])
+            result.succeeded.extend(retried.succeeded)
+            for item, ex in retried.failed.items():
+                if ex.type in ignored_errors:
+                    result.succeeded.append(item)
+                else:
+                    result.failed[item] = ex
+        return result
+
+    def _send_each(self, command, items, item_args):
+        """
+        Pipelines one command per item and collects the outcome of every item.
+        :param command: Command to send.
+        :param items: Items to send the command for.
+        :param item_args: Function returning the parameters for an item.
+        :type command: str
+        :type items: list
+        :type item_args: (any) -> list[str]
+        :rtype: BulkResult
+        """
+        futures = [(item, self._send_pipelined(command, item_args(item))) for item in items]
+        result = BulkResult()
+        for item, future in futures:
+            try:
+                self._result(future)
+                result.succeeded.append(item)
+            except TS3QueryException as ex:
+                result.failed[item] = ex
+        return result
+
     def clientupdate(self, params=None):
         """
         Update the query clients data.
@@ -449,15 +1075,18 @@ class TS3Connection:
         :return: Dictionary of query client information.
         :rtype: dict[str, str]
         """
-        who = TS3Connection._parse_resp_to_dict(self._send("whoami", []))
+        who = self._parse_record("whoami", self._send("whoami", []))
         self._logger.info("Whoami: %s", str(who))
+        self._identity = SessionIdentity.from_whoami(who)
         return who
 
-    def channellist(self, params=None):
+    def channellist(self, params=None, lazy=False):
         """
                 Returns the channel listt.
                 :param params: Optional parameters as defined by the serverquery manual.
+                :param lazy: Return a lazily decoded ResultSet instead of a list of dictionaries.
                 :return:  List of channels
+                :rtype: list[dict[str, str]] | ResultSet
         """
         if params is None:
             params = []
@@ -465,7 +1094,9 @@ class TS3Connection:
         for param in params:
             args.append("-" + param)
         channel_list = self._send("channellist", args)
-        channels = TS3Connection._parse_resp_to_list_of_dicts(channel_list)
+        if lazy:
+            return ResultSet(channel_list)
+        channels = self._parse_records("channellist", channel_list)
         if len(channels) == 0:
             self._logger.warning("Channellist empty %s", str(channel_list))
         return channels
@@ -488,8 +1119,7 @@ class TS3Connection:
         :return: List of channels.
         :rtype: list[dict[str, str]]
         """
-        return TS3Connection._parse_resp_to_list_of_dicts(
-            self._send("channelfind", ["pattern=" + pattern]))
+        return self._parse_records("channelfind", self._send("channelfind", ["pattern=" + pattern]))
 
     def channelfind_by_name(self, name):
         """
@@ -528,13 +1158,18 @@ class TS3Connection:
         self._send("sendtextmessage",
                    ["targetmode=" + str(targetmode), "target=" + str(target), "msg=" + str(msg)])
 
-    def servergrouplist(self):
+    def servergrouplist(self, lazy=False):
         """
         Returns a list of all servergroups with corresponding info.
+        :param lazy: Return a lazily decoded ResultSet instead of a list of dictionaries.
+        :type lazy: bool
         :return: List of servergroups.
-        :rtype: list[dict[str, str]]
+        :rtype: list[dict[str, str]] | ResultSet
         """
-        return TS3Connection._parse_resp_to_list_of_dicts(self._send("servergrouplist"))
+        resp = self._send("servergrouplist")
+        if lazy:
+            return ResultSet(resp)
+        return self._parse_records("servergrouplist", resp)
 
     def find_servergroup_by_name(self, name):
         """
@@ -555,7 +1190,7 @@ class TS3Connection:
         :return: Dictionary of client information.
         :rtype: dict[str,str]
         """
-        return self._parse_resp_to_dict(self._send("clientinfo", ["clid=" + str(client_id)]))
+        return self._parse_record("clientinfo", self._send("clientinfo", ["clid=" + str(client_id)]))
 
     def clientpoke(self, clid, msg):
         """
@@ -565,105 +1200,198 @@ class TS3Connection:
         :type clid: int
         :type msg: str
         """
-        return self._parse_resp_to_dict(self._send("clientpoke", ["clid=" + str(clid), "msg=" + str(msg)]))
+        return self._parse_record("clientpoke", self._send("clientpoke", ["clid=" + str(clid), "msg=" + str(msg)]))
 
-    def _parse_resp(self, resp):
+    @staticmethod
+    def _parse_resp(resp):
         """
         Parses a response. Messages starting with notify... are handled as events and the connected
         listeners are informed. Messages starting with error are split by " " and returned, all
         other messages will just be returned as is and can be handled by the caller.
         :param resp: Message to parse.
-        :type resp: byte
+        :type resp: bytes | memoryview
         :return:    None if message notifies of an event, dictionary containing id and message on
                     acknowledgements and bytes on any other message.
         :rtype: None | dict[str, str] | bytes
         """
         # Acknowledgements
-        if resp.startswith(b'error'):
-            resp = resp.split(b' ')
+        if resp[:5] == b'error':
+            resp = bytes(resp).split(b' ')
             return resp
         # Events
-        if resp.startswith(b'notify'):
+        if resp[:6] == b'notify':
             event = dict()
             event_type = "Unknown"
             try:
-                resp = resp.decode(encoding='UTF-8').split(" ")
-                event_type = resp[0]
-                for info in resp[1:]:
-                    split = info.split('=', 1)
-                    if len(split) == 2:
-                        key, value = split
-                        event[key] = utilities.unescape(value)
+                resp = str(resp, encoding='UTF-8')
+                event_type = resp.split(" ", 1)[0]
+                event = codec.parse_record(resp)
                 event = Events.EventParser.parse_event(event, event_type)
                 return event
             except:
-                self._logger.error("Error parsing event")
-                self._logger.error(resp)
-                self._logger.error("%s , %s", str(event), str(event_type))
-                self._logger.error("\n\n")
-                self._logger.error("Uncaught exception: %s", str(sys.exc_info()[0]))
-                self._logger.error(str(sys.exc_info()[1]))
-                self._logger.error(traceback.format_exc())
+                # The logger of the connections, _parse_resp is also used without one
+                logger = logging.getLogger(__name__)
+                logger.error("Error parsing event")
+                logger.error(resp)
+                logger.error("%s , %s", str(event), str(event_type))
+                logger.error("\n\n")
+                logger.error("Uncaught exception: %s", str(sys.exc_info()[0]))
+                logger.error(str(sys.exc_info()[1]))
+                logger.error(traceback.format_exc())
                 return None
         # Query-Responses and other things(What could these be?)
         else:
-            return resp
+            return bytes(resp)
 
-    def _recv_wait_timeout(self, timeout=0.1):
-        """
-        Like receives, but only reads for timeout seconds. If no info is received, the function
-        returns, otherwise it reads a whole line before returning. This is used for receiving notify
-        messages.
-        :param timeout: Seconds to wait before returning if no message was received.
-        :return:    None if nothing was received, parsed response corresponding to _parse_resp
-                    otherwise.
-        :rtype: None | dict[str, str] | bytes
-        """
-        resp = self._conn.read_until(b"\n\r", timeout)
-        if len(resp) > 0 and not resp.endswith(b"\n\r"):
-            resp += self._conn.read_until(b"\n\r")[:-2]
-        if len(resp) > 0:
-            self._logger.debug("No wait Response: %s", str(resp))
-            return self._parse_resp(resp)
+    def _send_keepalive(self, deadline=None):
+        """
+        Sends a keepalive message to the server to prevent timeout and records its round trip time.
+        :param deadline: Seconds to wait for the response.
+        :type deadline: float | None
+        :raises concurrent.futures.TimeoutError: If no response arrived within the deadline.
+        """
+        with self.priority(Priority.KEEPALIVE):
+            future = self._send_pipelined("whoami")
+        future.result(deadline)
+        # Measured from writing to receiving, the time waiting for the scheduler is not included
+        self.rtt.observe(future.resolved_at - future.sent_at)
 
-    def _send_keepalive(self):
+    def keepalive_loop(self, interval=5, deadline=30):
         """
-        Sends a keepalive message to the server to prevent timeout. Keepalive message is "\n\r".
+        Monitors the liveness of the connection until self.stop_recv is set. Every interval seconds
+        a probe is sent, unless a query was answered within the last interval anyway. If a probe or
+        any other query is not answered within deadline seconds, the connection is considered dead
+        and closed, which makes it reconnect (see auto_reconnect) and fails the waiting queries.
+        :param interval: Seconds between liveness checks.
+        :param deadline: Seconds without response after which the connection is considered dead.
+        :type interval: float
+        :type deadline: float
         """
-        self._send("whoami", wait_for_resp=True)
+        while not self.stop_recv.wait(interval):
+            if not self._connected.is_set():
+                continue
+            now = time.monotonic()
+            try:
+                oldest = self._pending[0]
+            except IndexError:
+                oldest = None
+            if oldest is not None and now - oldest.sent_at > deadline:
+                self._declare_dead(now - oldest.sent_at)
+            elif oldest is not None or now - self._last_response < interval:
+                # Responses are on their way or just arrived, the connection is alive
+                continue
+            else:
+                try:
+                    self._send_keepalive(deadline)
+                except concurrent.futures.TimeoutError:
+                    self._declare_dead(deadline)
+                except TS3ReconnectingException:
+                    self._logger.info("Skipped keepalive while reconnecting")
+                except (TS3Exception, TS3ConnectionClosedException):
+                    # E.g. flooding or written after the connection was closed, keep monitoring
+                    self._logger.warning("Keepalive failed", exc_info=True)
 
-    def keepalive_loop(self, interval=5):
+    def _declare_dead(self, waited):
         """
-        Sends keepalive messages every interval seconds and checks for new messages. Runs until
-        self.stop_recv is set.
-        :param interval: Seconds to wait between keepalive messages.
-        :type interval: int
+        Closes a connection that stopped answering.
+        :param waited: Seconds the oldest query waited for its response.
+        :type waited: float
         """
-        while not self.stop_recv.wait(interval):
-            self._send_keepalive()
-            time.sleep(interval)
+        self._logger.error("No response for %.1fs, closing the connection", waited)
+        try:
+            self._conn.close()
+        except Exception:
+            self._logger.exception("Error closing the dead connection")
 
     def quit(self):
         """
         Stops the connection from receiving and sends the quit signal.
         """
-        # Avoid unclean exit by interfering with response to pending query
-        if self._conn_lock.acquire():
-            self.stop_recv.set()
-        self._conn_lock.release()
-        self._send("quit")
+        # The server closes the connection, which must not look like a lost connection
+        self._auto_reconnect = False
+        # Pending queries are failed by the receiving thread once it stops
+        self._send("quit", wait_for_resp=False)
+        self.stop_recv.set()
 
-    def start_keepalive_loop(self, interval=5):
+    def start_keepalive_loop(self, interval=5, deadline=30):
         """
-        Starts a thread that sends keepalive messages every interval seconds.
-        :param interval: Seconds between to keepalive messages.
+        Starts a thread monitoring the liveness of the connection, see keepalive_loop.
+        :param interval: Seconds between liveness checks.
+        :param deadline: Seconds without response after which the connection is considered dead.
         :return:
         """
-        threading.Thread(target=self.keepalive_loop, args=(interval,)).start()
+        threading.Thread(target=self.keepalive_loop, args=(interval, deadline)).start()
         # keep alive, because otherwise the lol_bot crashed with
         # RuntimeError: can't register atexit after shutdown
         threading.Event().wait()
 
+    def iter_paged(self, command, *args, page_size=100, prefetch=False, **kwargs):
+        """
+        Iterates over the records of a command supporting the start= and duration= parameters
+        (e.g. clientdblist, banlist) one page at a time, so only one page (two with prefetch) is
+        held in memory. Every page is parsed when it arrives.
+        e.g. for client in ts3conn.iter_paged('clientdblist', page_size=200, prefetch=True): ...
+        :param command: Command to send.
+        :param args: Flags to send, without the leading "-".
+        :param page_size: Number of records to request per page. The server may cap it, the next
+                          page always starts after the last record received.
+        :param prefetch: Request the next page before the records of the current page are
+                         yielded, so processing them overlaps with waiting for the next page.
+        :param kwargs: Additional parameters to send.
+        :type command: str
+        :type page_size: int
+        :type prefetch: bool
+        :rtype: collections.abc.Iterator[dict[str, str]]
+        """
+        params = ['-{}'.format(x) for x in args] + ['{}={}'.format(x[0], x[1]) for x in kwargs.items()]
+
+        def request(start):
+            return self._send_pipelined(command, params + ["start=" + str(start), "duration=" + str(page_size)])
+
+        offset = 0
+        future = request(offset)
+        while future is not None:
+            try:
+                page = self._parse_records(command, self._result(future))
+            except TS3QueryException as ex:
+                if ex.type == TS3QueryExceptionType.DATABASE_EMPTY_RESULT:
+                    return
+                raise
+            if not page:
+                return
+            offset += len(page)
+            future = request(offset) if prefetch else None
+            yield from page
+            if not prefetch:
+                future = request(offset)
+
+    def clientdblist_iter(self, page_size=100, prefetch=True):
+        """
+        Iterates over all entries of the client database, see iter_paged.
+        :param page_size: Number of entries to request per page.
+        :param prefetch: Request the next page while the current one is processed.
+        :rtype: collections.abc.Iterator[dict[str, str]]
+        """
+        return self.iter_paged("clientdblist", page_size=page_size, prefetch=prefetch)
+
+    def banlist_iter(self, page_size=100, prefetch=True):
+        """
+        Iterates over all bans, see iter_paged.
+        :param page_size: Number of bans to request per page.
+        :param prefetch: Request the next page while the current one is processed.
+        :rtype: collections.abc.Iterator[dict[str, str]]
+        """
+        return self.iter_paged("banlist", page_size=page_size, prefetch=prefetch)
+
+    @property
+    def lazy(self):
+        """
+        Sends unknown commands like __getattr__, but returns the response as a lazily decoded
+        ResultSet, e.g. ts3conn.lazy.clientdblist(start=0).column('cldbid')
+        :rtype: _LazyCommands
+        """
+        return _LazyCommands(self)
+
     def __getattr__(self, item):
         """
         manages unknown functions by sending command to ts3server
@@ -685,12 +1413,114 @@ class TS3Connection:
                               ['-{}'.format(x) for x in args] + ['{}={}'.format(x[0], x[1]) for x in
                                                                  kwargs.items()])
             if resp:
-                parsed_resp = self._parse_resp_to_list_of_dicts(resp)
+                parsed_resp = self._parse_records(item, resp)
                 return parsed_resp[0] if len(parsed_resp) == 1 else parsed_resp
 
         return wrapper
 
 
+class BulkResult:
+    """
+    Outcome of a bulk operation like TS3Connection.clientmove_many.
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        # item -> TS3QueryException
+        self.failed = {}
+
+    def __bool__(self):
+        """
+        :return: True if no item failed.
+        """
+        return not self.failed
+
+    def __repr__(self):
+        return "BulkResult(succeeded=" + str(self.succeeded) + ", failed=" + str(self.failed) + ")"
+
+
+class SessionIdentity:
+    """
+    Identity of a query session, see TS3Connection.identity. Immutable, changes replace it.
+    """
+    __slots__ = ("client_id", "database_id", "server_id", "nickname", "channel_id")
+
+    def __init__(self, client_id, database_id, server_id, nickname, channel_id):
+        """
+        :type client_id: int
+        :type database_id: int
+        :type server_id: int
+        :type nickname: str
+        :type channel_id: int
+        """
+        self.client_id = client_id
+        self.database_id = database_id
+        self.server_id = server_id
+        self.nickname = nickname
+        self.channel_id = channel_id
+
+    @classmethod
+    def from_whoami(cls, who):
+        """
+        :param who: Response of whoami.
+        :type who: dict[str, str]
+        :rtype: SessionIdentity
+        """
+        return cls(int(who.get("client_id", 0)), int(who.get("client_database_id", 0)),
+                   int(who.get("virtualserver_id", 0)), who.get("client_nickname", ""),
+                   int(who.get("client_channel_id", 0)))
+
+    def replace(self, **changes):
+        """
+        :return: A copy with the given attributes changed.
+        :rtype: SessionIdentity
+        """
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return SessionIdentity(**values)
+
+    def __repr__(self):
+        return "SessionIdentity(" + ", ".join(name + "=" + repr(getattr(self, name))
+                                              for name in self.__slots__) + ")"
+
+
+class _LazyCommands:
+    """
+    Command proxy returned by TS3Connection.lazy.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, item):
+        def wrapper(*args, **kwargs):
+            return ResultSet(self._conn._send(item, ['-{}'.format(x) for x in args] +
+                                              ['{}={}'.format(x[0], x[1]) for x in kwargs.items()]))
+
+        return wrapper
+
+
+class _PendingQuery(Future):
+    """
+    Future of a query that was written to the connection but not acknowledged yet.
+    """
+
+    def __init__(self, query):
+        """
+        Creates a new pending query.
+        :param query: Query string, used for error messages.
+        :type query: str
+        """
+        super().__init__()
+        self.query = query
+        # Command name, e.g. clientlist, empty for keepalive lines
+        self.command = query.split(" ", 1)[0].strip()
+        self.chunks = []
+        # Set again when the query is actually written
+        self.sent_at = time.monotonic()
+        self.resolved_at = None
+
+
 class TS3QueryException(TS3Exception):
     """
     Query exception class to signalize failed queries and connection errors.
@@ -0,0 +1,129 @@
+"""Routing of queries over multiple query sessions"""
+import contextlib
+import threading
+
+
+class TS3ConnectionPool:
+    """
+    Spreads queries over several query sessions, used like a single TS3Connection.
+    The primary connection keeps the identity of the bot: it receives the events and sends
+    everything depending on who the query client is (whoami, identity, text messages, pokes, event
+    registration, clientupdate). All other queries go to the pooled sessions:
+    - read only queries (lists, infos, finds) go to the session with the fewest outstanding
+      queries, so lookups do not wait behind slow bursts of another module,
+    - state changing queries of a thread always use the same session, so they are executed in the
+      order the thread sent them.
+    """
+    # Attributes that have to use the primary connection
+    _PRIMARY = frozenset(("whoami", "clientupdate", "login", "use", "servernotifyregister",
+                          "servernotifyunregister", "sendtextmessage", "poketextmessage", "clientpoke",
+                          "clientpoke_many", "sendtextmessage_many", "keepalive_loop", "stop_recv",
+                          "on_reconnect", "connected", "set_hostmessage", "disable_hostmessage",
+                          "add_event_sink", "add_drop_sink", "start_recording", "stop_recording", "identity"))
+    _READ_ONLY_SUFFIXES = ("list", "info", "find", "_iter")
+    _READ_ONLY = frozenset(("lazy", "iter_paged", "channelfind_by_name",
+                            "find_servergroup_by_name", "servergroupsbyclientid", "version", "hostinfo"))
+
+    def __init__(self, primary, sessions):
+        """
+        Creates a new TS3ConnectionPool.
+        :param primary: Connection receiving the events.
+        :param sessions: Additional logged in connections with the same virtual server selected.
+        :type primary: TS3Connection
+        :type sessions: list[TS3Connection]
+        """
+        self.primary = primary
+        self.sessions = list(sessions) or [primary]
+        # Only the primary connection receives the events invalidating cached responses
+        for session in self.sessions:
+            session.query_cache = primary.query_cache
+        self._local = threading.local()
+
+    def session_for(self, name):
+        """
+        Chooses the connection for a method or query command.
+        :param name: Method of TS3Connection or query command.
+        :type name: str
+        :rtype: TS3Connection
+        """
+        if name in self._PRIMARY or name.startswith(("register_for_", "_")):
+            return self.primary
+        if self._is_read_only(name):
+            return min(self.sessions, key=lambda session: session.outstanding)
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = min(self.sessions, key=lambda session: session.outstanding)
+            self._local.session = session
+        return session
+
+    def _is_read_only(self, name):
+        """
+        :type name: str
+        :rtype: bool
+        """
+        return name in self._READ_ONLY or name.endswith(self._READ_ONLY_SUFFIXES) or name.startswith("clientget")
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """
+        Sends all queries of the current thread with the given priority on all sessions, see
+        TS3Connection.priority.
+        :type priority: ts3.QueryScheduler.Priority
+        """
+        with contextlib.ExitStack() as stack:
+            for conn in self._all():
+                stack.enter_context(conn.priority(priority))
+            yield
+
+    def start_keepalive_loop(self, interval=5, deadline=30):
+        """
+        Starts the liveness monitors of all sessions, blocks like TS3Connection.start_keepalive_loop.
+        :param interval: Seconds between liveness checks.
+        :param deadline: Seconds without response after which a session is considered dead.
+        """
+        for session in self.sessions:
+            if session is not self.primary:
+                threading.Thread(target=session.keepalive_loop, args=(interval, deadline)).start()
+        self.primary.start_keepalive_loop(interval, deadline)
+
+    def add_command_sink(self, sink):
+        """
+        Registers a function called with every command written by any session, see
+        TS3Connection.add_command_sink.
+        :type sink: (str) -> None
+        """
+        for conn in self._all():
+            conn.add_command_sink(sink)
+
+    def quit(self):
+        """
+        Quits all sessions.
+        """
+        for conn in self._all():
+            conn.quit()
+
+    @property
+    def outstanding(self):
+        """
+        Queries sent by callers and not answered yet on all sessions.
+        :rtype: int
+        """
+        return sum(conn.outstanding for conn in self._all())
+
+    @property
+    def connections(self):
+        """
+        The primary connection followed by the pooled sessions.
+        :rtype: list[TS3Connection]
+        """
+        return self._all()
+
+    def _all(self):
+        """
+        The primary connection followed by the pooled sessions.
+        :rtype: list[TS3Connection]
+        """
+        return [self.primary] + [session for session in self.sessions if session is not self.primary]
+
+    def __getattr__(self, item):
+        return getattr(self.session_for(item), item)
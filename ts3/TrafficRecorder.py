@@ -0,0 +1,132 @@
+"""Capture files of the raw query traffic, see TS3Connection.start_recording and ts3.replay"""
+import os
+import threading
+import time
+
+# Directions of recorded lines
+RECEIVED = b"<"
+SENT = b">"
+HEADER = b"# ts3 capture started="
+# Sent commands whose parameters are replaced by REDACTED, they contain credentials
+REDACTED_COMMANDS = (b"login",)
+REDACTED = b"<redacted>"
+
+
+class TrafficRecorder:
+    """
+    Appends raw query lines to a capture file, one line per record:
+    "<seconds since the recording started> <direction> <raw line>". Query lines are escaped and
+    cannot contain a line break, so records need no further encoding. The parameters of sent
+    login commands are not recorded. Once the file exceeds max_bytes it is rotated like logging's
+    RotatingFileHandler: capture.log becomes capture.log.1, capture.log.1 becomes capture.log.2
+    and so on, the oldest file is deleted.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backup_count=3):
+        """
+        Creates a new TrafficRecorder and opens its capture file.
+        :param path: Path of the capture file.
+        :param max_bytes: Size after which the file is rotated, 0 to never rotate.
+        :param backup_count: Number of rotated files to keep.
+        :type path: str
+        :type max_bytes: int
+        :type backup_count: int
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._started_wall = time.time()
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        if self._size == 0:
+            header = HEADER + b"%.6f\n" % self._started_wall
+            self._file.write(header)
+            self._size = len(header)
+
+    def record(self, direction, line):
+        """
+        Appends a line to the capture.
+        :param direction: RECEIVED or SENT.
+        :param line: Raw line, the line terminator is removed.
+        :type direction: bytes
+        :type line: bytes | memoryview
+        """
+        line = bytes(line).rstrip(b"\n\r")
+        if direction == SENT and line.split(b" ", 1)[0] in REDACTED_COMMANDS and b" " in line:
+            line = line.split(b" ", 1)[0] + b" " + REDACTED
+        record = b"%.6f %s %s\n" % (time.monotonic() - self._started, direction, line)
+        with self._lock:
+            if self._file is None:
+                return
+            if self.max_bytes and self._size + len(record) > self.max_bytes:
+                self._rotate()
+            self._file.write(record)
+            self._size += len(record)
+
+    def _rotate(self):
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = "%s.%d" % (self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, "%s.%d" % (self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """
+        Writes the remaining records and closes the capture file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def capture_files(path):
+    """
+    Capture file and its rotated files, oldest first.
+    :param path: Path of the current capture file.
+    :type path: str
+    :rtype: list[str]
+    """
+    files = []
+    i = 1
+    while os.path.exists("%s.%d" % (path, i)):
+        files.append("%s.%d" % (path, i))
+        i += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_capture(*paths):
+    """
+    Reads the records of capture files.
+    :param paths: Capture files in the order they were written, see capture_files.
+    :type paths: str
+    :return: (seconds since the recording started, direction, raw line) per record.
+    :rtype: collections.abc.Iterator[(float, bytes, bytes)]
+    """
+    for path in paths:
+        with open(path, "rb") as capture:
+            for record in capture:
+                if record.startswith(b"#"):
+                    continue
+                offset, direction, line = record.rstrip(b"\n").split(b" ", 2)
+                yield float(offset), direction, line
@@ -0,0 +1,82 @@
+"""Encoding and decoding of the ServerQuery wire format"""
+import re
+
+# Characters that have to be escaped and their escape sequences
+_ESCAPE_MAP = [("\\", r"\\"), ("/", r"\/"), (" ", r"\s"), ("|", r"\p"), ("\a", r"\a"),
+               ("\b", r"\b"), ("\f", r"\f"), ("\n", r"\n"), ("\r", r"\r"), ("\t", r"\t"), ("\v", r"\v")]
+# Translation table of str.translate indexed by code point, a list is looked up faster than a dict.
+# Code points beyond it raise IndexError and are kept.
+_ESCAPE_TABLE = [dict(_ESCAPE_MAP).get(chr(code), chr(code)) for code in range(128)]
+_UNESCAPE_MAP = {sequence: char for char, sequence in _ESCAPE_MAP}
+_ESCAPE_SEQUENCE = re.compile(r"\\[\\/spabfnrtv]")
+
+
+def escape(raw):
+    """
+    Escapes all characters that need escaping in one pass.
+    :type raw: str
+    :rtype: str
+    """
+    return raw.translate(_ESCAPE_TABLE)
+
+
+def _unescape_sequence(match):
+    return _UNESCAPE_MAP[match.group()]
+
+
+def unescape(raw):
+    """
+    Undo escaping in one pass, so sequences like "\\\\s" are decoded correctly. Values without a
+    backslash are returned without being copied.
+    :type raw: str
+    :rtype: str
+    """
+    if "\\" not in raw:
+        return raw
+    return _ESCAPE_SEQUENCE.sub(_unescape_sequence, raw)
+
+
+def _to_str(resp):
+    """
+    Decodes bytes like responses, strings are returned unchanged.
+    :type resp: bytes | bytearray | memoryview | str
+    :rtype: str
+    """
+    if isinstance(resp, str):
+        return resp
+    return str(resp, encoding="UTF-8")
+
+
+def parse_record(resp):
+    """
+    Parses the key=value pairs of a single record, separated by " ". Parts without a "=" (e.g.
+    the command name of an event or flags) are skipped.
+    :param resp: Record to parse.
+    :type resp: bytes | memoryview | str
+    :return: Dictionary containing the unescaped values.
+    :rtype: dict[str, str]
+    """
+    records = parse_records(resp)
+    return records[0] if records else {}
+
+
+def parse_records(resp):
+    """
+    Parses a response containing multiple records separated by "|". The response is decoded once,
+    empty records are skipped.
+    :param resp: Response to parse.
+    :type resp: bytes | memoryview | str
+    :return: List of dictionaries containing the unescaped values.
+    :rtype: list[dict[str, str]]
+    """
+    records = []
+    for raw_record in _to_str(resp).split("|"):
+        if not raw_record:
+            continue
+        record = {}
+        for part in raw_record.split(" "):
+            key, sep, value = part.partition("=")
+            if sep:
+                record[key] = unescape(value)
+        records.append(record)
+    return records
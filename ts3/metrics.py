@@ -0,0 +1,301 @@
+"""Measurements of the query connection and their export in the Prometheus text format"""
+import bisect
+import http.server
+import logging
+import math
+import threading
+
+# Upper bounds of the histogram buckets in seconds, from 1ms to 30s
+DEFAULT_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Waiting for a turn and parsing usually take well below a millisecond
+QUERY_BOUNDS = (0.0001, 0.00025, 0.0005) + DEFAULT_BOUNDS
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, like a Prometheus histogram. Observing is constant time
+    and memory does not grow with the number of observations. Percentiles are estimated by
+    interpolating inside the bucket they fall into.
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        """
+        Creates a new Histogram.
+        :param bounds: Sorted upper bounds of the buckets, values above the last bound are
+                       counted in an overflow bucket.
+        :type bounds: tuple[float]
+        """
+        self._lock = threading.Lock()
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._last = None
+
+    def observe(self, value):
+        """
+        Records an observation.
+        :type value: float
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+            self._last = value
+
+    @property
+    def count(self):
+        """
+        :rtype: int
+        """
+        return self._count
+
+    @property
+    def sum(self):
+        """
+        :rtype: float
+        """
+        return self._sum
+
+    @property
+    def last(self):
+        """
+        Last observation, None if there was none.
+        :rtype: float | None
+        """
+        return self._last
+
+    def percentile(self, percent):
+        """
+        Estimates a percentile of the observations.
+        :param percent: Percentile to estimate, between 0 and 100.
+        :type percent: float
+        :return: Estimated value, None if nothing was observed.
+        :rtype: float | None
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            rank = percent / 100 * self._count
+            seen = 0
+            for i, count in enumerate(self._counts):
+                if count and seen + count >= rank:
+                    lower = self.bounds[i - 1] if i > 0 else 0.0
+                    upper = self.bounds[i] if i < len(self.bounds) else self._max
+                    return min(lower + (upper - lower) * (rank - seen) / count, self._max)
+                seen += count
+            return self._max
+
+    def buckets(self):
+        """
+        Cumulative counts per upper bound, the last bound is infinity.
+        :rtype: list[(float, int)]
+        """
+        with self._lock:
+            result = []
+            total = 0
+            for bound, count in zip(self.bounds + (float("inf"),), self._counts):
+                total += count
+                result.append((bound, total))
+            return result
+
+    def summary(self):
+        """
+        Count and common percentiles, e.g. for logging.
+        :rtype: dict[str, float | None]
+        """
+        return {"count": self._count, "p50": self.percentile(50), "p90": self.percentile(90),
+                "p99": self.percentile(99), "max": self._max if self._count else None}
+
+
+class QueryMetrics:
+    """
+    Latencies and errors of the queries of a connection, per command name.
+    """
+
+    def __init__(self, bounds=QUERY_BOUNDS):
+        """
+        Creates new QueryMetrics.
+        :param bounds: Bucket bounds of the histograms.
+        :type bounds: tuple[float]
+        """
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        # Command -> Histogram of the seconds from sending until the query was written, spent
+        # waiting for the scheduler, the pacer and the connection lock
+        self.wait = {}
+        # Command -> Histogram of the seconds from writing the query until its response arrived
+        self.round_trip = {}
+        # Command -> Histogram of the seconds spent parsing responses into records, lazily decoded
+        # results (ResultSet) are not included
+        self.parse = {}
+        # (command, TS3QueryExceptionType name) -> number of failed queries
+        self.errors = {}
+
+    def _histogram(self, histograms, command):
+        histogram = histograms.get(command)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(command, Histogram(self._bounds))
+        return histogram
+
+    def observe_wait(self, command, seconds):
+        """
+        Records how long a query waited before it was written.
+        :type command: str
+        :type seconds: float
+        """
+        self._histogram(self.wait, command).observe(seconds)
+
+    def observe_response(self, command, round_trip, error=None):
+        """
+        Records a completed query.
+        :param command: Command name of the query.
+        :param round_trip: Seconds from writing the query until the response was complete.
+        :param error: Name of the TS3QueryExceptionType the query failed with, None if it succeeded.
+        :type command: str
+        :type round_trip: float
+        :type error: str | None
+        """
+        self._histogram(self.round_trip, command).observe(round_trip)
+        if error is not None:
+            with self._lock:
+                self.errors[(command, error)] = self.errors.get((command, error), 0) + 1
+
+    def observe_parse(self, command, seconds):
+        """
+        Records how long parsing the response of a query into records took.
+        :type command: str
+        :type seconds: float
+        """
+        self._histogram(self.parse, command).observe(seconds)
+
+    def families(self, **labels):
+        """
+        The metrics in the form expected by render.
+        :param labels: Labels added to all samples, e.g. the session.
+        :rtype: list[(str, str, str, list)]
+        """
+        def per_command(histograms):
+            return [(dict(labels, command=command), histogram) for command, histogram in sorted(histograms.items())]
+        return [
+            ("ts3_query_wait_seconds", "histogram", "Seconds queries waited before they were written.",
+             per_command(self.wait)),
+            ("ts3_query_round_trip_seconds", "histogram", "Seconds from writing a query until its response.",
+             per_command(self.round_trip)),
+            ("ts3_query_parse_seconds", "histogram", "Seconds spent parsing query responses into records.",
+             per_command(self.parse)),
+            ("ts3_query_errors_total", "counter", "Queries the server answered with an error.",
+             [(dict(labels, command=command, error=error), count)
+              for (command, error), count in sorted(self.errors.items())]),
+        ]
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                       .replace("\n", "\\n"))
+                          for key, value in labels.items()) + "}"
+
+
+def render(families):
+    """
+    Formats metrics in the Prometheus text format. Families with the same name are merged, so
+    every source can report its own samples.
+    :param families: (name, type, help, samples) per metric. Samples are (labels, value) pairs,
+                     the values of histograms are Histograms.
+    :type families: list[(str, str, str, list[(dict[str, str], float | Histogram)])]
+    :rtype: str
+    """
+    merged = {}
+    for name, metric_type, description, samples in families:
+        merged.setdefault(name, (metric_type, description, []))[2].extend(samples)
+    lines = []
+    for name, (metric_type, description, samples) in merged.items():
+        lines.append("# HELP %s %s" % (name, description))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for labels, value in samples:
+            if metric_type != "histogram":
+                lines.append(name + _format_labels(labels) + " " + _format_value(value))
+                continue
+            for bound, count in value.buckets():
+                lines.append(name + "_bucket" + _format_labels(dict(labels, le=_format_value(bound))) + " " +
+                             str(count))
+            lines.append(name + "_sum" + _format_labels(labels) + " " + _format_value(value.sum))
+            lines.append(name + "_count" + _format_labels(labels) + " " + str(value.count))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves metrics in the Prometheus text format on /metrics from a background thread.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, collect, host="127.0.0.1", port=9105):
+        """
+        Creates a new MetricsServer, see start.
+        :param collect: Function returning the metrics to serve, see render.
+        :param host: Address to listen on, only reachable from this machine by default.
+        :param port: Port to listen on, 0 to pick a free port.
+        :type collect: () -> list
+        :type host: str
+        :type port: int
+        """
+        self._logger = logging.getLogger(__name__)
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """
+        Starts serving.
+        :return: The port the server listens on.
+        :rtype: int
+        """
+        metrics_server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(metrics_server.collect()).encode()
+                except Exception:
+                    metrics_server._logger.exception("Error collecting metrics")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", MetricsServer.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                metrics_server._logger.debug(format, *args)
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self.port
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
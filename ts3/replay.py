@@ -0,0 +1,52 @@
+"""Replaying of captured query traffic without a server, see TrafficRecorder"""
+import time
+
+from ts3 import codec
+from ts3.Events import TS3Event
+from ts3.TrafficRecorder import RECEIVED, read_capture
+from ts3.TS3Connection import TS3Connection
+
+
+def replay(paths, sink=None, speed=1.0):
+    """
+    Feeds the received lines of capture files through the response parsing and the EventParser,
+    like the receiving thread of a TS3Connection does, and hands the events to a sink, e.g.
+    EventHandler.handle_event. Data lines of query responses are parsed into records, like the
+    query methods do. Sent lines are skipped, there is no server to answer them.
+    :param paths: Capture files in the order they were written, see capture_files.
+    :param sink: Function called with every event, on the calling thread.
+    :param speed: Replay speed relative to the recording, e.g. 10 for ten times as fast, None to
+                  replay as fast as possible.
+    :type paths: list[str]
+    :type sink: (TS3Event) -> None
+    :type speed: float | None
+    :return: Number of replayed lines, events and response records and the seconds the replay took.
+    :rtype: dict[str, float]
+    """
+    lines = 0
+    events = 0
+    records = 0
+    start = time.monotonic()
+    # Recording time of the first record of the current recording, a new recording starts at 0
+    base = None
+    last_offset = 0.0
+    for offset, direction, line in read_capture(*paths):
+        if direction != RECEIVED:
+            continue
+        if speed:
+            if base is None or offset < last_offset:
+                base = offset
+                start_of_recording = time.monotonic()
+            last_offset = offset
+            delay = start_of_recording + (offset - base) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        lines += 1
+        data = TS3Connection._parse_resp(line)
+        if isinstance(data, TS3Event):
+            events += 1
+            if sink is not None:
+                sink(data)
+        elif isinstance(data, bytes):
+            records += len(codec.parse_records(data))
+    return {"lines": lines, "events": events, "records": records, "seconds": time.monotonic() - start}
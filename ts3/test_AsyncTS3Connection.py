@@ -0,0 +1,55 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from ts3.AsyncTS3Connection import AsyncTS3Connection
+from ts3.Events import ClientMovedSelfEvent
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.TS3Connection import TS3QueryException
+from ts3.TS3QueryExceptionType import TS3QueryExceptionType
+from ts3.utilities import TS3ConnectionClosedException
+
+
+class TestAsyncTS3Connection(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeQueryServer(clients=600, channels=2)
+        self.port = await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_long_responses_and_events(self):
+        conn = await AsyncTS3Connection.connect(port=self.port)
+        # One line of well over the 64 KiB default limit of asyncio streams
+        clients, who, _ = await asyncio.gather(conn.clientlist(["uid", "away", "voice", "groups", "info"]),
+                                               conn.whoami(), conn.register_for_channel_events(0))
+        self.assertEqual(601, len(clients))
+        self.assertEqual("online", who["virtualserver_status"])
+        with self.assertRaises(TS3QueryException) as context:
+            await conn.clientmove(1, 1)
+        self.assertEqual(TS3QueryExceptionType.CHANNEL_ALREADY_IN, context.exception.type)
+        self.server.mass_move(2, [1, 2])
+        events = []
+        async for event in conn.events():
+            events.append(event)
+            if len(events) == 2:
+                break
+        self.assertEqual([(ClientMovedSelfEvent, 1), (ClientMovedSelfEvent, 2)],
+                         [(type(event), event.client_id) for event in events])
+        await conn.quit()
+
+    async def test_receive_errors_close_the_connection(self):
+        conn = await AsyncTS3Connection.connect(port=self.port, limit=4096)
+        # The whoami behind the too long clientlist line is pending when the connection is given up
+        results = await asyncio.gather(conn.clientlist(), conn.whoami(), return_exceptions=True)
+        self.assertEqual([TS3ConnectionClosedException] * 2, [type(result) for result in results])
+        with self.assertRaises(TS3ConnectionClosedException):
+            await conn.whoami()
+        self.assertEqual([], [event async for event in conn.events()])
+        await conn.quit()
+        conn = await AsyncTS3Connection.connect(port=self.port)
+        self.server.latency = 0.2
+        pending = asyncio.ensure_future(conn.whoami())
+        await asyncio.sleep(0.05)
+        self.server.drop_sessions()
+        with self.assertRaises(TS3ConnectionClosedException):
+            await pending
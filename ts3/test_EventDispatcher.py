@@ -0,0 +1,38 @@
+import threading
+from unittest import TestCase
+
+from ts3.EventDispatcher import EventDispatcher
+
+
+class TestEventDispatcher(TestCase):
+    def test_same_key_in_order(self):
+        dispatcher = EventDispatcher(workers=4)
+        handled = {"a": [], "b": []}
+        for i in range(200):
+            for key in handled:
+                dispatcher.submit(key, handled[key].append, i)
+        dispatcher.stop()
+        for thread in dispatcher._threads:
+            thread.join(5)
+        self.assertEqual(list(range(200)), handled["a"], "Events of one key should be handled in order")
+        self.assertEqual(list(range(200)), handled["b"], "Events of one key should be handled in order")
+        self.assertEqual(400, dispatcher.dispatched)
+        self.assertEqual(400, dispatcher.latency.count)
+
+    def test_drop_when_full(self):
+        dispatcher = EventDispatcher(workers=1, queue_size=1)
+        release = threading.Event()
+        dispatcher.submit(None, release.wait)
+        # Wait until the worker took the blocking item
+        while dispatcher.queue_depth:
+            pass
+        handled = []
+        self.assertTrue(dispatcher.submit(None, handled.append, "queued"))
+        self.assertFalse(dispatcher.submit(None, handled.append, "dropped"),
+                         "Items beyond the queue size should be dropped")
+        self.assertEqual(1, dispatcher.dropped)
+        release.set()
+        dispatcher.stop()
+        dispatcher._threads[0].join(5)
+        self.assertEqual(["queued"], handled, "Queued items should still be handled after the blocking one")
+        self.assertEqual(2, dispatcher.dispatched)
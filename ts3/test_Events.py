@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from ts3.Events import EventParser, ClientBannedEvent, ClientEnteredEvent, TS3Event
+from ts3.TS3Connection import TS3Connection
+
+
+class TestEventParser(TestCase):
+    def test_fields_read_from_data(self):
+        event = EventParser.parse_event({"clid": "5", "client_nickname": "User", "reasonid": "6", "bantime": "60"},
+                                        "notifyclientleftview")
+        self.assertIsInstance(event, ClientBannedEvent)
+        self.assertEqual(5, event.client_id)
+        self.assertEqual(60, event.ban_time)
+        self.assertEqual(-1, event.target_channel_id, "Missing ids should default to -1")
+        self.assertFalse(hasattr(event, "__dict__"), "Events should only keep their data")
+
+    def test_register(self):
+        self.addCleanup(EventParser._factories.pop, "notifyclientpoke")
+
+        @EventParser.register("notifyclientpoke")
+        class ClientPokeEvent(TS3Event):
+            __slots__ = ()
+
+        self.assertIsInstance(EventParser.parse_event({"msg": "hi"}, "notifyclientpoke"), ClientPokeEvent)
+        self.assertIsInstance(EventParser.parse_event({"clid": "5"}, "notifycliententerview"), ClientEnteredEvent)
+
+    def test_ids_checked_on_construction_and_converted_once(self):
+        with self.assertRaises(ValueError):
+            EventParser.parse_event({"clid": "5x", "ctid": "1"}, "notifyclientmoved")
+        with self.assertRaises(ValueError):
+            EventParser.parse_event({"invokerid": "", "msg": "hi"}, "notifytextmessage")
+        with self.assertLogs("ts3.TS3Connection", "ERROR"):
+            self.assertIsNone(TS3Connection._parse_resp(b"notifyclientmoved clid=5x ctid=1"),
+                              "Malformed events should be dropped while parsing")
+        event = EventParser.parse_event({"clid": "100000", "ctid": "2", "reasonid": "0"}, "notifyclientmoved")
+        self.assertIs(event.client_id, event.client_id, "The converted id should be kept")
+        self.assertEqual(2, event.target_channel_id)
+        self.assertEqual({"clid": 100000, "ctid": 2}, event._ints)
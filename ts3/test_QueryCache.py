@@ -0,0 +1,38 @@
+import time
+from unittest import TestCase
+
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.TS3Connection import TS3Connection
+
+
+class TestQueryCache(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=3, channels=3)
+        self.conn = TS3Connection(port=self.server.start_in_thread(),
+                                  cache_ttls={"servergrouplist": 60, "channellist": 60, "channelfind": 0.05})
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+
+    def test_hits_and_expiry(self):
+        self.assertEqual(self.conn.servergrouplist(), self.conn.servergrouplist())
+        self.assertEqual(1, self.server.command_counts["servergrouplist"])
+        self.conn.channelfind("Channel 2")
+        self.conn.channelfind("Channel 3")
+        self.conn.channelfind("Channel 2")
+        self.assertEqual(2, self.server.command_counts["channelfind"], "Arguments are part of the key")
+        time.sleep(0.06)
+        self.conn.channelfind("Channel 2")
+        self.assertEqual(3, self.server.command_counts["channelfind"], "Expired responses are fetched again")
+        self.assertEqual({"hits": 1, "misses": 1}, self.conn.query_cache.stats()["servergrouplist"])
+
+    def test_invalidation(self):
+        self.assertEqual("3", self.conn.channellist()[0]["total_clients"])
+        self.conn.clientmove(2, 1)
+        self.assertEqual("2", self.conn.channellist()[0]["total_clients"], "Own commands invalidate")
+        self.conn.register_for_channel_events(0)
+        self.conn.channellist()
+        self.server.mass_move(3, [2, 3])
+        deadline = time.monotonic() + 5
+        while self.conn.channellist()[0]["total_clients"] != "0":
+            self.assertLess(time.monotonic(), deadline, "Events should invalidate the channellist")
+            time.sleep(0.001)
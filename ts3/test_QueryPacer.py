@@ -0,0 +1,30 @@
+import time
+from unittest import TestCase
+
+from ts3.QueryPacer import QueryPacer
+
+
+class TestQueryPacer(TestCase):
+    def test_burst_then_paced(self):
+        pacer = QueryPacer(rate=20, burst=2)
+        self.assertEqual(0.0, pacer.acquire(), "Burst should not be delayed")
+        self.assertEqual(0.0, pacer.acquire(), "Burst should not be delayed")
+        self.assertGreater(pacer.acquire(), 0.0, "Query after the burst should be delayed")
+
+    def test_flood_backs_off_once_per_burst(self):
+        pacer = QueryPacer(rate=8, burst=4)
+        sent_at = time.monotonic()
+        self.assertTrue(pacer.on_flood(sent_at))
+        self.assertFalse(pacer.on_flood(sent_at), "Same burst should only back off once")
+        self.assertEqual(4, pacer.rate, "Rate should be halved")
+        self.assertAlmostEqual(7.2, pacer.limit, msg="Limit should be below the flooding rate")
+        for _ in range(100):
+            pacer.on_success()
+        self.assertAlmostEqual(7.2, pacer.rate, msg="Rate should recover up to the limit")
+
+    def test_unpaced_until_flood(self):
+        pacer = QueryPacer()
+        self.assertIsNone(pacer.rate)
+        pacer.acquire()
+        pacer.on_flood(time.monotonic())
+        self.assertIsNotNone(pacer.rate, "Flooding should start pacing")
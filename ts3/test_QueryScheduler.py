@@ -0,0 +1,49 @@
+import threading
+import time
+from unittest import TestCase
+
+from ts3.QueryScheduler import QueryScheduler, Priority
+
+
+class TestQueryScheduler(TestCase):
+    def test_priority_order(self):
+        scheduler = QueryScheduler(max_in_flight=1)
+        scheduler.acquire()
+        scheduler.dispatched()
+        order = []
+
+        def send(priority):
+            with scheduler.priority(priority):
+                scheduler.acquire()
+                order.append(priority)
+                scheduler.dispatched(written=False)
+
+        threads = [threading.Thread(target=send, args=(priority,))
+                   for priority in (Priority.KEEPALIVE, Priority.BACKGROUND, Priority.INTERACTIVE)]
+        for thread in threads:
+            thread.start()
+        while scheduler.queue_depth < len(threads):
+            time.sleep(0.01)
+        scheduler.completed()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([Priority.INTERACTIVE, Priority.BACKGROUND, Priority.KEEPALIVE], order,
+                         "Queries should be let through by priority")
+
+    def test_priority_context(self):
+        scheduler = QueryScheduler()
+        self.assertEqual(Priority.BACKGROUND, scheduler.current_priority)
+        with scheduler.priority(Priority.EVENT):
+            with scheduler.priority(Priority.INTERACTIVE):
+                self.assertEqual(Priority.INTERACTIVE, scheduler.current_priority)
+            self.assertEqual(Priority.EVENT, scheduler.current_priority)
+        self.assertEqual(Priority.BACKGROUND, scheduler.current_priority)
+
+    def test_response_before_dispatched(self):
+        scheduler = QueryScheduler(max_in_flight=1)
+        for _ in range(3):
+            scheduler.acquire()
+            # The receiving thread resolves the query before the writing thread ends its turn
+            scheduler.completed()
+            scheduler.dispatched()
+            self.assertEqual(0, scheduler.in_flight, "Early responses must not leak in flight slots")
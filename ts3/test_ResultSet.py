@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+from ts3.ResultSet import ResultSet
+
+RESP = b"clid=1 cid=5 client_nickname=Some\\sUser client_type=0|clid=2 cid=5 client_type=1|" \
+       b"clid=3 cid=7 xcid=5 client_nickname=Other client_type=0"
+
+
+class TestResultSet(TestCase):
+    def test_rows_like_dicts(self):
+        result = ResultSet(RESP)
+        self.assertEqual(3, len(result), "Wrong number of rows")
+        self.assertEqual("Some User", result[0]["client_nickname"], "Field not decoded correctly")
+        self.assertIsNone(result[1].get("client_nickname"), "Missing field not handled")
+        self.assertEqual({"clid": "2", "cid": "5", "client_type": "1"}, dict(result[1]),
+                         "Row not decoded correctly")
+
+    def test_column(self):
+        result = ResultSet(RESP)
+        self.assertEqual(["5", "5", "7"], result.column("cid"), "Column not decoded correctly")
+        self.assertEqual(["", "", "5"], result.column("xcid", ""), "Key matched inside another key")
+
+    def test_where(self):
+        result = ResultSet(RESP).where(client_type="0")
+        self.assertEqual(["1", "3"], result.column("clid"), "Filter not applied")
+        self.assertEqual(["1"], result.where(cid=5).column("clid"), "Filters not combined")
+        self.assertEqual(0, len(ResultSet(b"").where(cid=5)), "Empty response not handled")
@@ -0,0 +1,139 @@
+import threading
+import time
+from unittest import TestCase
+
+from ts3.Events import EventParser
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.ServerState import ServerState
+from ts3.TS3Connection import TS3Connection, TS3QueryException
+
+
+class TestServerState(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=5, channels=3)
+        self.conn = TS3Connection(port=self.server.start_in_thread())
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+        self.state = ServerState(self.conn, reconcile_interval=0)
+        self.conn.register_for_server_events()
+        self.conn.register_for_channel_events(0)
+        self.conn.add_event_sink(self.state.handle_event)
+        self.state.start()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "State was not updated")
+            time.sleep(0.001)
+
+    def test_events_update_snapshot(self):
+        before = self.state.snapshot
+        self.assertEqual(5, len(before.voice_clients()))
+        self.assertEqual("5", before.channel(1)["total_clients"])
+        clid = self.server.add_client("Newcomer", cid=2)
+        self.wait_for(lambda: self.state.snapshot.client(clid) is not None)
+        self.server.mass_move(3, [1, 2])
+        self.wait_for(lambda: len(self.state.snapshot.clients_in(3)) == 2)
+        self.server.remove_client(clid)
+        self.wait_for(lambda: self.state.snapshot.client(clid) is None)
+        after = self.state.snapshot
+        self.assertEqual(["Normal"], after.servergroup_names(1))
+        self.assertEqual("3", after.channel(1)["total_clients"])
+        self.assertEqual("0", after.channel(2)["total_clients"])
+        self.assertEqual(5, len(before.voice_clients()), "Published snapshots must not change")
+        self.assertEqual("1", before.client(1)["cid"])
+        self.assertEqual(0, self.state.reload(), "Events should leave no drift")
+
+    def test_channel_events_and_reload(self):
+        self.state.handle_event(EventParser.parse_event(
+            {"cid": "9", "cpid": "1", "channel_name": "Sub", "channel_order": "0", "invokerid": "1"},
+            "notifychannelcreated"))
+        self.state.handle_event(EventParser.parse_event({"cid": "9", "channel_name": "Renamed", "reasonid": "10"},
+                                                        "notifychanneledited"))
+        self.assertEqual("Renamed", self.state.snapshot.channel(9)["channel_name"])
+        self.assertEqual("1", self.state.snapshot.channel(9)["pid"])
+        self.assertEqual([self.state.snapshot.channel(9)], self.state.snapshot.find_channels("renam"))
+        self.state.handle_event(EventParser.parse_event({"cid": "9"}, "notifychanneldeleted"))
+        self.assertIsNone(self.state.snapshot.channel(9))
+        # Changes without notification are corrected by the next reload
+        self.server.update_client(1, cid=2)
+        self.assertEqual(1, self.state.reload())
+        self.assertEqual("2", self.state.snapshot.client(1)["cid"])
+
+    def test_current_loads_after_failed_start(self):
+        conn = self.conn
+
+        class FailingOnce:
+            failures = 1
+
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def clientlist(self, *args):
+                if FailingOnce.failures:
+                    FailingOnce.failures -= 1
+                    raise TS3QueryException(1281, "database empty result set", "clientlist")
+                return conn.clientlist(*args)
+        state = ServerState(FailingOnce(), reconcile_interval=0)
+        with self.assertRaises(TS3QueryException):
+            state.start()
+        self.assertIsNone(state.snapshot.loaded_at)
+        self.assertEqual(5, len(state.current().voice_clients()), "The state should be loaded on first use")
+        self.assertIsNotNone(state.snapshot.loaded_at)
+
+    def test_events_during_reload(self):
+        state = self.state
+        conn = self.conn
+        test = self
+
+        class EventsWhileFetching:
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def channellist(self, *args):
+                # The clientlist was fetched, these events are missing from it
+                events = [EventParser.parse_event({"clid": "2", "cfid": "1", "ctid": "0", "reasonid": "8"},
+                                                  "notifyclientleftview"),
+                          EventParser.parse_event({"clid": "3", "ctid": "2", "reasonid": "0"}, "notifyclientmoved")]
+                applying = threading.Thread(target=lambda: [state.handle_event(event) for event in events])
+                applying.start()
+                applying.join(5)
+                test.assertFalse(applying.is_alive(), "Events must not wait for the reload")
+                test.assertIsNone(state.snapshot.client(2), "Events should be applied to the current state")
+                return conn.channellist(*args)
+        state.ts3conn = EventsWhileFetching()
+        state.reload()
+        snapshot = state.snapshot
+        self.assertIsNone(snapshot.client(2), "Events received while fetching should be applied to the new state")
+        self.assertEqual("2", snapshot.client(3)["cid"])
+        self.assertEqual("3", snapshot.channel(1)["total_clients"])
+        self.assertEqual("1", snapshot.channel(2)["total_clients"])
+        self.assertIsNone(state._replay)
+
+
+class TestDroppedEvents(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=20, channels=3)
+        self.conn = TS3Connection(port=self.server.start_in_thread(), event_workers=1, event_queue_size=2)
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+        self.state = ServerState(self.conn, reconcile_interval=0)
+        self.conn.register_for_channel_events(0)
+        self.conn.add_event_sink(self.state.handle_event)
+        self.conn.add_drop_sink(self.state.on_dropped_event)
+        self.state.start()
+
+    def test_dropped_events_reload_the_state(self):
+        blocked = threading.Event()
+        self.addCleanup(blocked.set)
+        self.conn.add_event_sink(lambda event: blocked.wait(5))
+        reloads = self.state.reloads
+        self.server.mass_move(3, range(1, 21))
+        deadline = time.monotonic() + 5
+        while self.state.reloads == reloads or self.state.dirty:
+            self.assertLess(time.monotonic(), deadline, "Dropped events should reload the state")
+            time.sleep(0.001)
+        self.assertGreater(self.conn.event_dispatcher.dropped, 0)
+        # The events still in the queue are not handled yet, the reload has all moves
+        self.assertEqual(20, len(self.state.snapshot.clients_in(3)))
+        blocked.set()
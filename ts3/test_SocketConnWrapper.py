@@ -0,0 +1,57 @@
+import socket
+import threading
+import time
+from unittest import TestCase
+
+from ts3.SocketConnWrapper import SocketConnWrapper
+
+
+class TestSocketConnWrapper(TestCase):
+    def setUp(self):
+        listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(listener.close)
+        self.conn = SocketConnWrapper("127.0.0.1", listener.getsockname()[1], chunk_size=8, poll_interval=0.1)
+        self.addCleanup(self.conn.close)
+        self.peer, _ = listener.accept()
+        self.addCleanup(self.peer.close)
+
+    def send_later(self, *parts):
+        """
+        Sends every part separately, so each one arrives in its own recv.
+        """
+        def send():
+            for part in parts:
+                time.sleep(0.05)
+                self.peer.sendall(part)
+        thread = threading.Thread(target=send)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_delimiter_split_between_chunks(self):
+        self.send_later(b"first\n", b"\rsecond\n\r", b"thi", b"rd\n\r")
+        self.assertEqual(b"first", bytes(self.conn.read_line()))
+        self.assertEqual(b"second", bytes(self.conn.read_line()))
+        self.assertEqual(b"third", bytes(self.conn.read_line()))
+
+    def test_compaction_and_growth(self):
+        lines = [b"line %03d" % i for i in range(200)]
+        self.peer.sendall(b"".join(line + b"\n\r" for line in lines))
+        self.assertEqual(lines, [bytes(self.conn.read_line()) for _ in lines])
+        size = len(self.conn._buffer)
+        self.assertLess(size, 1000, "Consumed lines should be compacted away instead of growing the buffer")
+        long_line = bytes(range(32, 127)) * 20
+        self.send_later(long_line[:700], long_line[700:] + b"\n\rshort\n\r")
+        self.assertEqual(long_line, bytes(self.conn.read_line()))
+        self.assertGreaterEqual(len(self.conn._buffer), len(long_line))
+        self.assertEqual(b"short", bytes(self.conn.read_line()))
+
+    def test_lines_are_valid_until_the_next_read(self):
+        self.peer.sendall(b"one\n\rtwo\n\r")
+        first = self.conn.read_line()
+        kept = bytes(first)
+        self.assertEqual(b"one", first.tobytes())
+        second = self.conn.read_line()
+        with self.assertRaises(ValueError, msg="An old line must not silently show newer data"):
+            first.tobytes()
+        self.assertEqual(b"one", kept)
+        self.assertEqual(b"two", second.tobytes())
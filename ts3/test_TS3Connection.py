@@ -1,13 +1,21 @@
 import logging
+import os
+import tempfile
+import threading
+import time
 from unittest import TestCase
 
-from Events import ClientLeftEvent, ReasonID, ClientKickedEvent, ClientBannedEvent
-from TS3Connection import TS3Connection
+from ts3.Events import ClientLeftEvent, ReasonID, ClientKickedEvent, ClientBannedEvent, ClientMovedEvent
+from ts3.FakeQueryServer import FakeQueryServer
+from ts3.TS3Connection import TS3Connection, TS3QueryException
+from ts3.TS3QueryExceptionType import TS3QueryExceptionType
+from ts3.TrafficRecorder import SENT, read_capture
+from ts3.utilities import TS3ConnectionClosedException, TS3ReconnectingException
 
 
 class MockTS3Connection(TS3Connection):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, port):
+        super().__init__(port=port)
         self._logger = logging.Logger(__name__, logging.DEBUG)
         self._logger.addHandler(logging.StreamHandler())
 
@@ -15,7 +23,44 @@ class MockTS3Connection(TS3Connection):
 # noinspection DuplicatedCode
 class TestTS3Connection(TestCase):
     def setUp(self) -> None:
-        self.conn = MockTS3Connection()
+        self.server = FakeQueryServer(clients=3, channels=2)
+        self.conn = MockTS3Connection(self.server.start_in_thread())
+
+    def tearDown(self) -> None:
+        self.conn.quit()
+        self.server.stop_in_thread()
+
+    def test_clientmove_notifies(self):
+        moved = threading.Event()
+        events = []
+        self.conn.register_for_channel_events(0)
+        def sink(event):
+            events.append(event)
+            moved.set()
+        self.conn.add_event_sink(sink)
+        self.conn.clientmove(2, 1)
+        self.assertTrue(moved.wait(5), "Move should be notified")
+        self.assertIs(ClientMovedEvent, type(events[0]))
+        self.assertEqual(2, events[0].target_channel_id)
+        self.assertEqual(4, len(self.conn.clientlist()), "Clientlist should include the query client")
+
+    def test_identity_is_kept_current(self):
+        identity = self.conn.identity
+        self.assertIs(identity, self.conn.identity)
+        self.assertEqual(1, self.server.command_counts["whoami"])
+        self.assertEqual(1, identity.channel_id)
+        self.conn.clientupdate(["client_nickname=Bot"])
+        moved = threading.Event()
+        self.conn.register_for_channel_events(0)
+        self.conn.add_event_sink(lambda event: moved.set())
+        self.conn.clientmove(2, identity.client_id)
+        self.assertTrue(moved.wait(5), "Move should be notified")
+        self.assertEqual(("Bot", 2, identity.client_id),
+                         (self.conn.identity.nickname, self.conn.identity.channel_id, self.conn.identity.client_id))
+        self.assertEqual(1, self.server.command_counts["whoami"])
+        self.conn.use(1)
+        self.assertEqual(1, self.conn.identity.server_id)
+        self.assertEqual(2, self.server.command_counts["whoami"])
 
     def test_parse_resp_left_event(self):
         resp = b"notifyclientleftview cfid=1 ctid=0 reasonid=8 " \
@@ -54,3 +99,221 @@ class TestTS3Connection(TestCase):
         result = self.conn._parse_resp(resp)
         self.assertIs(ClientLeftEvent, type(result), "Empty client left not parsed correctly")
         self.assertEqual(-1, result.client_id, "Empty ClientLeft not parsed correctly")
+
+
+class TestPipelining(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=20, channels=2)
+        self.conn = TS3Connection(port=self.server.start_in_thread(), auto_reconnect=False)
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+
+    def test_responses_between_notifications(self):
+        events = []
+        self.conn.register_for_channel_events(0)
+        self.conn.add_event_sink(events.append)
+        futures = [self.conn._send_pipelined("clientlist"),
+                   self.conn._send_pipelined("clientmove", ["cid=2", "clid=1"]),
+                   self.conn._send_pipelined("whoami"),
+                   self.conn._send_pipelined("clientmove", ["cid=2", "clid=1"]),
+                   self.conn._send_pipelined("channellist")]
+        # Notifications of another client's moves arrive between the responses
+        mover = threading.Thread(target=self.server.mass_move, args=(2, range(2, 21)))
+        mover.start()
+        whoamis = [self.conn._send_pipelined("whoami") for _ in range(50)]
+        mover.join()
+        self.assertEqual(21, len(TS3Connection._parse_resp_to_list_of_dicts(futures[0].result(5))))
+        self.assertEqual(b"", futures[1].result(5))
+        self.assertIn("virtualserver_status", TS3Connection._parse_resp_to_dict(futures[2].result(5)))
+        with self.assertRaises(TS3QueryException) as context:
+            futures[3].result(5)
+        self.assertEqual(TS3QueryExceptionType.CHANNEL_ALREADY_IN, context.exception.type)
+        self.assertIn("channel_name", TS3Connection._parse_resp_to_list_of_dicts(futures[4].result(5))[0])
+        for future in whoamis:
+            self.assertIn("virtualserver_status", TS3Connection._parse_resp_to_dict(future.result(5)))
+        self.assertEqual(0, self.conn.outstanding)
+
+    def test_pending_queries_fail_when_closed(self):
+        self.server.latency = 0.5
+        pending = [self.conn._send_pipelined("whoami") for _ in range(3)]
+        self.server.drop_sessions()
+        for future in pending:
+            self.assertIsInstance(future.exception(5), TS3ConnectionClosedException)
+        self.assertTrue(self.conn.stop_recv.wait(5))
+        self.assertIsInstance(self.conn._send_pipelined("whoami").exception(5), TS3ConnectionClosedException)
+
+    def test_parse_metrics_time_the_record_parsing(self):
+        self.assertEqual(21, len(self.conn.clientlist()))
+        self.conn.clientlist(lazy=True)
+        self.conn.whoami()
+        parse = self.conn.metrics.parse
+        self.assertEqual(1, parse["clientlist"].count, "Lazy results are decoded later and not timed")
+        self.assertEqual(1, parse["whoami"].count)
+        self.assertGreater(parse["clientlist"].sum, 0.0)
+        self.assertEqual(2, self.conn.metrics.round_trip["clientlist"].count)
+
+
+class TestPaging(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=250, channels=1)
+        self.conn = TS3Connection(port=self.server.start_in_thread())
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+
+    def test_pages_until_empty_result(self):
+        records = list(self.conn.iter_paged("clientdblist", page_size=100))
+        self.assertEqual(list(range(1001, 1251)), [int(record["cldbid"]) for record in records])
+        self.assertEqual(4, self.server.command_counts["clientdblist"],
+                         "Three pages, then the empty result set ends the iteration")
+        # The server answers at most PAGE_LIMIT records, the next page starts after the last one
+        records = list(self.conn.iter_paged("clientdblist", page_size=300))
+        self.assertEqual(250, len({record["cldbid"] for record in records}))
+        self.assertEqual(4 + 3, self.server.command_counts["clientdblist"])
+
+    def test_prefetch(self):
+        for prefetch, requested in ((False, 1), (True, 2)):
+            before = self.server.command_counts["clientdblist"]
+            pages = self.conn.iter_paged("clientdblist", page_size=100, prefetch=prefetch)
+            next(pages)
+            # Another query behind the prefetched page makes sure it was answered
+            self.conn.whoami()
+            self.assertEqual(requested, self.server.command_counts["clientdblist"] - before)
+            self.assertEqual(249, len(list(pages)))
+
+
+class TestBulkCommands(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=9, channels=2)
+        self.conn = TS3Connection(port=self.server.start_in_thread())
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+
+    def test_split_at_query_length(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "capture.log")
+        base = len(TS3Connection._build_query("clientmove", ["cid=2"]))
+        # Every item adds " clid=N" or "|clid=N"
+        self.conn.MAX_QUERY_LENGTH = base + 3 * 7
+        self.conn.start_recording(path)
+        self.assertEqual(list(range(1, 10)), self.conn.clientmove_many(2, range(1, 10)).succeeded)
+        self.assertEqual(3, self.server.command_counts["clientmove"], "Exactly three items fit into a query")
+        self.conn.MAX_QUERY_LENGTH -= 1
+        self.assertEqual(list(range(1, 10)), self.conn.clientmove_many(1, range(1, 10)).succeeded)
+        self.assertEqual(3 + 5, self.server.command_counts["clientmove"])
+        self.conn.stop_recording()
+        sent = [line for _, direction, line in read_capture(path) if direction == SENT]
+        self.assertEqual(8, len(sent))
+        self.assertEqual(self.conn.MAX_QUERY_LENGTH + 1, max(len(line) + 2 for line in sent[:3]))
+        self.assertTrue(all(len(line) + 2 <= self.conn.MAX_QUERY_LENGTH for line in sent[3:]))
+        self.assertTrue(all(client["cid"] == 1 for client in self.server.clients.values()))
+
+    def test_failed_chunk_is_retried_per_item(self):
+        self.conn.clientmove(2, 4)
+        result = self.conn.clientmove_many(2, [1, 999, 3, 4])
+        self.assertFalse(result)
+        self.assertEqual([999], list(result.failed))
+        self.assertEqual(TS3QueryExceptionType.CLIENT_INVALID_ID, result.failed[999].type)
+        # Client 4 was already in the channel, which clientmove_many ignores
+        self.assertEqual([1, 3, 4], sorted(result.succeeded))
+        self.assertEqual(1 + 1 + 4, self.server.command_counts["clientmove"])
+        self.assertEqual([2, 2, 2], [self.server.clients[clid]["cid"] for clid in (1, 3, 4)])
+        self.assertTrue(self.conn.clientmove_many(2, [1, 3]), "Ignored errors are no failures")
+
+
+class FastReconnectingConnection(TS3Connection):
+    RECONNECT_DELAY = 0.05
+
+
+class TestReconnect(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=3, channels=2, username="bot", password="secret")
+        port = self.server.start_in_thread()
+        self.server_running = True
+        # Cleanups run in reverse order, quit before the server is gone
+        self.addCleanup(self.stop_server)
+        self.conn = FastReconnectingConnection(port=port, username="bot", password="secret", reconnect_hold=5)
+        self.addCleanup(self.conn.quit)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.capture = os.path.join(directory.name, "capture.log")
+
+    def stop_server(self):
+        if self.server_running:
+            self.server_running = False
+            self.server.stop_in_thread()
+
+    def test_session_is_restored(self):
+        self.conn.use(1)
+        self.conn.clientupdate(["client_nickname=Bot"])
+        self.conn.register_for_channel_events(0)
+        events = []
+        self.conn.add_event_sink(events.append)
+        old_identity = self.conn.identity
+        self.conn.start_recording(self.capture)
+        self.server.latency = 0.3
+        in_flight = self.conn._send_pipelined("clientlist")
+        time.sleep(0.05)
+        self.server.drop_sessions()
+        self.server.latency = 0
+        self.assertIsInstance(in_flight.exception(5), TS3ReconnectingException,
+                              "Queries written to the lost connection fail")
+        # Held until the session is restored
+        clients = self.conn.clientlist()
+        self.assertTrue(self.conn.connected)
+        self.assertNotEqual(old_identity.client_id, self.conn.identity.client_id)
+        self.assertIn(str(self.conn.identity.client_id), [client["clid"] for client in clients])
+        self.assertEqual("Bot", self.server.clients[self.conn.identity.client_id]["client_nickname"])
+        self.server.mass_move(2, [1])
+        deadline = time.monotonic() + 5
+        while not events:
+            self.assertLess(time.monotonic(), deadline, "Events should arrive after reconnecting")
+            time.sleep(0.001)
+        self.assertEqual(1, events[0].client_id)
+        self.conn.stop_recording()
+        sent = [line.split(b" ", 1)[0] for _, direction, line in read_capture(self.capture) if direction == SENT]
+        self.assertEqual([b"clientlist", b"login", b"use", b"clientupdate", b"servernotifyregister", b"whoami",
+                          b"clientlist"], sent[:7])
+        with open(self.capture, "rb") as capture:
+            self.assertNotIn(b"secret", capture.read(), "The replayed login should be redacted")
+
+    def test_held_queries_fail_after_hold(self):
+        self.conn._reconnect_hold = 0.2
+        # Nothing to reconnect to
+        self.stop_server()
+        start = time.monotonic()
+        with self.assertRaises(TS3ReconnectingException):
+            self.conn.whoami()
+        self.assertFalse(self.conn.connected)
+        self.assertLess(time.monotonic() - start, 2)
+
+
+
+class TestKeepalive(TestCase):
+    def setUp(self):
+        self.server = FakeQueryServer(clients=1, channels=1, flood_commands=3, flood_time=60)
+        self.conn = TS3Connection(port=self.server.start_in_thread(), auto_reconnect=False)
+        self.addCleanup(self.server.stop_in_thread)
+        self.addCleanup(self.conn.quit)
+
+    def test_failed_keepalives_keep_the_loop_running(self):
+        monitor = threading.Thread(target=self.conn.keepalive_loop, args=(0.02, 5), daemon=True)
+        with self.assertLogs(self.conn._logger, "WARNING") as logs:
+            monitor.start()
+            deadline = time.monotonic() + 5
+            while sum("Keepalive failed" in line for line in logs.output) < 3:
+                self.assertLess(time.monotonic(), deadline, "Flooded keepalives should be retried")
+                time.sleep(0.01)
+        self.assertIn("client is flooding", "\n".join(logs.output))
+        original = self.conn._send_keepalive
+        self.conn._send_keepalive = lambda deadline: (_ for _ in ()).throw(TS3ConnectionClosedException("closed"))
+        with self.assertLogs(self.conn._logger, "WARNING") as logs:
+            deadline = time.monotonic() + 5
+            while not any("closed" in line for line in logs.output):
+                self.assertLess(time.monotonic(), deadline, "Keepalives on a closed socket should be logged")
+                time.sleep(0.01)
+        self.conn._send_keepalive = original
+        self.assertTrue(monitor.is_alive())
+        self.conn.stop_recv.set()
+        monitor.join(1)
+        self.assertFalse(monitor.is_alive(), "The loop should end with stop_recv")
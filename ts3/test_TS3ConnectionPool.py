@@ -0,0 +1,35 @@
+import threading
+from unittest import TestCase
+
+from ts3.TS3ConnectionPool import TS3ConnectionPool
+
+
+class Session:
+    def __init__(self, outstanding):
+        self.outstanding = outstanding
+        self.query_cache = object()
+
+
+class TestTS3ConnectionPool(TestCase):
+    def setUp(self):
+        self.primary = Session(0)
+        self.sessions = [Session(3), Session(1)]
+        self.pool = TS3ConnectionPool(self.primary, self.sessions)
+
+    def test_routing(self):
+        self.assertIs(self.primary, self.pool.session_for("whoami"), "Identity bound commands use the primary")
+        self.assertIs(self.primary, self.pool.session_for("register_for_private_messages"))
+        self.assertIs(self.sessions[1], self.pool.session_for("clientinfo"), "Lookups use the least busy session")
+        self.sessions[1].outstanding = 5
+        self.assertIs(self.sessions[0], self.pool.session_for("channellist"))
+
+    def test_affinity(self):
+        first = self.pool.session_for("channeledit")
+        self.assertIs(self.sessions[1], first)
+        self.sessions[1].outstanding = 10
+        self.assertIs(first, self.pool.session_for("clientmove"), "State changes of a thread use one session")
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.pool.session_for("channeledit")))
+        thread.start()
+        thread.join()
+        self.assertIsNot(first, other[0], "Other threads pick their own session")
@@ -0,0 +1,48 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from ts3.TrafficRecorder import TrafficRecorder, RECEIVED, SENT, capture_files, read_capture
+from ts3.replay import replay
+
+
+class TestTrafficRecorder(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "capture.log")
+
+    def test_rotation(self):
+        recorder = TrafficRecorder(self.path, max_bytes=200, backup_count=2)
+        for i in range(20):
+            recorder.record(SENT, b"clientinfo clid=%d\n\r" % i)
+        recorder.close()
+        files = capture_files(self.path)
+        self.assertEqual([self.path + ".2", self.path + ".1", self.path], files)
+        lines = [line for _, _, line in read_capture(*files)]
+        self.assertEqual(b"clientinfo clid=19", lines[-1], "Line terminators should be removed")
+        self.assertEqual(list(range(20 - len(lines), 20)), [int(line.split(b"=")[1]) for line in lines],
+                         "Rotated files should be read oldest first")
+
+    def test_login_is_redacted(self):
+        recorder = TrafficRecorder(self.path)
+        recorder.record(SENT, b"login serveradmin secret\n\r")
+        recorder.record(SENT, b"login\n\r")
+        recorder.record(SENT, b"clientupdate client_nickname=login\\ssecret\n\r")
+        recorder.close()
+        self.assertEqual([b"login <redacted>", b"login", b"clientupdate client_nickname=login\\ssecret"],
+                         [line for _, _, line in read_capture(self.path)])
+
+    def test_replay(self):
+        recorder = TrafficRecorder(self.path)
+        recorder.record(SENT, b"clientlist\n\r")
+        recorder.record(RECEIVED, b"clid=1 cid=1 client_nickname=User|clid=2 cid=1 client_nickname=Other")
+        recorder.record(RECEIVED, b"error id=0 msg=ok")
+        recorder.record(RECEIVED, b"notifycliententerview cfid=0 ctid=1 reasonid=0 clid=5 client_nickname=User")
+        recorder.close()
+        events = []
+        stats = replay(capture_files(self.path), sink=events.append, speed=None)
+        self.assertEqual(3, stats["lines"], "Sent lines should be skipped")
+        self.assertEqual(1, stats["events"])
+        self.assertEqual(2, stats["records"], "Responses should be parsed into records")
+        self.assertEqual(5, events[0].client_id)
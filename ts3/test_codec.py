@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+from ts3 import codec
+
+
+class TestCodec(TestCase):
+    def test_escape_roundtrip(self):
+        raw = "a\\b/c d|e\af\bg\fh\ni\rj\tk\vl"
+        escaped = codec.escape(raw)
+        self.assertEqual(r"a\\b\/c\sd\pe\af\bg\fh\ni\rj\tk\vl", escaped, "Escaping failed")
+        self.assertEqual(raw, codec.unescape(escaped), "Unescaping failed")
+
+    def test_escape_nothing_to_do(self):
+        self.assertEqual("cid=5", codec.escape("cid=5"), "Plain value changed")
+        self.assertEqual("client_nickname", codec.unescape("client_nickname"), "Plain value changed")
+
+    def test_unescape_escaped_backslash(self):
+        self.assertEqual("\\s", codec.unescape(r"\\s"), "Escaped backslash not decoded first")
+
+    def test_non_ascii_and_unknown_sequences(self):
+        self.assertEqual(r"Grüße\s☃", codec.escape("Grüße ☃"), "Characters beyond ASCII should be kept")
+        self.assertEqual("ü ☃", codec.unescape(r"ü\s☃"))
+        self.assertEqual(r"\x", codec.unescape(r"\x"), "Unknown sequences should be kept")
+
+    def test_parse_record(self):
+        result = codec.parse_record(b"notifyclientleftview cfid=1 reasonmsg=Left\\sserver. clid=1 -flag")
+        self.assertEqual({"cfid": "1", "reasonmsg": "Left server.", "clid": "1"}, result,
+                         "Record not parsed correctly")
+
+    def test_parse_records(self):
+        result = codec.parse_records(memoryview(b"clid=1 client_nickname=A\\pB|clid=2 client_nickname=|"))
+        self.assertEqual([{"clid": "1", "client_nickname": "A|B"}, {"clid": "2", "client_nickname": ""}],
+                         result, "Records not parsed correctly")
@@ -0,0 +1,50 @@
+import urllib.request
+from unittest import TestCase
+
+from ts3.metrics import Histogram, QueryMetrics, MetricsServer, render
+
+
+class TestHistogram(TestCase):
+    def test_percentiles(self):
+        histogram = Histogram(bounds=(1, 2, 3, 4))
+        self.assertIsNone(histogram.percentile(50))
+        for value in (0.5, 1.5, 2.5, 3.5):
+            histogram.observe(value)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.0, histogram.percentile(50))
+        self.assertLessEqual(histogram.percentile(100), 3.5, "Percentiles must not exceed the maximum")
+
+    def test_buckets_cumulative(self):
+        histogram = Histogram(bounds=(1, 2))
+        for value in (0.5, 1.5, 1.7, 5):
+            histogram.observe(value)
+        self.assertEqual([(1, 1), (2, 3), (float("inf"), 4)], histogram.buckets())
+
+
+class TestQueryMetrics(TestCase):
+    def test_render(self):
+        metrics = QueryMetrics(bounds=(0.01, 0.1))
+        metrics.observe_wait("clientlist", 0.005)
+        metrics.observe_response("clientlist", 0.05)
+        metrics.observe_parse("clientlist", 0.001)
+        metrics.observe_response("clientmove", 0.2, "CHANNEL_ALREADY_IN")
+        text = render(metrics.families(session="0"))
+        lines = text.splitlines()
+        self.assertEqual(1, lines.count("# TYPE ts3_query_round_trip_seconds histogram"))
+        self.assertIn('ts3_query_round_trip_seconds_bucket{session="0",command="clientlist",le="0.1"} 1', lines)
+        self.assertIn('ts3_query_round_trip_seconds_bucket{session="0",command="clientmove",le="+Inf"} 1', lines)
+        self.assertIn('ts3_query_round_trip_seconds_count{session="0",command="clientmove"} 1', lines)
+        self.assertIn('ts3_query_errors_total{session="0",command="clientmove",error="CHANNEL_ALREADY_IN"} 1',
+                      lines)
+
+    def test_server(self):
+        metrics = QueryMetrics()
+        metrics.observe_response("whoami", 0.001)
+        metrics.observe_parse("whoami", 0.0)
+        server = MetricsServer(lambda: metrics.families(session="1"), port=0)
+        port = server.start()
+        self.addCleanup(server.stop)
+        with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % port, timeout=5) as response:
+            self.assertEqual(MetricsServer.CONTENT_TYPE, response.headers["Content-Type"])
+            self.assertIn('ts3_query_parse_seconds_count{session="1",command="whoami"} 1',
+                          response.read().decode())
@@ -1,4 +1,5 @@
 """Utility variables and functions for the TS3 API"""
+from ts3 import codec
 
 # FROM OLD API
 # Don't change the order in this map, otherwise it might break!
@@ -10,18 +11,14 @@ def escape(raw):
     """
     Escapes characters that need escaping according to _ESCAPE_MAP
     """
-    for char, replacement in _ESCAPE_MAP:
-        raw = raw.replace(char, replacement)
-    return raw
+    return codec.escape(raw)
 
 
 def unescape(raw):
     """
     Undo escaping of characters according to _ESCAPE_MAP
     """
-    for replacement, char in reversed(_ESCAPE_MAP):
-        raw = raw.replace(char, replacement)
-    return raw
+    return codec.unescape(raw)
 
 
 class TS3Exception(Exception):
@@ -34,3 +31,11 @@ class TS3ConnectionClosedException(Exception):
     """
     Exception that signalizes a closed connection.
     """
+
+
+class TS3ReconnectingException(TS3ConnectionClosedException, TS3Exception):
+    """
+    Exception that signalizes a query failed because the connection was lost and is being
+    re-established. Unlike a closed connection this is temporary, it is a TS3Exception too, so
+    code handling failed queries handles it as well.
+    """